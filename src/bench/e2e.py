@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+"""End-to-end benchmark of SourceServerIRCBot against local stand-ins.
+
+Starts a fake IRC server, fake RCON servers and a UDP log generator, runs
+the bot against them and measures command round trips (channel line to
+first reply), chat relay (datagram to PRIVMSG), the highest sustained log
+ingest rate and how long the bot takes to rejoin after losing IRC.
+Results are written as JSON so runs of different versions can be compared.
+
+Run from the src directory: python -m bench.e2e --help
+"""
+
+import json
+import optparse
+import os
+import platform
+import Queue
+import subprocess
+import threading
+import time
+
+import lameirc.bot as bot
+
+from bench import fakes, report
+
+CHANNEL = '#bench'
+
+class Replies:
+    """Collects what the bot sends to the fake IRC server."""
+    def __init__(self, server):
+        self.queue = Queue.Queue()
+        server.listeners.append(self._received)
+    
+    def _received(self, when, command, target, text):
+        self.queue.put((when, command, target, text))
+    
+    def clear(self):
+        while True:
+            try:
+                self.queue.get_nowait()
+            except Queue.Empty:
+                return
+    
+    def wait(self, predicate, timeout):
+        end = time.time() + timeout
+        while True:
+            try:
+                when, command, target, text = self.queue.get(timeout = max(end - time.time(), 0.001))
+            except Queue.Empty:
+                return None
+            if predicate(command, text):
+                return when
+
+def start_bot(options, irc, servers, udpport):
+    directory = report.tempdir()
+    rcons = dict()
+    acl = dict()
+    for i, server in enumerate(servers):
+        identifier = 'srv%d' % (i)
+        rcons[identifier] = {'host': '127.0.0.1', 'port': server.port, 'pass': server.state.password, 'query': False}
+        acl[identifier] = {'status': [0], 'players': [0]}
+    extra = {'base': {'udplogport': udpport},
+             'irc': {'port': irc.port, 'chan': CHANNEL, 'reconnect': options.reconnect}}
+    instance = bot.SourceServerIRCBot(report.write_config(directory, rcons, acl, extra))
+    
+    runner = threading.Thread(target = instance.start)
+    runner.daemon = True
+    runner.start()
+    if not irc.join_event.wait(30):
+        raise SystemExit('Bot did not join %s.' % (CHANNEL))
+    return instance, sorted(rcons), directory
+
+def command_rtt(options, irc, replies, identifiers):
+    samples = []
+    errors = 0
+    for i in range(options.commands):
+        identifier = identifiers[i % len(identifiers)]
+        replies.clear()
+        started = time.time()
+        irc.say(CHANNEL, '. %s status' % (identifier))
+        when = replies.wait(lambda command, text: True, 30)
+        if when is None:
+            errors += 1
+            continue
+        samples.append(when - started)
+        # Let the second line of the reply go out before the next command
+        replies.wait(lambda command, text: False, 0.3)
+    report.report('command round trip', samples, errors)
+    return dict(report.summarize(samples), errors = errors)
+
+def chat_relay(options, replies, generator, player):
+    samples = []
+    errors = 0
+    for i in range(options.chats):
+        token = 'admin relay %d' % (i)
+        replies.clear()
+        started = time.time()
+        generator.chat(player, token)
+        when = replies.wait(lambda command, text: text.endswith(token), 30)
+        if when is None:
+            errors += 1
+            continue
+        samples.append(when - started)
+    report.report('chat relay', samples, errors)
+    return dict(report.summarize(samples), errors = errors)
+
+def log_ingest(options, instance, generator, player):
+    # Lines without 'admin' from unwatched players are parsed but not relayed
+    counter = instance.communicate.chatlines.labels('no')
+    steps = []
+    best = 0
+    rate = options.ingest_start
+    while rate <= options.ingest_max:
+        before = counter.get()
+        total = int(rate * options.ingest_seconds)
+        started = time.time()
+        for i in range(total):
+            generator.chat(player, 'ingest line %d' % (i))
+            ahead = (i + 1) / float(rate) - (time.time() - started)
+            if ahead > 0.001:
+                time.sleep(ahead)
+        sent_for = time.time() - started
+        time.sleep(0.5)
+        handled = counter.get() - before
+        
+        step = {'rate': rate, 'sent': total, 'handled': handled, 'seconds': sent_for}
+        steps.append(step)
+        print('%-24s %6d lines/s offered, %6d/%d handled' % ('log ingest', rate, handled, total))
+        # Sustained means (nearly) nothing lost and the sender kept its pace
+        if handled < total * 0.99 or sent_for > options.ingest_seconds * 1.1:
+            break
+        best = rate
+        rate *= 2
+    print('%-24s %d lines/s sustained' % ('', best))
+    return {'sustained': best, 'steps': steps}
+
+def reconnect(options, irc):
+    samples = []
+    errors = 0
+    for i in range(options.reconnects):
+        irc.drop()
+        started = time.time()
+        if not irc.join_event.wait(options.reconnect * 3 + 30):
+            errors += 1
+            continue
+        samples.append(irc.channels.get(CHANNEL, time.time()) - started)
+    report.report('reconnect recovery', samples, errors)
+    return dict(report.summarize(samples), errors = errors, interval = options.reconnect)
+
+def version():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty']).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--output', help = 'JSON result file, by default next to the bot log')
+    parser.add_option('--servers', type = 'int', default = 2)
+    parser.add_option('--players', type = 'int', default = 24, help = 'players per server')
+    parser.add_option('--latency', type = 'float', default = 5, help = 'RCON server latency in ms')
+    parser.add_option('--commands', type = 'int', default = 40, help = 'command round trips')
+    parser.add_option('--chats', type = 'int', default = 20, help = 'relayed chat lines')
+    parser.add_option('--ingest-start', type = 'int', default = 500, help = 'first log rate in lines/s')
+    parser.add_option('--ingest-max', type = 'int', default = 64000, help = 'highest log rate tried')
+    parser.add_option('--ingest-seconds', type = 'float', default = 2, help = 'duration of each rate step')
+    parser.add_option('--reconnects', type = 'int', default = 3)
+    parser.add_option('--reconnect', type = 'int', default = 1, help = 'bot reconnection interval in s')
+    (options, args) = parser.parse_args()
+    
+    irc = fakes.FakeIRCServer().start()
+    servers = []
+    for i in range(options.servers):
+        state = fakes.FakeRconState(players = options.players, latency = options.latency / 1000.0)
+        servers.append(fakes.FakeRconServer(state).start())
+    udpport = fakes.free_udp_port()
+    generator = fakes.LogGenerator(udpport, source = servers[0].port)
+    player = servers[0].state.players[0]
+    
+    instance, identifiers, directory = start_bot(options, irc, servers, udpport)
+    if options.output is None:
+        options.output = os.path.join(directory, 'bench-e2e.json')
+    replies = Replies(irc)
+    
+    results = {'version': version(),
+               'python': platform.python_version(),
+               'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'options': vars(options)}
+    results['command_rtt'] = command_rtt(options, irc, replies, identifiers)
+    results['chat_relay'] = chat_relay(options, replies, generator, player)
+    results['log_ingest'] = log_ingest(options, instance, generator, player)
+    results['reconnect'] = reconnect(options, irc)
+    
+    with open(options.output, 'w') as output:
+        json.dump(results, output, indent = 4, sort_keys = True)
+    print('Results in %s, bot log in %s' % (options.output, directory))
+    
+    for server in servers:
+        server.stop()
+    irc.stop()
+
+if __name__ == '__main__':
+    main()
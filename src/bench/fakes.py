@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+"""Stand-in servers for exercising the bot without real game servers."""
+
+import random
+import socket
+import SocketServer
+import struct
+import threading
+import time
+
+SERVERDATA_EXECCOMMAND = 2
+SERVERDATA_AUTH = 3
+SERVERDATA_RESPONSE_VALUE = 0
+SERVERDATA_AUTH_RESPONSE = 2
+
+STATUS_HEADER = '''hostname: %(hostname)s
+version : 5970214/24 5970214 secure
+udp/ip  : %(host)s:%(port)d  (public ip: %(host)s)
+account : not logged in  (No account specified)
+map     : %(map)s at: 0 x, 0 y, 0 z
+tags    : bench
+players : %(count)d humans, 0 bots (%(max)d max)
+edicts  : 512 used of 2048 max
+# userid name                uniqueid            connected ping loss state  adr
+'''
+
+STATUS_LINE = '#    %5d "%s" %s %s %4d %4d active %s\n'
+
+def make_players(count, prefix = 'Player'):
+    players = []
+    for i in range(count):
+        players.append({'id': i + 2,
+                        'name': '%s %d' % (prefix, i + 1),
+                        'steam': 'STEAM_0:%d:%d' % (i % 2, 1000 + i),
+                        'ip': '10.0.%d.%d:27005' % (i / 250, i % 250 + 1),
+                        'connected': '%02d:%02d' % (i / 60, i % 60),
+                        'ping': 20 + i % 80,
+                        'loss': i % 3})
+    return players
+
+class FakeRconState:
+    def __init__(self, password = 'bench', players = 0, hostname = 'Bench Server', map = 'ctf_2fort',
+                 latency = 0, fragment = 0, disconnect_every = 0, packet_size = 4096):
+        self.password = password
+        self.players = make_players(players)
+        self.hostname = hostname
+        self.map = map
+        self.cvars = {'sv_password': ''}
+        
+        # Fault injection
+        self.latency = latency
+        self.fragment = fragment
+        self.disconnect_every = disconnect_every
+        self.packet_size = packet_size
+        self.banned = set()
+        
+        self.lock = threading.Lock()
+        self.commands = 0
+        self.log = []
+    
+    def execute(self, line, address):
+        output = []
+        for command in line.split(';'):
+            command = command.strip()
+            if command:
+                output.append(self._execute(command, address))
+        return ''.join(output)
+    
+    def _execute(self, command, address):
+        with self.lock:
+            self.commands += 1
+            self.log.append(command)
+            parts = command.split(None, 1)
+            name = parts[0]
+            arg = parts[1] if len(parts) > 1 else None
+            
+            if name == 'status':
+                return self.status(address)
+            if name == 'kickid' and arg is not None:
+                kept = [p for p in self.players if str(p['id']) != arg.split()[0]]
+                if len(kept) == len(self.players):
+                    return 'kickid:  player not found\n'
+                self.players = kept
+                return ''
+            if name in self.cvars:
+                if arg is None:
+                    return '"%s" = "%s" ( def. "" )\n' % (name, self.cvars[name])
+                self.cvars[name] = arg.strip('"')
+                return ''
+            if name == 'changelevel':
+                if arg and arg.startswith('ctf_'):
+                    self.map = arg
+                    return ''
+                return 'changelevel failed: %s not found\n' % (arg)
+            if name == 'exec':
+                return '\'%s\' not present; not executing.\n' % (arg)
+            if name in ('say', 'writeid', 'banid', '_restart'):
+                return ''
+            if name == 'cvarlist':
+                lines = ['sv_bench_var_%05d : 0 : , "sv" : Benchmark variable\n' % (i) for i in range(int(arg or 1000))]
+                return ''.join(lines)
+            if name == 'echo':
+                return '%s\n' % (arg or '')
+            return 'Unknown command "%s"\n' % (name)
+    
+    def status(self, address):
+        text = STATUS_HEADER % {'hostname': self.hostname, 'host': address[0], 'port': address[1],
+                                'map': self.map, 'count': len(self.players), 'max': max(32, len(self.players))}
+        for p in self.players:
+            text += STATUS_LINE % (p['id'], p['name'], p['steam'], p['connected'], p['ping'], p['loss'], p['ip'])
+        return text
+
+class FakeRconHandler(SocketServer.BaseRequestHandler):
+    def handle(self):
+        state = self.server.state
+        if self.client_address[0] in state.banned:
+            return
+        
+        self.handled = 0
+        self.authed = False
+        while True:
+            packet = self._read()
+            if packet is None:
+                return
+            request_id, type, body = packet
+            
+            if type == SERVERDATA_AUTH:
+                self.authed = body == state.password
+                self._write(self._packet(request_id, SERVERDATA_RESPONSE_VALUE, '') +
+                            self._packet(request_id if self.authed else -1, SERVERDATA_AUTH_RESPONSE, ''))
+                continue
+            if not self.authed:
+                return
+            
+            if state.latency:
+                time.sleep(state.latency)
+            output = state.execute(body, self.server.server_address)
+            self._write(self._response(request_id, output))
+            
+            if body:
+                self.handled += 1
+                if state.disconnect_every and self.handled % state.disconnect_every == 0:
+                    return
+    
+    def _read(self):
+        header = self._read_exact(12)
+        if header is None:
+            return None
+        size, request_id, type = struct.unpack('<lll', header)
+        body = self._read_exact(size - 8)
+        if body is None:
+            return None
+        return request_id, type, body[:-2]
+    
+    def _read_exact(self, count):
+        data = ''
+        while len(data) < count:
+            chunk = self.request.recv(count - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+    
+    def _packet(self, request_id, type, body):
+        body += '\x00\x00'
+        return struct.pack('<lll', len(body) + 8, request_id, type) + body
+    
+    def _response(self, request_id, output):
+        size = self.server.state.packet_size
+        if not output:
+            return self._packet(request_id, SERVERDATA_RESPONSE_VALUE, '')
+        return ''.join([self._packet(request_id, SERVERDATA_RESPONSE_VALUE, output[i:i + size])
+                        for i in range(0, len(output), size)])
+    
+    def _write(self, data):
+        fragment = self.server.state.fragment
+        if not fragment:
+            self.request.sendall(data)
+            return
+        for i in range(0, len(data), fragment):
+            self.request.sendall(data[i:i + fragment])
+            time.sleep(random.random() * 0.001)
+
+class FakeRconServer(SocketServer.ThreadingTCPServer):
+    """Speaks the Source RCON protocol on localhost.
+    
+    Authentication, split responses, bans and a scripted status table are
+    supported, as are artificial latency, fragmented writes and forced
+    disconnects after every n commands (see FakeRconState).
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+    
+    def __init__(self, state = None, host = '127.0.0.1', port = 0):
+        SocketServer.ThreadingTCPServer.__init__(self, (host, port), FakeRconHandler)
+        self.state = state or FakeRconState()
+        self.thread = threading.Thread(target = self.serve_forever)
+        self.thread.daemon = True
+    
+    def start(self):
+        self.thread.start()
+        return self
+    
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+    
+    @property
+    def port(self):
+        return self.server_address[1]
+
+class FakeA2SServer:
+    """Answers A2S_INFO, A2S_PLAYER and A2S_RULES over UDP from the same
+    FakeRconState a FakeRconServer uses, so both views agree.
+    
+    Every query needs a challenge first; replies larger than split_size are
+    sent as Source split packets.
+    """
+    def __init__(self, state, host = '127.0.0.1', port = 0, split_size = 1200):
+        self.state = state
+        self.split_size = split_size
+        self.challenge = random.randint(1, 2 ** 30)
+        self.rules = dict([('sv_bench_rule_%d' % (i), str(i)) for i in range(100)])
+        
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind((host, port))
+        self.address = self.socket.getsockname()
+        self.thread = threading.Thread(target = self._serve)
+        self.thread.daemon = True
+    
+    def start(self):
+        self.thread.start()
+        return self
+    
+    def stop(self):
+        self.socket.close()
+    
+    @property
+    def port(self):
+        return self.address[1]
+    
+    def _serve(self):
+        while True:
+            try:
+                data, address = self.socket.recvfrom(1400)
+            except socket.error:
+                return
+            reply = self._answer(data)
+            if reply is not None:
+                self._send(reply, address)
+    
+    def _answer(self, data):
+        if len(data) < 5 or data[:4] != '\xff\xff\xff\xff':
+            return None
+        kind = data[4]
+        if kind == 'T':
+            challenge = data[25:29]
+        elif kind in ('U', 'V'):
+            challenge = data[5:9]
+        else:
+            return None
+        
+        if len(challenge) != 4 or struct.unpack('<l', challenge)[0] != self.challenge:
+            return 'A' + struct.pack('<l', self.challenge)
+        
+        with self.state.lock:
+            players = list(self.state.players)
+            if kind == 'T':
+                return 'I' + struct.pack('<B', 17) + '%s\x00%s\x00tf\x00Team Fortress\x00' % (self.state.hostname, self.state.map) + \
+                    struct.pack('<hBBBBBBB', 440, len(players), max(32, len(players)), 0, ord('d'), ord('l'), 0, 1) + '5970214\x00'
+            if kind == 'U':
+                reply = 'D' + struct.pack('<B', len(players))
+                for i, p in enumerate(players):
+                    reply += struct.pack('<B', i) + p['name'] + '\x00' + struct.pack('<lf', i, 60.0 * i)
+                return reply
+            reply = 'E' + struct.pack('<h', len(self.rules))
+            for name in sorted(self.rules):
+                reply += '%s\x00%s\x00' % (name, self.rules[name])
+            return reply
+    
+    def _send(self, reply, address):
+        payload = '\xff\xff\xff\xff' + reply
+        if len(payload) <= self.split_size:
+            self.socket.sendto(payload, address)
+            return
+        
+        id = random.randint(1, 2 ** 30)
+        chunks = [payload[i:i + self.split_size] for i in range(0, len(payload), self.split_size)]
+        for number, chunk in enumerate(chunks):
+            self.socket.sendto(struct.pack('<llBBh', -2, id, len(chunks), number, self.split_size) + chunk, address)
+
+class FakeIRCHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        self.nick = None
+        with server.lock:
+            server.clients.append(self)
+        try:
+            for line in iter(self.rfile.readline, ''):
+                self._command(line.rstrip('\r\n'))
+        except socket.error:
+            pass
+        finally:
+            with server.lock:
+                if self in server.clients:
+                    server.clients.remove(self)
+    
+    def _command(self, line):
+        server = self.server
+        prefix = ':%s!bot@127.0.0.1' % (self.nick)
+        parts = line.split(' ', 2)
+        command = parts[0].upper()
+        
+        if command == 'NICK':
+            self.nick = parts[1]
+        elif command == 'USER':
+            self.send(':bench.local 001 %s :Welcome to the bench network' % (self.nick))
+        elif command == 'PING':
+            self.send(':bench.local PONG bench.local %s' % (parts[1]))
+        elif command == 'JOIN':
+            self.send('%s JOIN :%s' % (prefix, parts[1]))
+            server.joined(parts[1])
+        elif command in ('PRIVMSG', 'NOTICE'):
+            target, text = parts[1], parts[2][1:]
+            server.received(command, target, text)
+    
+    def send(self, line):
+        self.wfile.write(line + '\r\n')
+        self.wfile.flush()
+
+class FakeIRCServer(SocketServer.ThreadingTCPServer):
+    """Just enough of an IRC server for one bot: registration, JOIN, PING
+    and message delivery both ways.
+    
+    Every PRIVMSG and NOTICE the bot sends is timestamped and handed to
+    listeners; say() injects a channel message from a user, drop() closes
+    the bot's connection to provoke a reconnect.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+    
+    def __init__(self, host = '127.0.0.1', port = 0):
+        SocketServer.ThreadingTCPServer.__init__(self, (host, port), FakeIRCHandler)
+        self.clients = []
+        self.channels = dict()
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.join_event = threading.Event()
+        self.thread = threading.Thread(target = self.serve_forever)
+        self.thread.daemon = True
+    
+    def start(self):
+        self.thread.start()
+        return self
+    
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+    
+    @property
+    def port(self):
+        return self.server_address[1]
+    
+    def joined(self, channel):
+        with self.lock:
+            self.channels[channel] = time.time()
+        self.join_event.set()
+    
+    def received(self, command, target, text):
+        now = time.time()
+        for listener in list(self.listeners):
+            listener(now, command, target, text)
+    
+    def say(self, channel, text, source = 'bench!bench@127.0.0.1'):
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            client.send(':%s PRIVMSG %s :%s' % (source, channel, text))
+    
+    def drop(self):
+        self.join_event.clear()
+        with self.lock:
+            clients = list(self.clients)
+            self.channels.clear()
+        for client in clients:
+            try:
+                client.request.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+class LogGenerator:
+    """Sends Source style UDP log lines (as with logaddress_add) to a port.
+    Like a game server it can send from a fixed source port, usually that of
+    the FakeRconServer it stands in for."""
+    def __init__(self, port, host = '127.0.0.1', source = 0):
+        self.address = (host, port)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(('127.0.0.1', source))
+    
+    def line(self, text):
+        stamp = time.strftime('%m/%d/%Y - %H:%M:%S')
+        self.socket.sendto('\xff\xff\xff\xffRL %s: %s\n\x00' % (stamp, text), self.address)
+    
+    def chat(self, player, message, team = 'Red', type = 'say'):
+        self.line('"%s<%d><%s><%s>" %s "%s"' % (player['name'], player['id'], player['steam'], team, type, message))
+
+def free_udp_port():
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    probe.bind(('127.0.0.1', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    return port
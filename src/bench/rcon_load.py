@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+"""Load harness for the RCON layer and the bot's command path.
+
+Starts a fake RCON server per simulated game server, then drives commands
+through lameirc.rcon.Rcon directly and through SourceServerIRCBot.on_pubmsg,
+printing latency percentiles for both.
+
+Run from the src directory: python -m bench.rcon_load --help
+"""
+
+import optparse
+import threading
+import time
+
+import irclib.irclib as irclib
+import lameirc.bot as bot
+import lameirc.rcon as rcon
+
+from bench import fakes, report
+
+COMMANDS = ['status', 'sv_password', 'echo load', 'cvarlist 200']
+BOT_COMMANDS = ['players', 'status', 'map', 'password']
+FAILURES = ('RCON error', 'Command timed out', 'No rcon available')
+
+class ReplyConnection:
+    """Per-thread stand-in for an IRC connection that signals each reply."""
+    def __init__(self):
+        self.replied = threading.Event()
+        self.lines = []
+    
+    def reply(self, message):
+        self.lines.append(message)
+        self.replied.set()
+
+def start_servers(options):
+    servers = []
+    for i in range(options.servers):
+        state = fakes.FakeRconState(players = options.players, latency = options.latency / 1000.0,
+                                    fragment = options.fragment, disconnect_every = options.disconnect_every)
+        server = fakes.FakeRconServer(state).start()
+        server.query = fakes.FakeA2SServer(state).start()
+        servers.append(server)
+    return servers
+
+def run_threads(targets):
+    threads = [threading.Thread(target = t) for t in targets]
+    started = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.time() - started
+
+def load_rcon(servers, options):
+    samples = []
+    errors = [0]
+    per_server = options.commands / len(servers)
+    
+    def drive(server):
+        client = rcon.Rcon('127.0.0.1', server.port, server.state.password, timeout = 10)
+        for i in range(per_server):
+            started = time.time()
+            try:
+                client.send(COMMANDS[i % len(COMMANDS)])
+                samples.append(time.time() - started)
+            except (rcon.RconException, EnvironmentError):
+                errors[0] += 1
+    
+    elapsed = run_threads([lambda s = s: drive(s) for s in servers])
+    report.report('rcon', samples, errors[0])
+    print('%-24s %.0f commands/s' % ('', len(samples) / elapsed))
+
+def load_bot(servers, options):
+    directory = report.tempdir()
+    rcons = dict()
+    acl = dict()
+    for i, server in enumerate(servers):
+        identifier = 'srv%d' % (i)
+        rcons[identifier] = {'host': '127.0.0.1', 'port': server.port, 'pass': server.state.password,
+                             'queryport': server.query.port, 'query': options.query}
+        acl[identifier] = dict([(c, [0]) for c in BOT_COMMANDS])
+    instance = bot.SourceServerIRCBot(report.write_config(directory, rcons, acl))
+    
+    instance.communicate.public = lambda connection, message: connection.reply(message)
+    instance.communicate.notice = lambda connection, event, message: connection.reply(message)
+    
+    samples = []
+    errors = [0]
+    per_server = options.commands / len(servers)
+    
+    def drive(identifier):
+        connection = ReplyConnection()
+        for i in range(per_server):
+            line = '. %s %s' % (identifier, BOT_COMMANDS[i % len(BOT_COMMANDS)])
+            event = irclib.Event('pubmsg', 'bench!bench@127.0.0.1', '#bench', [line])
+            connection.replied.clear()
+            started = time.time()
+            instance.on_pubmsg(connection, event)
+            connection.replied.wait(30)
+            if not connection.replied.is_set() or connection.lines[-1].startswith(FAILURES):
+                errors[0] += 1
+                continue
+            samples.append(time.time() - started)
+    
+    elapsed = run_threads([lambda i = i: drive(i) for i in sorted(rcons)])
+    report.report('bot command path', samples, errors[0])
+    print('%-24s %.0f commands/s, log in %s' % ('', len(samples) / elapsed, directory))
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--commands', type = 'int', default = 4000, help = 'commands per phase')
+    parser.add_option('--servers', type = 'int', default = 4)
+    parser.add_option('--players', type = 'int', default = 32, help = 'players per server')
+    parser.add_option('--latency', type = 'float', default = 0, help = 'server latency in ms')
+    parser.add_option('--fragment', type = 'int', default = 0, help = 'split server writes into chunks of n bytes')
+    parser.add_option('--disconnect-every', type = 'int', default = 0, help = 'drop connections after n commands')
+    parser.add_option('--no-query', dest = 'query', action = 'store_false', default = True,
+                      help = 'answer read-only commands over RCON instead of A2S')
+    (options, args) = parser.parse_args()
+    
+    servers = start_servers(options)
+    load_rcon(servers, options)
+    load_bot(servers, options)
+    for server in servers:
+        server.query.stop()
+        server.stop()
+
+if __name__ == '__main__':
+    main()
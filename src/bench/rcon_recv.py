@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+"""Compare the old and current RCON frame decoders on a 64 KB cvarlist
+response, plus larger responses to show how both scale.
+
+Run from the src directory: python -m bench.rcon_recv
+"""
+
+import select
+import socket
+import struct
+import time
+
+import lameirc.rcon as rcon
+
+RESPONSE_SIZES = [64 * 1024, 256 * 1024, 1024 * 1024]
+PAIR_SIZE = 64 * 1024
+ROUNDS = 50
+
+class BufferSocket:
+    """In-memory stand-in for a socket that already holds a full response,
+    so the measurement covers decoding and copying rather than the kernel."""
+    def __init__(self):
+        self.data = b''
+        self.offset = 0
+    
+    def feed(self, data):
+        self.data = data
+        self.offset = 0
+    
+    def pending(self):
+        return self.offset < len(self.data)
+    
+    def recv(self, count):
+        chunk = self.data[self.offset:self.offset + count]
+        self.offset += len(chunk)
+        return chunk
+    
+    def recv_into(self, buffer, count):
+        count = min(count, len(self.data) - self.offset)
+        buffer[:count] = memoryview(self.data)[self.offset:self.offset + count]
+        self.offset += count
+        return count
+    
+    def close(self):
+        pass
+
+class PairSocket:
+    """Real socketpair; the whole response is queued before decoding starts
+    because the old decoder stops as soon as the socket looks drained."""
+    def __init__(self):
+        self.reader, self.writer = socket.socketpair()
+    
+    def feed(self, data):
+        self.writer.sendall(data)
+    
+    def pending(self):
+        return len(select.select([self.reader], [], [], 0)[0]) > 0
+    
+    def recv(self, count):
+        return self.reader.recv(count)
+    
+    def recv_into(self, buffer, count):
+        return self.reader.recv_into(buffer, count)
+    
+    def close(self):
+        pass
+
+class BenchRcon(rcon.Rcon):
+    def __init__(self, sock):
+        rcon.Rcon.__init__(self, '127.0.0.1', rcon_password = 'bench')
+        self.socket = sock
+    
+    def _connect(self):
+        self.authenticated = True
+
+def packet(request_id, body, type = rcon.Rcon.SERVERDATA_RESPONSE_VALUE):
+    body = body + b'\x00\x00'
+    return struct.pack('<lll', len(body) + 8, request_id, type) + body
+
+def cvarlist(size):
+    lines = []
+    length = 0
+    i = 0
+    while length < size:
+        line = 'sv_bench_var_%05d                        : 0        : , "sv", "rep" : Benchmark variable\n' % (i)
+        lines.append(line)
+        length += len(line)
+        i += 1
+    return ''.join(lines)[:size]
+
+def legacy_recv(sock, expected_id):
+    # Decoding loop as it was before the recv_into rewrite. The original read
+    # 'size - len(recv_buffer)' bytes, running 8 bytes into the next packet;
+    # that is corrected here so multi-packet responses decode at all.
+    response = b''
+    while True:
+        recv_buffer = b''
+        size, request_id, response_code = struct.unpack('<LLL', sock.recv(12))
+        while len(recv_buffer) + 8 < size:
+            recv_buffer += sock.recv(size - 8 - len(recv_buffer))
+        if request_id != expected_id:
+            raise rcon.RconException('Received bad request id')
+        response += recv_buffer[:size - 10]
+        if not sock.pending():
+            break
+    return response
+
+def measure(name, size, decode, sock, payload):
+    started = time.time()
+    for i in range(ROUNDS):
+        sock.feed(payload)
+        result = decode()
+    elapsed = time.time() - started
+    
+    assert len(result) == size
+    print('%-8s %-12s %5d KB %8.3f ms per response' % (name, sock.__class__.__name__, size / 1024, elapsed * 1000.0 / ROUNDS))
+
+def compare(sock, size):
+    client = BenchRcon(sock)
+    body = cvarlist(size)
+    chunks = [packet(1, body[i:i + 4096]) for i in range(0, len(body), 4096)]
+    
+    measure('before', size, lambda: legacy_recv(sock, 1), sock, b''.join(chunks))
+    measure('after', size, lambda: client._recv(1, 2), sock, b''.join(chunks + [packet(2, b'')]))
+
+def main():
+    compare(PairSocket(), PAIR_SIZE)
+    for size in RESPONSE_SIZES:
+        compare(BufferSocket(), size)
+
+if __name__ == '__main__':
+    main()
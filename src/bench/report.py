@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import json
+import os
+import tempfile
+
+def percentile(samples, pct):
+    if not len(samples):
+        return 0.0
+    ordered = sorted(samples)
+    index = int(round(pct / 100.0 * (len(ordered) - 1)))
+    return ordered[index]
+
+def summarize(samples):
+    return {'count': len(samples),
+            'p50': percentile(samples, 50) * 1000.0,
+            'p95': percentile(samples, 95) * 1000.0,
+            'p99': percentile(samples, 99) * 1000.0,
+            'max': max(samples or [0]) * 1000.0}
+
+def report(name, samples, errors = 0):
+    s = summarize(samples)
+    print('%-24s n=%-6d p50=%7.2fms p95=%7.2fms p99=%7.2fms max=%7.2fms errors=%d'
+          % (name, s['count'], s['p50'], s['p95'], s['p99'], s['max'], errors))
+
+def write_config(directory, rcons, acl, extra = None):
+    """Writes settings, ACL and help files for a bot pointed at stand-ins
+    and returns the path of the settings file."""
+    settings = {'base': {'logfile': os.path.join(directory, 'bot.log'),
+                         'aclfile': os.path.join(directory, 'acl.cfg'),
+                         'helpfile': os.path.join(directory, 'help.cfg'),
+                         'udplogport': 0},
+                'irc': {'nick': 'benchbot', 'host': '127.0.0.1', 'port': 6667, 'chan': '#bench'},
+                'users': {},
+                'rcon': rcons}
+    for section, values in (extra or {}).items():
+        settings.setdefault(section, {}).update(values)
+    
+    for name, contents in (('settings.cfg', settings), ('acl.cfg', acl), ('help.cfg', {})):
+        with open(os.path.join(directory, name), 'w') as cfgfile:
+            json.dump(contents, cfgfile, indent = 4)
+    return os.path.join(directory, 'settings.cfg')
+
+def tempdir():
+    return tempfile.mkdtemp(prefix = 'lameirc-bench-')
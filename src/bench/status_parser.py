@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+"""Benchmark of the status parser on 32/64/100 player fixtures in the old
+(STEAM_X:Y:Z), SteamID3 and CS:GO-style layouts, against the per-call
+re.compile parsers it replaced.
+
+Run from the src directory: python -m bench.status_parser
+"""
+
+import re
+import time
+
+import lameirc.parsers as parsers
+
+from bench import fakes
+
+ROUNDS = 2000
+PLAYER_COUNTS = [32, 64, 100]
+
+def legacy(result):
+    # The former SourceServerIRCBot._parse_rcon_players/_parse_rcon_status
+    playerformat = re.compile(r'^#\s+?(\d+)\s+?"(.+?)"\s+?(STEAM_\S+).+?([\d.:]+)$', re.MULTILINE)
+    pList = []
+    for p in playerformat.findall(result):
+        pList.append({'id': int(p[0]), 'name': p[1], 'steam': p[2], 'ip': p[3]})
+    propertyformat = re.compile(r'^(\S+)\s*:\s+(.+?)$', re.MULTILINE)
+    properties = dict()
+    for p in propertyformat.findall(result):
+        properties[p[0]] = p[1]
+    return properties, pList
+
+def steamid3(result):
+    return re.sub(r'STEAM_0:(\d):(\d+)', lambda m: '[U:1:%d]' % (int(m.group(2)) * 2 + int(m.group(1))), result)
+
+def csgo(result):
+    # Adds the slot column and a rate column before the address
+    result = re.sub(r'^#\s+(\d+) "', lambda m: '# %s %d "' % (m.group(1), int(m.group(1)) - 1), result, flags = re.MULTILINE)
+    return re.sub(r' active ', ' active 196608 ', result) + '#end\n'
+
+def fixture(count):
+    return fakes.FakeRconState(players = count).status(('127.0.0.1', 27015))
+
+def measure(name, function, text, expected):
+    started = time.time()
+    for i in range(ROUNDS):
+        result = function(text)
+    elapsed = time.time() - started
+    players = len(result[1]) if name == 'before' else len(result.players)
+    assert players == expected, '%s parsed %d of %d players' % (name, players, expected)
+    return elapsed * 1000000.0 / ROUNDS
+
+def main():
+    for count in PLAYER_COUNTS:
+        text = fixture(count)
+        before = measure('before', legacy, text, count)
+        for layout, variant in (('steam2', text), ('steamid3', steamid3(text)), ('csgo', csgo(text))):
+            after = measure('after', parsers.parse_status, variant, count)
+            print('%3d players %-9s before %7.1f us  after %7.1f us' % (count, layout, before, after))
+
+if __name__ == '__main__':
+    main()
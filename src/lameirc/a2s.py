@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import collections
+import socket
+import struct
+import threading
+import time
+
+class A2SException(Exception):
+    pass
+
+ServerInfo = collections.namedtuple('ServerInfo', 'name map folder game appid players max_players bots version')
+Player = collections.namedtuple('Player', 'index name score duration')
+
+class Reader:
+    def __init__(self, data, offset = 0):
+        self.data = data
+        self.offset = offset
+    
+    def unpack(self, format):
+        values = struct.unpack_from(format, self.data, self.offset)
+        self.offset += struct.calcsize(format)
+        return values
+    
+    def byte(self):
+        return self.unpack('<B')[0]
+    
+    def string(self):
+        end = self.data.index('\x00', self.offset)
+        value = self.data[self.offset:end]
+        self.offset = end + 1
+        return value
+
+class Pending:
+    """The outstanding requests of one query to one server."""
+    def __init__(self, kinds, query):
+        self.kinds = kinds
+        self.query = query
+        self.splits = dict()
+
+class Query:
+    def __init__(self, count):
+        self.results = dict()
+        self.outstanding = count
+        self.done = threading.Event()
+
+class A2SClient:
+    """Source server query client (A2S_INFO, A2S_PLAYER, A2S_RULES).
+    
+    Queries for many servers are sent over one UDP socket. A single receiver
+    thread reads every reply and hands it to the query waiting on that
+    address, so a slow or unreachable server only delays its own callers.
+    Requests to the same server are pipelined one at a time so challenge
+    replies can be matched to their request; a second query for a server
+    that is already being asked waits for the first.
+    """
+    INFO = 'info'
+    PLAYERS = 'players'
+    RULES = 'rules'
+    
+    HEADER = '\xff\xff\xff\xff'
+    SPLIT = -2
+    
+    REQUESTS = {INFO: 'TSource Engine Query\x00',
+                PLAYERS: 'U',
+                RULES: 'V'}
+    RESPONSES = {'I': INFO, 'D': PLAYERS, 'E': RULES}
+    
+    def __init__(self, timeout = 2.0, challenge_ttl = 30, log = None):
+        self.timeout = timeout
+        self.challenge_ttl = challenge_ttl
+        self.log = log
+        
+        self.challenges = dict()
+        self.pending = dict()
+        self.lock = threading.Condition()
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(('0.0.0.0', 0))
+        
+        self.receiver = threading.Thread(target = A2SClient._receive, args = (self,))
+        self.receiver.daemon = True
+        self.receiver.start()
+    
+    def info(self, address):
+        return self._one(address, self.INFO)
+    
+    def players(self, address):
+        return self._one(address, self.PLAYERS)
+    
+    def rules(self, address):
+        return self._one(address, self.RULES)
+    
+    def query(self, requests):
+        """Runs (address, kind) requests concurrently and returns a dict of
+        results keyed by request; failed or timed out requests are missing."""
+        queues = dict()
+        for address, kind in requests:
+            queues.setdefault(address, collections.deque()).append(kind)
+        
+        deadline = time.time() + self.timeout
+        query = Query(len(queues))
+        with self.lock:
+            while any([address in self.pending for address in queues]):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return query.results
+                self.lock.wait(remaining)
+            try:
+                for address in queues:
+                    self.pending[address] = Pending(queues[address], query)
+                    self._request(address, queues[address][0])
+            except socket.error:
+                for address in queues:
+                    self.pending.pop(address, None)
+                self.lock.notify_all()
+                raise
+        
+        query.done.wait(max(deadline - time.time(), 0))
+        
+        with self.lock:
+            for address in queues:
+                if self.pending.get(address) is not None and self.pending[address].query is query:
+                    del self.pending[address]
+            self.lock.notify_all()
+            return dict(query.results)
+    
+    def _receive(self):
+        while True:
+            try:
+                data, address = self.socket.recvfrom(65535)
+            except socket.error as e:
+                self._log('A2S receive failed: %s' % (e))
+                time.sleep(1)
+                continue
+            with self.lock:
+                # Late replies to queries that already gave up are dropped
+                if address in self.pending:
+                    try:
+                        self._dispatch(address, data, self.pending[address])
+                    except socket.error as e:
+                        self._log('A2S request to %s:%d failed: %s' % (address[0], address[1], e))
+    
+    def _dispatch(self, address, data, pending):
+        kind = pending.kinds[0]
+        try:
+            payload = self._reassemble(address, data, pending.splits)
+            if payload is None:
+                return
+            
+            if payload[0] == 'A':
+                challenge = struct.unpack_from('<l', payload, 1)[0]
+                self.challenges[address] = (challenge, time.time())
+                self._request(address, kind)
+                return
+            
+            if self.RESPONSES.get(payload[0]) != kind:
+                return
+            pending.query.results[(address, kind)] = getattr(self, '_decode_%s' % (kind))(Reader(payload, 1))
+        except (struct.error, ValueError, IndexError, A2SException) as e:
+            self._log('Malformed A2S %s reply from %s:%d: %s' % (kind, address[0], address[1], e))
+        
+        pending.kinds.popleft()
+        if len(pending.kinds):
+            self._request(address, pending.kinds[0])
+            return
+        del self.pending[address]
+        self.lock.notify_all()
+        pending.query.outstanding -= 1
+        if not pending.query.outstanding:
+            pending.query.done.set()
+    
+    def _one(self, address, kind):
+        result = self.query([(address, kind)])
+        if (address, kind) not in result:
+            raise A2SException('No %s reply from %s:%d' % (kind, address[0], address[1]))
+        return result[(address, kind)]
+    
+    def _challenge(self, address):
+        if address in self.challenges:
+            challenge, stamp = self.challenges[address]
+            if time.time() - stamp < self.challenge_ttl:
+                return challenge
+            del self.challenges[address]
+        return -1
+    
+    def _request(self, address, kind):
+        packet = self.HEADER + self.REQUESTS[kind]
+        challenge = self._challenge(address)
+        if kind != self.INFO or challenge != -1:
+            packet += struct.pack('<l', challenge)
+        self.socket.sendto(packet, address)
+    
+    def _reassemble(self, address, data, splits):
+        header = struct.unpack_from('<l', data)[0]
+        if header == -1:
+            return data[4:]
+        if header != self.SPLIT:
+            raise A2SException('Unknown packet header %d' % (header))
+        
+        id, total, number, size = struct.unpack_from('<lBBh', data, 4)
+        if id & 0x80000000:
+            raise A2SException('Compressed replies are not supported')
+        parts = splits.setdefault((address, id), dict())
+        parts[number] = data[12:]
+        if len(parts) < total:
+            return None
+        
+        del splits[(address, id)]
+        payload = ''.join([parts[i] for i in range(total)])
+        if struct.unpack_from('<l', payload)[0] != -1:
+            raise A2SException('Bad split payload header')
+        return payload[4:]
+    
+    def _decode_info(self, reader):
+        reader.byte()
+        name = reader.string()
+        map = reader.string()
+        folder = reader.string()
+        game = reader.string()
+        appid, players, max_players, bots = reader.unpack('<hBBB')
+        reader.unpack('<BBBB')
+        version = reader.string()
+        return ServerInfo(name, map, folder, game, appid, players, max_players, bots, version)
+    
+    def _decode_players(self, reader):
+        players = []
+        for i in range(reader.byte()):
+            index = reader.byte()
+            name = reader.string()
+            score, duration = reader.unpack('<lf')
+            players.append(Player(index, name, score, duration))
+        return players
+    
+    def _decode_rules(self, reader):
+        rules = dict()
+        for i in range(reader.unpack('<h')[0]):
+            name = reader.string()
+            rules[name] = reader.string()
+        return rules
+    
+    def _log(self, message):
+        if self.log:
+            self.log.system(message)
@@ -21,64 +21,266 @@
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
 # IN THE SOFTWARE.
 
-import logging.handlers
+import atexit
+import glob
+import gzip
+import itertools
+import json
+import os
 import Queue
-import re
+import shutil
 import socket
 import threading
 import time
 
 import irclib.irclib as irclib
+import lameirc.parsers as parsers
 
 class RconIdentifierError(Exception):
     pass
 
 class LogWrapper:
+    """Writes log records from a background thread.
+    
+    Callers only put a record on a bounded queue; the writer drains it in
+    batches, formats them as text or JSON lines and flushes once per batch.
+    When the queue is full records are dropped and counted, and the count
+    is written to the log as soon as there is room again. Files rotate by
+    size and/or time; rotated files are gzipped on a separate thread.
+    Like WatchedFileHandler the file is reopened if it was moved away, but
+    this is checked once per batch instead of once per record.
+    """
     CHAT_PREFIX =    'CHT'
     COMMAND_PREFIX = 'CMD'
     RCON_PREFIX =    'RCN'
     SYSTEM_PREFIX =  'SYS'
     
-    def __init__(self, logfile):
-        self.instance = logging.Logger('SourceServerIRCBot')
-        self.instance.setLevel(logging.INFO)
+    CATEGORIES = {CHAT_PREFIX: 'chat', COMMAND_PREFIX: 'command', RCON_PREFIX: 'rcon', SYSTEM_PREFIX: 'system'}
+    BATCH = 256
+    
+    def __init__(self, logfile, format = 'text', rotate = None, queuesize = 10000, interval = 0.5):
+        self.logfile = logfile
+        self.format = format
+        self.interval = interval
+        
+        rotate = rotate or {}
+        self.rotate_bytes = rotate.get('bytes')
+        self.rotate_when = rotate.get('when')
+        self.backups = rotate.get('backups', 7)
+        self.compress = rotate.get('compress', True)
+        
+        self.queue = Queue.Queue(queuesize)
+        self.dropped = 0
+        self.reported = 0
+        self.lock = threading.Lock()
         
-        handle = logging.handlers.WatchedFileHandler(logfile)
-        handle.setLevel(logging.INFO)
-        handle.setFormatter(logging.Formatter('%(asctime)s | %(message)s'))
-        self.instance.addHandler(handle)
+        # Open here so a bad path fails at startup with IOError, as before
+        self._open()
+        self.rollover = self._next_rollover(time.time())
+        
+        self.compressor = Queue.Queue()
+        self.writer = threading.Thread(target = LogWrapper._writer, args = (self,))
+        self.writer.daemon = True
+        self.writer.start()
+        self.packer = threading.Thread(target = LogWrapper._packer, args = (self,))
+        self.packer.daemon = True
+        self.packer.start()
+        atexit.register(self.close)
+    
+    def chat(self, message, **fields):
+        self._log(self.CHAT_PREFIX, message, fields)
+    
+    def command(self, message, **fields):
+        self._log(self.COMMAND_PREFIX, message, fields)
+    
+    def system(self, message, **fields):
+        self._log(self.SYSTEM_PREFIX, message, fields)
     
-    def chat(self, message):
-        self._log(self.CHAT_PREFIX, message)
+    def rcon(self, message, **fields):
+        self._log(self.RCON_PREFIX, message, fields)
     
-    def command(self, message):
-        self._log(self.COMMAND_PREFIX, message)
+    def flush(self, timeout = 5):
+        """Waits until everything queued so far is written."""
+        done = threading.Event()
+        try:
+            self.queue.put(done, timeout = timeout)
+        except Queue.Full:
+            return False
+        return done.wait(timeout) or done.is_set()
     
-    def system(self, message):
-        self._log(self.SYSTEM_PREFIX, message)
+    def close(self):
+        self.flush()
     
-    def rcon(self, message):
-        self._log(self.RCON_PREFIX, message)
+    def _log(self, prefix, message, fields):
+        try:
+            self.queue.put_nowait((time.time(), prefix, message, fields))
+        except Queue.Full:
+            with self.lock:
+                self.dropped += 1
     
-    def _log(self, prefix, message):
-        self.instance.info('[%s] %s' % (prefix, message))
+    def _writer(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.BATCH:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Queue.Empty:
+                    break
+            
+            # Records are tuples, anything else is a flush() waiting for its turn
+            waiting = [r for r in batch if not isinstance(r, tuple)]
+            lines = [self._safe_format(r) for r in batch if isinstance(r, tuple)]
+            with self.lock:
+                dropped = self.dropped - self.reported
+                self.reported = self.dropped
+            if dropped:
+                lines.append(self._format((time.time(), self.SYSTEM_PREFIX,
+                                           'Dropped %d log records under load (%d in total).' % (dropped, self.reported), {})))
+            self._write(lines)
+            for done in waiting:
+                done.set()
+            
+            # Give bursts a moment to collect into the next batch
+            if len(batch) < self.BATCH and self.interval:
+                time.sleep(min(self.interval, 0.05))
+    
+    def _safe_format(self, record):
+        try:
+            return self._format(record)
+        except UnicodeError:
+            # Player names and RCON output are not always valid UTF-8
+            when, prefix, message, fields = record
+            clean = lambda v: v.decode('utf-8', 'replace') if isinstance(v, str) else v
+            return self._format((when, prefix, clean(message), dict([(k, clean(v)) for k, v in fields.items()])))
+    
+    def _format(self, record):
+        when, prefix, message, fields = record
+        if self.format == 'json':
+            entry = {'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(when)) + '.%03d' % (when % 1 * 1000),
+                     'category': self.CATEGORIES[prefix], 'message': message}
+            entry.update(fields)
+            return json.dumps(entry) + '\n'
         
+        line = '%s,%03d | [%s] %s' % (time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(when)), when % 1 * 1000, prefix, message)
+        if isinstance(line, unicode):
+            line = line.encode('utf-8')
+        return line + '\n'
+    
+    def _write(self, lines):
+        try:
+            self._reopen_if_moved()
+            self.file.write(''.join(lines))
+            self.file.flush()
+            
+            now = time.time()
+            if (self.rotate_bytes and self.file.tell() >= self.rotate_bytes) or \
+               (self.rollover is not None and now >= self.rollover):
+                self._rotate(now)
+        except (IOError, OSError):
+            # Disk trouble must not stop the bot; count and try again later
+            with self.lock:
+                self.dropped += len(lines)
+                self.reported += len(lines)
+    
+    def _open(self):
+        self.file = open(self.logfile, 'a')
+        self.inode = os.fstat(self.file.fileno()).st_ino
+    
+    def _reopen_if_moved(self):
+        try:
+            moved = os.stat(self.logfile).st_ino != self.inode
+        except OSError:
+            moved = True
+        if moved:
+            self.file.close()
+            self._open()
+    
+    def _next_rollover(self, now):
+        if self.rotate_when is None:
+            return None
+        if self.rotate_when == 'midnight':
+            tomorrow = time.localtime(now + 86400)
+            return time.mktime((tomorrow.tm_year, tomorrow.tm_mon, tomorrow.tm_mday, 0, 0, 0, 0, 0, -1))
+        return now + self.rotate_when
+    
+    def _rotate(self, now):
+        self.file.close()
+        rotated = '%s.%s' % (self.logfile, time.strftime('%Y%m%d-%H%M%S', time.localtime(now)))
+        suffix = 0
+        while os.path.exists(rotated + (suffix and '.%d' % (suffix) or '')) or \
+              os.path.exists(rotated + (suffix and '.%d' % (suffix) or '') + '.gz'):
+            suffix += 1
+        rotated += suffix and '.%d' % (suffix) or ''
+        os.rename(self.logfile, rotated)
+        self._open()
+        self.rollover = self._next_rollover(now)
+        self.compressor.put(rotated)
+    
+    def _packer(self):
+        while True:
+            rotated = self.compressor.get()
+            try:
+                if self.compress:
+                    with open(rotated, 'rb') as source:
+                        with gzip.open(rotated + '.gz', 'wb') as target:
+                            shutil.copyfileobj(source, target)
+                    os.remove(rotated)
+                
+                old = sorted(glob.glob('%s.[0-9]*' % (self.logfile)), key = os.path.getmtime)
+                for path in old[:max(len(old) - self.backups, 0)]:
+                    os.remove(path)
+            except (IOError, OSError) as e:
+                self.system('Could not compress or prune %s: %s' % (rotated, e))
+
+class IRCQueue(Queue.PriorityQueue):
+    """The send queue; maxsize only holds back ordinary lines."""
+    def put_urgent(self, item):
+        # Queue.put without the wait for a free slot; alerts are rare
+        # (debounced per player) so they cannot grow the queue by much
+        with self.mutex:
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
 
 class Communicator:
+    URGENT = 0
+    NORMAL = 1
+    
     def __init__(self, bot, udp_log_port = 26999):
         self.bot = bot
         self.fallbackconnect = None
         
-        self.ircqueue = Queue.Queue(30)
+        # Lines are (priority, sequence, item) so alerts overtake queued
+        # command output while everything else stays in order
+        self.ircqueue = IRCQueue(30)
+        self.sequence = itertools.count()
+        self.chatqueue = Queue.Queue(10)
+        self.eventqueue = Queue.Queue(1000)
+        # Arrival time of the last datagram per source address
+        self.heard = dict()
+        
+        registry = self.bot.metrics
+        depth = registry.gauge('lameirc_queue_depth', 'Items waiting in the Communicator queues.', ('queue',))
+        depth.set_function(self.ircqueue.qsize, 'irc')
+        depth.set_function(self.chatqueue.qsize, 'chat')
+        self.sent = registry.counter('lameirc_irc_lines_sent_total', 'Lines sent to the IRC channel.')
+        self.datagrams = registry.counter('lameirc_udp_datagrams_total', 'Log datagrams received.')
+        self.chatlines = registry.counter('lameirc_chat_lines_total', 'Chat lines read from the server logs.', ('relayed',))
+        self.events = registry.counter('lameirc_log_events_total', 'Player events parsed from the server logs.', ('kind',))
+        depth.set_function(self.eventqueue.qsize, 'events')
+        
         self.ircsender = threading.Thread(target = Communicator._worker_irc, args = (self,))
         self.ircsender.daemon = True
         self.ircsender.start()
         
-        self.chatqueue = Queue.Queue(10)
         self.chatworker = threading.Thread(target = Communicator._worker_chat, args = (self,))
         self.chatworker.daemon = True
         self.chatworker.start()
         
+        self.eventworker = threading.Thread(target = Communicator._worker_events, args = (self,))
+        self.eventworker.daemon = True
+        self.eventworker.start()
+        
         self.udplistener = threading.Thread(target = Communicator._udp_listen, args = (self, '0.0.0.0', udp_log_port))
         self.udplistener.daemon = True
         self.udplistener.start()
@@ -87,43 +289,74 @@ class Communicator:
     
     def _udp_listen(self, host, port):
         udplog = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        udplog.bind((socket.gethostbyname(host), port))
-        
-        lineformat = re.compile('^"(?P<name>.+?)<\d+><(?P<steam>STEAM_.+?)><(?P<team>Spectator|Blue|Red)>"\s(?P<type>say|say_team)\s"(?P<message>.+?)"', 
-                                re.MULTILINE|re.VERBOSE)
+        udplog.bind((self.bot.resolver.resolve(host), port))
         
         while True:
             data = udplog.recvfrom(1024)
-            chat = lineformat.search(data[0][30:-2])
-            if chat:
-                self.chatqueue.put({'name': chat.group('name').strip(),
-                                    'steam': chat.group('steam').strip(),
-                                    'team': chat.group('team').strip(),
-                                    'type': chat.group('type').strip(),
-                                    'message': chat.group('message').strip()})
+            self.datagrams.inc()
+            now = time.time()
+            self.heard[data[1]] = now
+            event = parsers.parse_log_line(data[0][30:-2])
+            if event is None:
                 continue
+            self.events.labels(event.kind).inc()
+            self.eventqueue.put((data[1], event, now))
+            if event.kind in ('say', 'say_team') and event.value:
+                self.chatqueue.put({'name': event.name.strip(),
+                                    'steam': event.steamid,
+                                    'team': event.team,
+                                    'type': event.kind,
+                                    'message': event.value.strip(),
+                                    'address': data[1],
+                                    'time': now})
+    
+    def _worker_events(self):
+        while True:
+            (address, event, when) = self.eventqueue.get()
+            try:
+                self.bot.on_log_event(address, event, when)
+            except Exception as e:
+                self.bot.log.system('Could not handle log event %s: %s' % (event.kind, e))
+            self.eventqueue.task_done()
     
     def _worker_chat(self):
         while True:
             line = self.chatqueue.get()
-            if line['steam'] in self.bot.watches or line['message'].lower().find('admin') != -1:
+            try:
+                self.bot.chatlog.append(self.bot._log_source(line['address']), line, line['time'])
+                if self.chatqueue.empty():
+                    self.bot.chatlog.flush()
+            except (IOError, OSError) as e:
+                self.bot.log.system('Could not archive chat line: %s' % (e))
+            if self.bot.watches.contains(line['steam']) or line['message'].lower().find('admin') != -1:
                 self.public(self.fallbackconnect, '[CHAT] %s: %s' % (line['name'], line['message']))
                 self.bot.log.chat('%s: %s' % (line['name'], line['message']))
+                self.chatlines.labels('yes').inc()
+            else:
+                self.chatlines.labels('no').inc()
             self.chatqueue.task_done()
     
     def _worker_irc(self):
         lines = 0
         while True:
-            (conn, line) = self.ircqueue.get()
+            (priority, sequence, (conn, line, trace, queued)) = self.ircqueue.get()
             if not conn:
                 if self.fallbackconnect:
                     conn = self.fallbackconnect
                 else:
+                    self.bot.tracer.release(trace)
                     self.ircqueue.task_done()
                     continue
             if lines % 8 == 0:
                 time.sleep(2)
+            
+            started = time.time()
             conn.privmsg(self.bot.channel, line)
+            self.sent.inc()
+            if trace is not None:
+                trace.add('queued', started - queued)
+                trace.add('send', time.time() - started)
+                self.bot.tracer.release(trace)
             lines += 1
             self.ircqueue.task_done()
             time.sleep(0.2)
@@ -132,7 +365,17 @@ class Communicator:
         self.fallbackconnect = connect
 
     def notice(self, connection, event, message):
-        connection.notice(irclib.nm_to_n(event.source()), message)
+        with self.bot.tracer.phase('notice'):
+            connection.notice(irclib.nm_to_n(event.source()), message)
     
     def public(self, connection, message):
-        self.ircqueue.put((connection, message))
+        # Lines carry the trace of their command to the sender thread
+        trace = self.bot.tracer.current()
+        self.bot.tracer.hold(trace)
+        with self.bot.tracer.phase('enqueue'):
+            self.ircqueue.put((self.NORMAL, self.sequence.next(), (connection, message, trace, time.time())))
+    
+    def alert(self, message):
+        # Called from reactor timers, so it must never block: alerts jump
+        # the queue and are let in even when command output has filled it
+        self.ircqueue.put_urgent((self.URGENT, self.sequence.next(), (None, message, None, time.time())))
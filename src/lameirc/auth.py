@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import collections
+import hashlib
+import hmac
+import os
+import sys
+import threading
+import time
+
+SCHEME = 'pbkdf2_sha256'
+ITERATIONS = 100000
+
+class RateLimited(Exception):
+    pass
+
+def _bytes(s):
+    # Settings come from JSON as unicode, IRC messages as str
+    if isinstance(s, unicode):
+        return s.encode('utf-8')
+    return s
+
+def hash_password(password, iterations = ITERATIONS, salt = None):
+    """Returns 'pbkdf2_sha256$iterations$salt$hash' for password."""
+    if salt is None:
+        salt = os.urandom(16).encode('hex')
+    digest = hashlib.pbkdf2_hmac('sha256', _bytes(password), _bytes(salt), iterations).encode('hex')
+    return '%s$%d$%s$%s' % (SCHEME, iterations, salt, digest)
+
+def check_password(password, stored):
+    """Compares password with a stored PBKDF2 entry or a legacy unsalted
+    sha256 hex digest. Slow on purpose; keep off the reactor thread."""
+    password = _bytes(password)
+    stored = _bytes(stored)
+    parts = stored.split('$')
+    if len(parts) == 4 and parts[0] == SCHEME:
+        try:
+            iterations = int(parts[1])
+        except ValueError:
+            return False
+        return hmac.compare_digest(hash_password(password, iterations, parts[2]), stored)
+    return hmac.compare_digest(hashlib.sha256(password).hexdigest(), stored.lower())
+
+def needs_upgrade(stored, iterations = ITERATIONS):
+    parts = stored.split('$')
+    if len(parts) != 4 or parts[0] != SCHEME:
+        return True
+    try:
+        return int(parts[1]) < iterations
+    except ValueError:
+        return True
+
+class RateLimiter:
+    """Allows at most limit attempts per key within period seconds."""
+    def __init__(self, limit = 5, period = 60):
+        self.limit = limit
+        self.period = period
+        self.attempts = dict()
+        self.lock = threading.Lock()
+    
+    def allow(self, key):
+        now = time.time()
+        with self.lock:
+            attempts = self.attempts.setdefault(key, collections.deque())
+            while len(attempts) and attempts[0] <= now - self.period:
+                attempts.popleft()
+            if len(attempts) >= self.limit:
+                return False
+            attempts.append(now)
+            # Forget idle keys now and then so the table stays small
+            if len(self.attempts) > 1024:
+                for k in [k for k, v in self.attempts.items() if not len(v) or v[-1] <= now - self.period]:
+                    del self.attempts[k]
+            return True
+
+class Verifier:
+    """Checks passwords on a small executor of its own.
+    
+    Attempts are rate limited per hostmask and per account before any work
+    is queued, and the executor serializes attempts for the same account,
+    so a burst of logins costs at most a few KDF runs at a time and never
+    blocks the reactor. Successful checks are remembered for cache_ttl
+    seconds as an HMAC under a per-process key, so re-auths after a
+    reconnect skip the KDF without keeping plaintext passwords around.
+    """
+    def __init__(self, executor, iterations = ITERATIONS, per_host = 5, per_account = 10, period = 60,
+                 cache_size = 64, cache_ttl = 600, log = None):
+        self.executor = executor
+        self.iterations = iterations
+        self.hosts = RateLimiter(per_host, period)
+        self.accounts = RateLimiter(per_account, period)
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.log = log
+        
+        self.secret = os.urandom(32)
+        self.cache = collections.OrderedDict()
+        self.lock = threading.Lock()
+    
+    def verify(self, hostmask, account, password, stored, callback):
+        """Queues a check of password against stored; callback(ok, upgrade)
+        runs on a verifier thread, upgrade being a new hash to persist or
+        None. Raises RateLimited or executor.ExecutorFull."""
+        if not self.hosts.allow(hostmask) or not self.accounts.allow(account):
+            raise RateLimited('Too many authentication attempts.')
+        return self.executor.submit(account, self._verify, (account, password, stored, callback))
+    
+    def _verify(self, account, password, stored, callback):
+        key = hmac.new(self.secret, '\0'.join([_bytes(s) for s in (account, stored, password)]), hashlib.sha256).digest()
+        with self.lock:
+            expires = self.cache.pop(key, None)
+            if expires is not None and expires > time.time():
+                self.cache[key] = expires
+                ok = True
+            else:
+                ok = None
+        
+        if ok is None:
+            ok = check_password(password, stored)
+            if ok:
+                with self.lock:
+                    self.cache[key] = time.time() + self.cache_ttl
+                    while len(self.cache) > self.cache_size:
+                        self.cache.popitem(last = False)
+        
+        upgrade = None
+        if ok and needs_upgrade(stored, self.iterations):
+            upgrade = hash_password(password, self.iterations)
+        callback(ok, upgrade)
+
+if __name__ == '__main__':
+    # Prints a settings.cfg password entry: python -m lameirc.auth <password>
+    if len(sys.argv) != 2:
+        print('Usage: python -m lameirc.auth <password>')
+        sys.exit(1)
+    print(hash_password(sys.argv[1]))
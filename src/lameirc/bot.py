@@ -21,20 +21,43 @@
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
 # IN THE SOFTWARE.
 
-import hashlib
 import json
-import re
+import os
+import socket
+import stat
 import sys
+import threading
 import time
 
+import lameirc.a2s as a2s
+import lameirc.auth as auth
+import lameirc.breaker as breaker
+import lameirc.chatlog as chatlog
+import lameirc.config as config
+import lameirc.dispatch as dispatch
+import lameirc.parsers as parsers
 import lameirc.rcon as rcon
 import lameirc.assets as assets
+import lameirc.executor as executor
+import lameirc.history as history
+import lameirc.matching as matching
+import lameirc.metrics as metrics
+import lameirc.resolver as resolver
+import lameirc.roster as roster
+import lameirc.scheduler as scheduler
+import lameirc.sessions as sessions
+import lameirc.tracing as tracing
+import lameirc.watchlist as watchlist
 import irclib.ircbot as ircbot
 import irclib.irclib as irclib
 
 class SourceServerIRCBot(ircbot.SingleServerIRCBot):
-    def __init__(self):
-        self.basecfg = '../config/settings.cfg'
+    RCON_BATCH_LENGTH = 480
+    CONFIG_POLL_INTERVAL = 5
+    REACTOR_PROBE_INTERVAL = 5
+    
+    def __init__(self, basecfg = '../config/settings.cfg'):
+        self.basecfg = basecfg
         self.settings = self._read_config(self.basecfg)
         if self.settings is None:
             print('Failed to load settings file \'%s\'.' % (self.basecfg))
@@ -42,7 +65,8 @@ class SourceServerIRCBot(ircbot.SingleServerIRCBot):
 
         try:
             logfile = self.settings['base']['logfile']
-            self.log = assets.LogWrapper(logfile)
+            self.log = assets.LogWrapper(logfile, self.settings['base'].get('logformat', 'text'),
+                                         self.settings['base'].get('logrotate'))
         except IOError:
             print('Unable to initialize log target %s.' % (logfile))
             sys.exit(1)
@@ -51,6 +75,9 @@ class SourceServerIRCBot(ircbot.SingleServerIRCBot):
             sys.exit(1)
 
         self.log.system('### Bot launched.')
+        self.metrics = metrics.Registry()
+        self.tracer = tracing.Tracer(self.settings['base'].get('slowcommand', 1.0), log = self.log)
+        self.profiler = None
 
         try:
             nick = self.settings['irc']['nick']
@@ -58,7 +85,8 @@ class SourceServerIRCBot(ircbot.SingleServerIRCBot):
             port = self.settings['irc']['port']
             chan = self.settings['irc']['chan']
             
-            ircbot.SingleServerIRCBot.__init__(self, [(host, port)], nick, nick)
+            reconnect = self.settings['irc'].get('reconnect', 60)
+            ircbot.SingleServerIRCBot.__init__(self, [(host, port)], nick, nick, reconnect)
             self.channel = chan
             self.nick = nick
             self.log.system('IRC setup loaded.')
@@ -71,98 +99,357 @@ class SourceServerIRCBot(ircbot.SingleServerIRCBot):
         except KeyError as ke:
             self.log.system('Missing entry in settings file: \'%s\'. No users available.' % (ke))
 
+        self.reload_lock = threading.RLock()
+        self.watcher = config.ConfigWatcher(log = self.log)
+        self.watcher.watch(self.basecfg, self._reload_settings)
+        
         try:
             aclfile = self.settings['base']['aclfile']
-            self.acl = self._read_config(aclfile)
-            self.log.system('ACL loaded.')
+            self._load_acl(aclfile)
+            self.watcher.watch(aclfile, lambda: self._load_acl(aclfile))
         except KeyError as ke:
             print('Missing entry in settings file: \'%s\'.' % (ke))
             sys.exit(1)
         
         try:
             helpfile = self.settings['base']['helpfile']
-            self.help = self._read_config(helpfile)
-            self.log.system('Help file loaded.')
+            self._load_help(helpfile)
+            self.watcher.watch(helpfile, lambda: self._load_help(helpfile))
         except KeyError as ke:
             print('Missing entry in settings file: \'%s\'. No help available.' % (ke))
             self.help = {}
+        self._schedule(self.CONFIG_POLL_INTERVAL, self._watch_config)
         
         try:
             udpport = self.settings['base']['udplogport']
         except KeyError:
             udpport = 26999
             self.log.system('Falling back to default UDP log port.')
+        self.resolver = resolver.Resolver(self.settings['base'].get('dnsttl', 300), log = self.log)
+        watchfile = self.settings['base'].get('watchfile', os.path.join(os.path.dirname(os.path.abspath(logfile)), 'watchlist.txt'))
+        self.watches = watchlist.Watchlist(watchfile, log = self.log)
+        alerts = self.settings['base'].get('watchalerts', {})
+        self.alerts = None
+        if alerts.get('enabled', True):
+            self.alerts = watchlist.Alerts(self._schedule, self._post_alert,
+                                           alerts.get('debounce', 5), alerts.get('interval', 60))
+        chatdir = self.settings['base'].get('chatdir', os.path.join(os.path.dirname(os.path.abspath(logfile)), 'chat'))
+        self.chatlog = chatlog.ChatArchive(chatdir, log = self.log)
+        self.log_sources = dict()
+        historyfile = self.settings['base'].get('historyfile', os.path.join(os.path.dirname(os.path.abspath(logfile)), 'history.db'))
+        try:
+            self.history = history.PlayerHistory(historyfile, log = self.log)
+        except history.HistoryException as he:
+            self.log.system('%s; player history is disabled.' % (he))
+            self.history = None
+        self.rosters = dict()
+        self.roster_interval = self.settings['base'].get('rosterreconcile', 60)
         self.communicate = assets.Communicator(self, udp_log_port = udpport)
         
-        self.watches = []
+        workers = self.settings['base'].get('workers', 4)
+        timeout = self.settings['base'].get('commandtimeout', 30)
+        self.executor = executor.CommandExecutor(workers, timeout, log = self.log)
+        self.query = a2s.A2SClient(self.settings['base'].get('querytimeout', 2.0), log = self.log)
+        self.matchers = matching.PatternCache()
+        
         self._init_rcons()
-        self.auths = dict()
+        
+        self.samples = dict()
+        self.scheduler = scheduler.Scheduler(self._schedule, self._submit_scheduled,
+                                             self._run_scheduled, log = self.log)
+        self.scheduler.load(self.settings.get('schedule', {}), self.rcon)
+        self._schedule(max(self.roster_interval, 1), self._reconcile_rosters)
+        
+        session = self.settings['base'].get('session', {})
+        self.auths = sessions.SessionStore(self._schedule, session.get('idle', 3600),
+                                           session.get('lifetime', 86400), log = self.log)
+        
+        verifier = self.settings['base'].get('auth', {})
+        self.verifier = auth.Verifier(executor.CommandExecutor(verifier.get('workers', 2), 10, maxqueue = 2, log = self.log),
+                                      verifier.get('iterations', auth.ITERATIONS), verifier.get('perhost', 5),
+                                      verifier.get('peraccount', 10), verifier.get('period', 60), log = self.log)
+        
+        self._init_metrics()
+    
+    def _init_metrics(self):
+        registry = self.metrics
+        registry.gauge('lameirc_executor_queued', 'Commands queued or running on the executor.').set_function(self.executor.queued)
+        registry.gauge('lameirc_sessions', 'Authenticated IRC sessions.').set_function(lambda: len(self.auths))
+        registry.gauge('lameirc_watchlist_entries', 'Watched SteamIDs.').set_function(lambda: len(self.watches))
+        registry.gauge('lameirc_log_queued', 'Log records waiting for the writer.').set_function(self.log.queue.qsize)
+        registry.gauge('lameirc_log_dropped', 'Log records dropped because the writer fell behind.').set_function(lambda: self.log.dropped)
+        registry.gauge('lameirc_history_dropped', 'Player events dropped because the history writer fell behind.').set_function(
+            lambda: self.history.dropped if self.history is not None else 0)
+        self.commands_total = registry.counter('lameirc_commands_total', 'Channel commands by result.', ('command', 'result'))
+        self.command_seconds = registry.histogram('lameirc_command_duration_seconds', 'Handler run time of channel commands.', ('command',))
+        self.rcon_seconds = registry.histogram('lameirc_rcon_latency_seconds', 'RCON round trip time.', ('server',))
+        self.rcon_errors = registry.counter('lameirc_rcon_errors_total', 'Failed RCON commands.', ('server',))
+        self.watch_alerts = registry.counter('lameirc_watch_alerts_total', 'Alerts posted for watched players.')
+        self.roster_drift = registry.counter('lameirc_roster_drift_total', 'Players the log-driven roster had wrong at reconciliation.', ('server',))
+        
+        # The reactor: every IRC event and how late its timers run
+        self.irc_events = registry.counter('lameirc_irc_events_total', 'IRC events seen by the reactor.', ('type',))
+        self.reactor_lag = registry.gauge('lameirc_reactor_lag_seconds', 'How late the last reactor timer fired.')
+        self.connection.add_global_handler('all_events', self._count_event, -20)
+        self._schedule(self.REACTOR_PROBE_INTERVAL, self._probe_reactor, (time.time() + self.REACTOR_PROBE_INTERVAL,))
+        
+        port = self.settings['base'].get('metricsport')
+        if port is not None:
+            try:
+                self.metrics_server = metrics.MetricsServer(registry, port, self.settings['base'].get('metricshost', '127.0.0.1'), log = self.log)
+            except socket.error as se:
+                self.log.system('Could not serve metrics on port %d: %s' % (port, se))
     
-    def _auth_user(self, connection, event, account, passwdhash):
+    def _count_event(self, connection, event):
+        self.irc_events.labels(event.eventtype()).inc()
+    
+    def _schedule(self, delay, function, args = ()):
+        # Timers run inside irclib's process_timeout, where an exception would
+        # end process_forever and with it the bot; periodic callbacks re-arm
+        # before doing their work, so logging is all that is left to do
+        def guarded(*args):
+            try:
+                function(*args)
+            except Exception as e:
+                self.log.system('Timer %s failed: %s' % (getattr(function, '__name__', function), e))
+        self.connection.execute_delayed(delay, guarded, args)
+    
+    def _probe_reactor(self, expected):
+        now = time.time()
+        self.reactor_lag.set(max(now - expected, 0))
+        self._schedule(self.REACTOR_PROBE_INTERVAL, self._probe_reactor, (now + self.REACTOR_PROBE_INTERVAL,))
+    
+    def _auth_user(self, connection, event, account, password):
         if account not in self.users:
             self.log.system('"%s" tried to auth with non-existent account "%s"' % (irclib.nm_to_n(event.source()), account))
             return False
         
         try:
-            if self.users[account]['pass'] == passwdhash:
-                self.auths[event.source()] = {'account': account, 'authed': True, 'time': time.time()}
-                self.communicate.notice(connection, event, 'Authentication successful.')
-                self.log.system('"%s" authed as "%s" (acl level %d)' % (irclib.nm_to_n(event.source()), account, self.users[account]['aclid']))
+            stored = self.users[account]['pass']
+            aclid = self.users[account]['aclid']
         except KeyError as ke:
             self.log.system('Missing entry in settings file: \'%s\'. Could not authenticate user.' % (ke))
             self.communicate.notice(connection, event, 'Your account information is incomplete. Ask an admin to check the config file.')
-            
-    
-    def _check_acl(self, event, command):
-        target = self.acl
-        for c in command:
-            target = target[c]
+            return False
         
-        # 0 is free for all
-        if 0 in target:
-            return True
+        def done(ok, upgrade):
+            self._auth_done(connection, event, account, stored, aclid, ok, upgrade)
         
-        if event.source() not in self.auths:
-            return False
+        try:
+            self.verifier.verify(event.source(), account, password, stored, done)
+        except auth.RateLimited as rl:
+            self.log.system('"%s" rate limited authenticating as "%s".' % (irclib.nm_to_n(event.source()), account))
+            self.communicate.notice(connection, event, '%s Try again later.' % (rl))
+        except executor.ExecutorFull:
+            self.communicate.notice(connection, event, 'Authentication is busy, try again later.')
+        return True
+    
+    def _auth_done(self, connection, event, account, stored, aclid, ok, upgrade):
+        if not ok:
+            self.log.system('"%s" failed to auth as "%s".' % (irclib.nm_to_n(event.source()), account), user = account)
+            return
+        if self.users.get(account, {}).get('pass') != stored:
+            # Account changed by a reload while the check was running
+            return
+        
+        self.auths.login(event.source(), account)
+        self.communicate.notice(connection, event, 'Authentication successful.')
+        self.log.system('"%s" authed as "%s" (acl level %d)' % (irclib.nm_to_n(event.source()), account, aclid),
+                        user = account)
+        if upgrade is not None:
+            self._upgrade_password(account, stored, upgrade)
+    
+    def _upgrade_password(self, account, stored, upgrade):
+        with self.reload_lock:
+            settings = self._read_config(self.basecfg)
+            if settings is None or settings.get('users', {}).get(account, {}).get('pass') != stored:
+                return
+            settings['users'][account]['pass'] = upgrade
+            
+            temporary = '%s.tmp' % (self.basecfg)
+            try:
+                # The file holds RCON passwords; never let the copy be more
+                # readable than the original
+                mode = stat.S_IMODE(os.stat(self.basecfg).st_mode)
+                descriptor = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+                os.fchmod(descriptor, mode)
+                with os.fdopen(descriptor, 'w') as cfgfile:
+                    json.dump(settings, cfgfile, indent = 4, sort_keys = True)
+                os.rename(temporary, self.basecfg)
+            except (IOError, OSError) as e:
+                self.log.system('Could not upgrade password hash of "%s": %s' % (account, e))
+                return
             
-        if self.auths[event.source()]['authed'] \
-        and self.users[self.auths[event.source()]['account']]['aclid'] in target:
-            return True
-        return False
+            # Our own write must not look like an edit to the watcher
+            self.users[account]['pass'] = upgrade
+            self.watcher.touch(self.basecfg)
+            self.log.system('Upgraded password hash of "%s".' % (account))
+    
+    def _check_acl(self, event, command):
+        return self.commands.permissions.allowed(self._aclid(event), command)
+    
+    def _aclid(self, event):
+        session = self.auths.get(event.source(), touch = True)
+        if session is not None and session['authed']:
+            return self.users[session['account']]['aclid']
+        return 0
     
     def _init_rcons(self):
+        # Sessions are created unconnected and brought up on the executor, so
+        # startup never waits for a slow or unreachable game server
         self.rcon = dict()
+        self.breakers = dict()
+        self.rcon_ready = dict()
+        self.rcon_started = time.time()
+        self.rcon_lock = threading.Lock()
+        
         for identifier in self.settings['rcon']:
             try:
                 host = self.settings['rcon'][identifier]['host']
                 port = self.settings['rcon'][identifier]['port']
                 passwd = self.settings['rcon'][identifier]['pass']
-                self.rcon[identifier] = rcon.Rcon(host, port, passwd, log = self.log)
-                self.log.system('Initialized RCON for \'%s\'.' % (identifier))
-            except rcon.RconException as re:
-                self.log.system('RCON exception in \'%s\': %s' % (identifier, re))
+                self.rcon[identifier] = rcon.Rcon(host, port, passwd, log = self.log, lazy = True,
+                                                  resolver = self.resolver, registry = self.metrics, tracer = self.tracer)
+                self.breakers[identifier] = self._make_breaker()
+            except KeyError as ke:
+                self.log.system('Missing entry in settings file: \'%s\'. Could not initialize RCON for \'%s\'.' % (ke, identifier))
+        
+        for identifier in self.rcon:
+            if self.settings['rcon'][identifier].get('lazy', False):
+                self.log.system('RCON for \'%s\' connects on first use.' % (identifier))
+                continue
+            self.executor.submit(identifier, self._connect_rcon, (identifier,))
+    
+    def _make_breaker(self):
+        limits = self.settings['base'].get('breaker', {})
+        return breaker.CircuitBreaker(limits.get('threshold', 3), limits.get('cooldown', 30))
+    
+    def _connect_rcon(self, identifier):
+        try:
+            self.rcon[identifier].connect(self.executor.remaining())
+            ready = time.time() - self.rcon_started
+            self.log.system('Initialized RCON for \'%s\' after %.2fs.' % (identifier, ready))
+        except (rcon.RconException, socket.error) as re:
+            ready = None
+            self.breakers[identifier].failure()
+            self.log.system('RCON exception in \'%s\': %s' % (identifier, re))
+        
+        with self.rcon_lock:
+            self.rcon_ready[identifier] = ready
+            pending = [i for i in self.rcon if i not in self.rcon_ready and not self.settings['rcon'].get(i, {}).get('lazy', False)]
+            if len(pending):
+                return
+        
+        ready = sorted([(t, i) for (i, t) in self.rcon_ready.items() if t is not None])
+        failed = sorted([i for (i, t) in self.rcon_ready.items() if t is None])
+        report = '; '.join(['%s %.2fs' % (i, t) for (t, i) in ready])
+        self.log.system('RCON startup finished: %d ready, %d failed. Time to ready: %s%s'
+                        % (len(ready), len(failed), report or '-', failed and ' (failed: %s)' % (', '.join(failed)) or ''))
+    
+    def _load_acl(self, aclfile):
+        acl = self._read_config(aclfile)
+        if acl is None and hasattr(self, 'commands'):
+            self.log.system('Keeping previous ACL.')
+            return
+        
+        # Trie and permission index are built aside and swapped in one go
+        self.commands = dispatch.CommandTrie(acl, self)
+        self.acl = acl
+        self.log.system('ACL loaded (%d commands).' % (len(self.commands.commands)))
+    
+    def _load_help(self, helpfile):
+        help = self._read_config(helpfile)
+        if help is None:
+            help = getattr(self, 'help', {})
+        self.help = help
+        self.log.system('Help file loaded.')
+    
+    def _watch_config(self):
+        self._schedule(self.CONFIG_POLL_INTERVAL, self._watch_config)
+        with self.reload_lock:
+            self.watcher.check()
+    
+    def _reload_settings(self):
+        with self.reload_lock:
+            settings = self._read_config(self.basecfg)
+            if settings is None:
+                self.log.system('Keeping previous settings.')
+                return 'Settings file unreadable; nothing changed.'
+            
+            for section in ('base', 'irc'):
+                if settings.get(section) != self.settings.get(section):
+                    self.log.system('Changes to [%s] take effect after a restart.' % (section))
+            
+            summary = [self._reload_rcons(settings.get('rcon', {})),
+                       self._reload_users(settings.get('users', {}))]
+            reschedule = settings.get('schedule') != self.settings.get('schedule') or \
+                         sorted(settings.get('rcon', {})) != sorted(self.settings.get('rcon', {}))
+            self.settings = settings
+            if reschedule:
+                self.scheduler.load(settings.get('schedule', {}), self.rcon)
+            self.watcher.touch(self.basecfg)
+            return ' '.join(summary)
+    
+    def _reload_rcons(self, configs):
+        added, removed, changed, unchanged = config.diff(self.settings.get('rcon', {}), configs, ('host', 'port', 'pass'))
+        
+        rcons = dict(self.rcon)
+        breakers = dict(self.breakers)
+        for identifier in removed + changed:
+            # Entries that failed to initialize have no session to close
+            session = rcons.pop(identifier, None)
+            breakers.pop(identifier, None)
+            if session is not None:
+                # Close on the executor so a command still using the session finishes first
+                self._submit_quietly(identifier, session.close)
+            with self.rcon_lock:
+                self.rcon_ready.pop(identifier, None)
+            self.rosters.pop(identifier, None)
+        
+        connect = []
+        for identifier in added + changed:
+            try:
+                entry = configs[identifier]
+                rcons[identifier] = rcon.Rcon(entry['host'], entry['port'], entry['pass'], log = self.log,
+                                              lazy = True, resolver = self.resolver, registry = self.metrics,
+                                              tracer = self.tracer)
+                breakers[identifier] = self._make_breaker()
             except KeyError as ke:
                 self.log.system('Missing entry in settings file: \'%s\'. Could not initialize RCON for \'%s\'.' % (ke, identifier))
+                continue
+            if not entry.get('lazy', False):
+                connect.append(identifier)
+        
+        # Connect jobs look their session up by name, so swap first
+        self.rcon = rcons
+        self.breakers = breakers
+        for identifier in connect:
+            self._submit_quietly(identifier, self._connect_rcon, (identifier,))
+        self.log_sources = dict()
+        
+        message = 'RCON: %d added, %d removed, %d changed, %d kept.' % (len(added), len(removed), len(changed), len(unchanged))
+        self.log.system(message)
+        return message
+    
+    def _submit_quietly(self, identifier, function, args = ()):
+        try:
+            self.executor.submit(identifier, function, args)
+        except executor.ExecutorFull:
+            self.log.system('Too many pending commands for \'%s\', skipped %s.' % (identifier, function.__name__), server = identifier)
     
-    def _parse_rcon_players(self, result):
-        playerformat = re.compile(r'^#\s+?(\d+)\s+?"(.+?)"\s+?(STEAM_\S+).+?([\d.:]+)$', re.MULTILINE)
-        players = playerformat.findall(result)
-        pList = []
-        for p in players:
-            pList.append({'id': int(p[0]), 'name': p[1], 'steam': p[2], 'ip': p[3]})
-        return pList
-    
-    def _parse_rcon_status(self, result):
-        propertyformat = re.compile(r'^(\S+)\s*:\s+(.+?)$', re.MULTILINE)
-        properties = propertyformat.findall(result)
-        pList = dict()
-        for p in properties:
-            pList[p[0]] = p[1]
-        return pList
-    
-    def _parse_var(self, result):
-        varformat = re.compile(r'"\S+" = "(.+?)"')
-        return varformat.search(result).groups()[0]
+    def _reload_users(self, users):
+        added, removed, changed, unchanged = config.diff(self.users, users, ('pass', 'aclid'))
+        
+        # Only sessions of accounts that were removed or changed are dropped
+        for account in removed + changed:
+            for user in self.auths.logout_account(account):
+                if self.connection.is_connected():
+                    self.connection.notice(irclib.nm_to_n(user), 'Your account was changed. Please re-confirm your authentication.')
+        self.users = users
+        
+        message = 'Users: %d added, %d removed, %d changed, %d kept.' % (len(added), len(removed), len(changed), len(unchanged))
+        self.log.system(message)
+        return message
     
     def _prettify_time(self, diff):
         diff = int(diff)
@@ -184,7 +471,189 @@ class SourceServerIRCBot(ircbot.SingleServerIRCBot):
         if identifier not in self.rcon:
             raise assets.RconIdentifierError
         
-        return self.rcon[identifier].send(command)
+        timeout = self.executor.remaining()
+        if timeout == 0:
+            raise executor.CommandTimeout('Command deadline exceeded.')
+        
+        circuit = self.breakers[identifier]
+        deadline = circuit.before()
+        if timeout is not None:
+            deadline = min(deadline, timeout)
+        
+        started = time.time()
+        try:
+            # The session times its connect, send and recv as rcon-* phases
+            result = self.rcon[identifier].send(command, deadline)
+        except (rcon.RconException, socket.error):
+            circuit.failure()
+            self.rcon_errors.labels(identifier).inc()
+            raise
+        except Exception:
+            circuit.release()
+            raise
+        latency = time.time() - started
+        circuit.success(latency)
+        self.rcon_seconds.labels(identifier).observe(latency)
+        return result
+    
+    def on_log_event(self, address, event, when):
+        # Called on the Communicator's event thread for every parsed player event
+        server = self._log_source(address)
+        if self.history is not None:
+            self.history.record(server, event, when)
+        if server in self.rcon:
+            self._roster(server).apply(event, when)
+        if self.alerts is not None and event.kind in ('connect', 'name', 'team', 'disconnect') and self.watches.contains(event.steamid):
+            self._watch_event(server, event, when)
+    
+    def _watch_event(self, server, event, when):
+        name = event.name
+        if event.kind == 'connect':
+            what = 'connected'
+        elif event.kind == 'name':
+            what = 'renamed from %s' % (event.name)
+            name = event.value
+        elif event.kind == 'team':
+            if event.team == event.value:
+                return
+            what = 'joined %s' % (event.value)
+        else:
+            what = 'disconnected (%s)' % (event.value)
+        self.alerts.add(watchlist.steamid_key(event.steamid), server, name, what, when)
+    
+    def _post_alert(self, key, server, name, parts):
+        message = '[WATCH] %s (%d) on %s: %s' % (name, key, server, ', '.join(parts))
+        self.watch_alerts.inc()
+        self.log.system(message, server = server)
+        self.communicate.alert(message)
+    
+    def _log_source(self, address):
+        # Game servers send their logs from the game port, which is also the
+        # RCON port; fall back to the IP alone if that is unambiguous
+        if address in self.log_sources:
+            return self.log_sources[address]
+        
+        exact = []
+        host = []
+        for identifier, entry in self.settings['rcon'].items():
+            try:
+                ip = self.resolver.resolve(entry['host'])
+            except (socket.error, KeyError):
+                continue
+            if ip == address[0]:
+                host.append(identifier)
+                if entry.get('port') == address[1]:
+                    exact.append(identifier)
+        
+        source = 'unknown'
+        if len(exact) == 1:
+            source = exact[0]
+        elif len(host) == 1:
+            source = host[0]
+        else:
+            self.log.system('Cannot tell which server logs from %s:%d.' % address)
+        self.log_sources[address] = source
+        return source
+    
+    def _roster(self, identifier):
+        return self.rosters.setdefault(identifier, roster.Roster(identifier))
+    
+    def _reconcile_rosters(self):
+        self._schedule(max(self.roster_interval, 1), self._reconcile_rosters)
+        # Only servers that send their log keep a roster worth correcting;
+        # anything reconciled recently (by a command or a sample) can wait
+        now = time.time()
+        for identifier, entry in self.rosters.items():
+            if entry.updated is None or (entry.reconciled is not None and now - entry.reconciled < self.roster_interval / 2.0):
+                continue
+            try:
+                self.executor.submit(identifier, self._status_players, (identifier,), on_error = lambda error, i = identifier:
+                                     self.log.system('Could not reconcile players of \'%s\': %s' % (i, error), server = i))
+            except executor.ExecutorFull:
+                pass
+    
+    def _status_players(self, identifier, status = None):
+        # Every full status also corrects the roster
+        if status is None:
+            status = parsers.parse_status(self._rcon(identifier, 'status'))
+        drift = self._roster(identifier).reconcile(status.players)
+        if drift:
+            self.roster_drift.labels(identifier).inc(drift)
+        return status.players
+    
+    def _live_roster(self, identifier):
+        # The roster's index while the server's log keeps it current
+        if identifier not in self.rcon:
+            raise assets.RconIdentifierError
+        entry = self._roster(identifier)
+        if entry.live(self.roster_interval * 3, self.roster_interval, self._log_heard(identifier)):
+            return entry.index()
+        return None
+    
+    def _log_heard(self, identifier):
+        # When the last log datagram of any kind came in from the server
+        heard = [when for address, when in self.communicate.heard.items() if self._log_source(address) == identifier]
+        return max(heard) if len(heard) else None
+    
+    def _player_index(self, identifier):
+        index = self._live_roster(identifier)
+        if index is None:
+            index = matching.PlayerIndex(self._status_players(identifier))
+        return index
+    
+    def _query(self, identifier, kind):
+        # Read-only lookups go through A2S; None means "use RCON instead"
+        if identifier not in self.rcon:
+            raise assets.RconIdentifierError
+        
+        entry = self.settings['rcon'][identifier]
+        if not entry.get('query', True):
+            return None
+        
+        try:
+            address = (self.resolver.resolve(entry['host']), entry.get('queryport', entry['port']))
+            return getattr(self.query, kind)(address)
+        except (a2s.A2SException, socket.error) as e:
+            self.log.system('A2S %s query for \'%s\' failed, using RCON: %s' % (kind, identifier, e))
+        return None
+    
+    SCHEDULED_ACTIONS = {'rcon': '%s', 'say': 'say %s', 'exec': 'exec %s', 'writeid': 'writeid'}
+    
+    def _submit_scheduled(self, identifier, function, args, on_error):
+        return self.executor.submit(identifier, function, args, on_error = on_error)
+    
+    def _run_scheduled(self, task):
+        action = task.config.get('action', 'rcon')
+        if action == 'status':
+            status = parsers.parse_status(self._rcon(task.server, 'status'))
+            self.samples[task.server] = (time.time(), status)
+            self._status_players(task.server, status)
+            return
+        
+        if action not in self.SCHEDULED_ACTIONS:
+            raise scheduler.ScheduleError('Unknown action \'%s\'.' % (action))
+        if '%s' in self.SCHEDULED_ACTIONS[action]:
+            self._rcon(task.server, self.SCHEDULED_ACTIONS[action] % (task.config.get('args', '')))
+        else:
+            self._rcon(task.server, self.SCHEDULED_ACTIONS[action])
+    
+    def _rcon_batch(self, identifier, commands):
+        # Source accepts several commands per line separated by ';'; chunk so
+        # a single RCON packet stays well below the server's line limit.
+        results = []
+        batch = []
+        length = 0
+        for command in commands:
+            if len(batch) and length + len(command) + 1 > self.RCON_BATCH_LENGTH:
+                results.append(self._rcon(identifier, ';'.join(batch)))
+                batch = []
+                length = 0
+            batch.append(command)
+            length += len(command) + 1
+        
+        if len(batch):
+            results.append(self._rcon(identifier, ';'.join(batch)))
+        return results
      
     def _read_config(self, file):
         try:
@@ -192,70 +661,128 @@ class SourceServerIRCBot(ircbot.SingleServerIRCBot):
                 contents = json.load(cfgfile)
             return contents
         except ValueError:
-            self.log.system('Unable to read config \'%s\': Check syntax.')
+            self.log.system('Unable to read config \'%s\': Check syntax.' % (file))
+        except IOError as ioe:
+            self.log.system('Unable to read config \'%s\': %s' % (file, ioe))
         return None
 
     def on_pubmsg(self, connection, event):
-        cmdParts = event.arguments()[0].split()
-        if len(cmdParts) > 0 and cmdParts[0] == '.':
-            target = self.acl
-            key = None
-            last = 1
-            for arg in cmdParts[1:]:
-                try:
-                    target = target[arg]
-                    key = arg
-                    last += 1
-                except KeyError:
-                    break
-                except TypeError:
-                    break
-            try:
-                if key is not None and hasattr(self, 'cmd_%s' % (key)):
-                    authed = 'OK'
-                    account = ''
-                    if event.source() in self.auths:
-                        account = self.auths[event.source()]['account']
-                    
-                    if not self._check_acl(event, cmdParts[1:last]):
-                        self.communicate.notice(connection, event, 'Yout lack access to this command.')
-                        authed = 'DENIED'
-                    else:
-                        getattr(self, 'cmd_%s' % (key))(connection, event, cmdParts[1:last], cmdParts[last:])
-                    
-                    self.log.command('"%s" (%s): (%s) %s' % (irclib.nm_to_n(event.source()), account, authed, ' '.join(cmdParts[1:])))
-                    return
-            except TypeError as te:
-                print(te)
-                return
-            except assets.RconIdentifierError:
-                self.communicate.notice(connection, event, 'No rcon available for \'%s\'.' % (cmdParts[1]))
-                return
+        line = event.arguments()[0]
+        if line[:1] != '.':
+            return
+        
+        trace = self.tracer.start(line)
+        with self.tracer.phase('parse'):
+            cmdParts = line.split()
+            if cmdParts[0] == '.':
+                command, depth = self.commands.resolve(cmdParts[1:])
+        if cmdParts[0] != '.':
+            self.tracer.done(trace)
+            return
+        
+        if command is None or command.handler is None:
+            self.commands_total.labels('', 'unknown').inc()
             self.communicate.notice(connection, event, 'No such command. Try \'!sf help\' for an overview of available commands.')
+            self.tracer.done(trace)
+            return
+        
+        authed = 'OK'
+        account = ''
+        session = self.auths.get(event.source())
+        if session is not None:
+            account = session['account']
+        
+        with self.tracer.phase('authorize'):
+            allowed = self._check_acl(event, command)
+        if not allowed:
+            self.communicate.notice(connection, event, 'Yout lack access to this command.')
+            authed = 'DENIED'
+            self.tracer.done(trace)
+        elif self._dispatch(command.handler, connection, event, list(command.path), cmdParts[depth + 1:], trace) is None:
+            self.tracer.done(trace)
+        else:
+            # The executor job owns the trace from here
+            self.tracer.activate(None)
+        self.commands_total.labels(command.handler.__name__[4:], authed).inc()
+        
+        self.log.command('"%s" (%s): (%s) %s' % (irclib.nm_to_n(event.source()), account, authed, ' '.join(cmdParts[1:])),
+                         user = account or irclib.nm_to_n(event.source()), server = len(command.path) > 1 and command.path[0] or None)
+    
+    def _dispatch(self, handler, connection, event, command, args, trace = None):
+        # Server commands are serialized per server; global ones run freely
+        key = None
+        if len(command) > 1:
+            key = command[0]
+        
+        def on_error(error):
+            self._command_failed(connection, event, command, error)
+        
+        try:
+            return self.executor.submit(key, self._run_command, (handler, connection, event, command, args, trace), on_error = on_error)
+        except executor.ExecutorFull:
+            self.communicate.notice(connection, event, 'Too many pending commands for \'%s\', try again later.' % (key))
+    
+    def _run_command(self, handler, connection, event, command, args, trace = None):
+        self.tracer.activate(trace)
+        started = time.time()
+        try:
+            handler(connection, event, command, args)
+        finally:
+            elapsed = time.time() - started
+            self.command_seconds.labels(handler.__name__[4:]).observe(elapsed)
+            if trace is not None:
+                # Whatever the handler did besides RCON and sending is formatting
+                trace.add('format', max(elapsed - trace.total('rcon') - trace.total('notice') - trace.total('enqueue'), 0))
+            self.tracer.done(trace)
+    
+    def _command_failed(self, connection, event, command, error):
+        if isinstance(error, assets.RconIdentifierError):
+            self.communicate.notice(connection, event, 'No rcon available for \'%s\'.' % (command[0]))
+        elif isinstance(error, matching.PatternError):
+            self.communicate.public(connection, '%s' % (error))
+        elif isinstance(error, breaker.CircuitOpen):
+            self.communicate.notice(connection, event, '\'%s\' is unreachable: %s' % (command[0], error))
+        elif isinstance(error, executor.CommandTimeout):
+            self.communicate.notice(connection, event, 'Command timed out.')
+        elif isinstance(error, (rcon.RconException, socket.error)):
+            self.communicate.notice(connection, event, 'RCON error on \'%s\': %s' % (command[0], error))
+            self.log.rcon('Error in \'%s\': %s' % (' '.join(command), error), server = command[0])
+        else:
+            self.log.system('Command \'%s\' failed: %s' % (' '.join(command), error))
     
     def on_nick(self, connection, event):
         old = event.source()
         new = '%s!%s' % (event.target(),irclib.nm_to_uh(event.source()))
         
-        if old in self.auths:
-            self.auths[new] = self.auths[old]
-            del self.auths[old]
+        self.auths.rename(old, new)
     
     def on_part(self, connection, event):
-        if event.source() in self.auths:
-            del self.auths[event.source()]
+        self.auths.logout(event.source())
+    
+    def on_quit(self, connection, event):
+        self.auths.logout(event.source())
+    
+    def on_kick(self, connection, event):
+        nick = event.arguments()[0]
+        if irclib.irc_lower(nick) == irclib.irc_lower(connection.get_nickname()):
+            # Without the channel we no longer see quits and parts
+            self.log.system('Kicked from %s, dropped %d sessions.' % (event.target(), self.auths.clear()))
+        else:
+            self.auths.logout_nick(nick)
+    
+    def on_disconnect(self, connection, event):
+        self.log.system('Disconnected from IRC, dropped %d sessions.' % (self.auths.clear()))
     
     def on_privmsg(self, connection, event):
         args = event.arguments()[0].split()
         if len(args) == 3 and args[0].lower() == 'auth':
-            account = args[1]
-            passwdhash = hashlib.sha256(args[2]).hexdigest()
-            self._auth_user(connection, event, account, passwdhash)
+            self._auth_user(connection, event, args[1], args[2])
         
         if len(args) == 1 and args[0].lower() == 'whoami':
-            if event.source() in self.auths:
-                account = self.auths[event.source()]['account']
-                seconds = time.time() - self.auths[event.source()]['time']
+            session = self.auths.get(event.source())
+            if session is not None:
+                account = session['account']
+                seconds = time.time() - session['time']
                 self.communicate.notice(connection, event, 'You are authed as %s (%s).' % (account, self._prettify_time(seconds)))
             else:
                 self.communicate.notice(connection, event, 'You are not authed.')
@@ -268,6 +795,75 @@ class SourceServerIRCBot(ircbot.SingleServerIRCBot):
         self.communicate.set_fallback_connect(connection)
         self.log.system('Joined %s as %s.' % (self.channel, self.nick))
 
+    def cmd_chatlog(self, connection, event, command, args):
+        if len(command) < 2 or not len(args):
+            self.communicate.notice(connection, event, 'Usage: . <server> chatlog <steamid|name> [since, e.g. 2h, 3d or 2026-01-31]')
+            return
+        
+        since = None
+        if len(args) > 1:
+            since = self._parse_since(args[-1])
+            if since is not None:
+                args = args[:-1]
+        target = ' '.join(args)
+        
+        if watchlist.steamid_key(target) is not None:
+            lines, complete = self.chatlog.search(command[0], steamid = target, since = since)
+        else:
+            lines, complete = self.chatlog.search(command[0], name = target, since = since)
+        
+        if not len(lines):
+            self.communicate.public(connection, 'No chat lines of %s found on %s.' % (target, command[0]))
+            return
+        for line in lines:
+            self.communicate.public(connection, '[%s] %s (%s): %s' % (time.strftime('%d.%m. %H:%M', time.localtime(line.time)),
+                                                                    line.name, line.team, line.message))
+        if not complete:
+            self.communicate.public(connection, 'More lines available; narrow it down with since.')
+    
+    def _parse_since(self, value):
+        try:
+            return time.time() - scheduler.parse_duration(value)
+        except scheduler.ScheduleError:
+            pass
+        try:
+            return time.mktime(time.strptime(value, '%Y-%m-%d'))
+        except ValueError:
+            return None
+    
+    def cmd_aliases(self, connection, event, command, args):
+        for steamid in self._history_targets(connection, event, args):
+            self.communicate.public(connection, '%d: %s' % (steamid, ', '.join(self.history.aliases(steamid))))
+    
+    def cmd_alts_by_ip(self, connection, event, command, args):
+        for steamid in self._history_targets(connection, event, args):
+            alts = self.history.alts(steamid)
+            if not len(alts):
+                self.communicate.public(connection, '%d: no other accounts on the same IPs.' % (steamid))
+                continue
+            self.communicate.public(connection, '%d shares IPs with: %s'
+                                    % (steamid, ', '.join(['%s (%d, %s)' % (name, other, ip) for other, name, ip in alts])))
+    
+    def cmd_seen(self, connection, event, command, args):
+        for steamid in self._history_targets(connection, event, args):
+            name, server, first, last = self.history.seen(steamid)
+            played = ', '.join(['%dh on %s (%d sessions)' % (seconds / 3600, srv, count) for srv, seconds, count in self.history.playtime(steamid)])
+            self.communicate.public(connection, '%s (%d) was last seen on %s %s, first seen %s.%s'
+                                    % (name, steamid, server, self._prettify_time(time.time() - last) or time.strftime('on %Y-%m-%d', time.localtime(last)),
+                                       time.strftime('%Y-%m-%d', time.localtime(first)), played and ' Played %s.' % (played) or ''))
+    
+    def _history_targets(self, connection, event, args):
+        if self.history is None:
+            self.communicate.notice(connection, event, 'Player history is disabled, see the log.')
+            return []
+        if not len(args):
+            self.communicate.notice(connection, event, 'Usage: <steamid|name>')
+            return []
+        steamids = [s for s in self.history.resolve(' '.join(args)) if self.history.seen(s) is not None][:3]
+        if not len(steamids):
+            self.communicate.public(connection, 'Never seen %s.' % (' '.join(args)))
+        return steamids
+    
     def cmd_exec(self, connection, event, command, args):
         if len(args) == 1:
             file = args[0]
@@ -277,25 +873,14 @@ class SourceServerIRCBot(ircbot.SingleServerIRCBot):
             else:
                 self.communicate.public(connection, 'Config \'%s\' executed.' % (file))
     
+    def cmd_health(self, connection, event, command, args):
+        if command[0] not in self.breakers:
+            raise assets.RconIdentifierError
+        self.communicate.public(connection, '%s: %s' % (command[0], self.breakers[command[0]].health()))
+    
     def cmd_help(self, connection, event, command, args):
         if len(args) == 0:
-            acl_id = 0
-            if event.source() in self.auths and self.auths[event.source()]['authed']:
-                acl_id = self.users[self.auths[event.source()]['account']]['aclid']
-            
-            cmdlist = []
-            for cmd in self.acl:
-                if type(self.acl[cmd]) is type([]):
-                    if 0 in self.acl[cmd] or acl_id in self.acl[cmd] \
-                    and hasattr(self, 'cmd_%s' % (cmd)):
-                        cmdlist.append(cmd)
-                else:
-                    for subcmd in self.acl[cmd]:
-                        if 0 in self.acl[cmd][subcmd] or acl_id in self.acl[cmd][subcmd] \
-                        and hasattr(self, 'cmd_%s' % (subcmd)):
-                            cmdlist.append('%s %s' % (cmd, subcmd))
-            
-            cmdlist.sort()
+            cmdlist = self.commands.permissions.listing(self._aclid(event))
             self.communicate.notice(connection, event, 'You have access to:')
             self.communicate.notice(connection, event, ', '.join(cmdlist))
         else:
@@ -305,43 +890,43 @@ class SourceServerIRCBot(ircbot.SingleServerIRCBot):
                 self.communicate.notice(connection, event, 'No help available for command \'%s\'.' % (args[-1]))
     
     def cmd_kick(self, connection, event, command, args):
+        dryrun = len(args) == 2 and args[0] == '-n'
+        if dryrun:
+            args = args[1:]
+        
         if len(args) == 1:
-            players = self._parse_rcon_players(self._rcon(command[0], 'status'))
-            kicked = []
+            matcher = self.matchers.compile(args[0])
+            matches = matcher.select(self._player_index(command[0]))
             
-            arg_is_id = False
-            try:
-                arg_is_id = str(int(args[0])) == args[0]
-            except ValueError:
-                pass
+            if not len(matches):
+                self.communicate.public(connection, 'No matching player.')
+                return
             
-            if arg_is_id:
-                id = int(args[0])
-                for p in players:
-                    if p['id'] == id:
-                        self._rcon(command[0], 'kickid %d' % (p['id']))
-                        kicked.append(p['name'])
-            else:
-                try:
-                    pattern = re.compile(r'%s' % (args[0]), re.IGNORECASE)
-                except Exception:
-                    self.communicate.public(connection, 'Invalid regular expression.')
-                    return
-                for p in players:
-                    if pattern.search(p['name']):
-                        self._rcon(command[0], 'kickid %d' % (p['id']))
-                        kicked.append(p['name'])
+            if dryrun:
+                self.communicate.public(connection, 'Would kick (%d): %s' % (len(matches), ', '.join([p.name for p in matches])))
+                return
+            
+            self._rcon_batch(command[0], ['kickid %d' % (p.id) for p in matches])
+            
+            # Confirm against a single fresh status instead of trusting each reply
+            remaining = set([p.id for p in self._status_players(command[0])])
+            kicked = [p.name for p in matches if p.id not in remaining]
+            failed = [p.name for p in matches if p.id in remaining]
             
             if len(kicked):
                 self.communicate.public(connection, 'Kicked %s' % (', '.join(kicked)))
-            else:
-                self.communicate.public(connection, 'No matching player.')
+            if len(failed):
+                self.communicate.public(connection, 'Failed to kick %s' % (', '.join(failed)))
     
     def cmd_map(self, connection, event, command, args):
         message = ''
         if len(args) == 0:
-            status = self._parse_rcon_status(self._rcon(command[0], 'status'))
-            message = 'Current map is: %s' % (status['map'].split()[0])
+            info = self._query(command[0], a2s.A2SClient.INFO)
+            if info is not None:
+                message = 'Current map is: %s' % (info.map)
+            else:
+                status = parsers.parse_status(self._rcon(command[0], 'status')).properties
+                message = 'Current map is: %s' % (status['map'].split()[0])
         elif len(args) == 1:
             result = self._rcon(command[0], 'changelevel %s' % (args[0]))
             if len(result) > 0:
@@ -353,7 +938,7 @@ class SourceServerIRCBot(ircbot.SingleServerIRCBot):
     def cmd_password(self, connection, event, command, args):
         message = ''
         if len(args) == 0:
-            result = self._parse_var(self._rcon(command[0], 'sv_password'))
+            result = parsers.parse_var(self._rcon(command[0], 'sv_password'))
             message = 'Current password is: %s' % (result)
         elif len(args) == 1:
             result = self._rcon(command[0], 'sv_password %s' % (args[0]))
@@ -361,46 +946,80 @@ class SourceServerIRCBot(ircbot.SingleServerIRCBot):
         self.communicate.public(connection, message)
 
     def cmd_players(self, connection, event, command, args):
-        pattern = None
+        matcher = None
         if len(args) == 1:
-            try:
-                pattern = re.compile(r'%s' % (args[0]), re.IGNORECASE)
-            except Exception:
-                self.communicate.public(connection, 'Invalid regular expression.')
-                return
-                
-        players = self._parse_rcon_players(self._rcon(command[0], 'status'))
+            matcher = self.matchers.compile(args[0])
         
-        if pattern is not None:
-            matches = []
-            for p in players:
-                if pattern.search(p['name']):
-                    matches.append(p)
-            players = matches
+        # The live roster answers everything; without it A2S only knows
+        # names, and id, SteamID and IP lookups need RCON status
+        index = self._live_roster(command[0])
+        players = None
+        if index is None and (matcher is None or matcher.by_name):
+            players = self._query(command[0], a2s.A2SClient.PLAYERS)
+        
+        if players is not None:
+            # Players still connecting show up without a name
+            names = [p.name for p in players if p.name]
+            if matcher is not None:
+                names = matcher.names(names)
+        else:
+            if index is None:
+                index = matching.PlayerIndex(self._status_players(command[0]))
+            players = index.players
+            if matcher is not None:
+                players = matcher.select(index)
+            names = [p.name for p in players]
         
-        if len(players) == 0:
+        if len(names) == 0:
             self.communicate.public(connection, 'No players.')
             return
         
-        players.sort(key = lambda p: p['name'].lower())
-        self.communicate.public(connection, '(%d): %s' % (len(players), ', '.join(['%s' % (p['name']) for p in players])))
+        names.sort(key = lambda n: n.lower())
+        self.communicate.public(connection, '(%d): %s' % (len(names), ', '.join(names)))
 
+    def cmd_profile(self, connection, event, command, args):
+        if len(args) and args[0] == 'stop':
+            if self.profiler is None or not self.profiler.running():
+                self.communicate.notice(connection, event, 'No profiler running.')
+                return
+            self.profiler.stop()
+            return
+        
+        if self.profiler is not None and self.profiler.running():
+            self.communicate.notice(connection, event, 'A profiler is already running.')
+            return
+        try:
+            seconds = min(int(args[0]), 300) if len(args) else 30
+        except ValueError:
+            self.communicate.notice(connection, event, 'Usage: profile [seconds|stop]')
+            return
+        
+        directory = self.settings['base'].get('profiledir', os.path.dirname(os.path.abspath(self.settings['base']['logfile'])))
+        path = os.path.join(directory, time.strftime('profile-%Y%m%d-%H%M%S.txt'))
+        
+        def finished(profiler, error):
+            if error is not None:
+                self.log.system('Could not write profile: %s' % (error))
+                self.communicate.public(connection, 'Profiling finished, but the result could not be written.')
+                return
+            hotspots = ', '.join(['%s %d' % (where, count) for where, count in profiler.hotspots()[:3]])
+            self.log.system('Profile written to %s.' % (path))
+            self.communicate.public(connection, 'Profile written to %s (%d samples). Top: %s' % (path, profiler.samples, hotspots or '-'))
+        
+        self.profiler = tracing.SamplingProfiler(path)
+        self.profiler.start(seconds, finished)
+        self.communicate.public(connection, 'Profiling all threads for %d seconds.' % (seconds))
+    
     def cmd_reloadrcon(self, connection, event, command, args):
         self.log.system('Reloading RCON configurations.')
-        try:
-            self.rcon = self._read_config(self.basecfg)['rcon']
-        except KeyError as ke:
-            self.log.system('Missing entry in settings file: \'%s\'. No RCON available.' % (ke))
+        self.communicate.notice(connection, event, self._reload_settings())
     
     def cmd_reloadusers(self, connection, event, command, args):
         self.log.system('Reloading user configurations.')
-        for user in self.auths:
-            self.communicate.notice(connection, user, 'Users are being reloaded. Please re-confirm your authentication.')
-        self.auths = dict()
-        try:
-            self.users = self._read_config(self.basecfg)['users']
-        except KeyError as ke:
-            self.log.system('Missing entry in settings file: \'%s\'. No users available.' % (ke))
+        with self.reload_lock:
+            self.communicate.notice(connection, event, self._reload_settings())
+            self._load_acl(self.settings['base']['aclfile'])
+            self._load_help(self.settings['base']['helpfile'])
 
     def cmd_restart(self, connection, event, command, args):
         self.communicate.public(connection, 'Restarting server "%s".' % (command[0]))
@@ -410,27 +1029,55 @@ class SourceServerIRCBot(ircbot.SingleServerIRCBot):
         if len(args) >= 1:
             self._rcon(command[0], 'say %s' % (' '.join(args)))
 
+    def cmd_schedule(self, connection, event, command, args):
+        tasks = [t for t in self.scheduler.tasks if len(command) == 1 or t.server == command[0]]
+        if not len(tasks):
+            self.communicate.public(connection, 'Nothing scheduled.')
+            return
+        
+        jobs = dict()
+        for task in tasks:
+            jobs.setdefault(task.name, []).append(task)
+        now = time.time()
+        for name in sorted(jobs):
+            runs = sum([t.runs for t in jobs[name]])
+            due = min([t.due for t in jobs[name] if t.due is not None] or [now])
+            average = runs and sum([t.total for t in jobs[name]]) / runs or 0
+            self.communicate.public(connection, '%s (%d servers): next in %ds, %d runs (%d failed, %d skipped), avg %.2fs, max %.2fs'
+                                    % (name, len(jobs[name]), max(due - now, 0), runs, sum([t.failures for t in jobs[name]]),
+                                       sum([t.skipped for t in jobs[name]]), average, max([t.longest for t in jobs[name]])))
+    
     def cmd_servers(self, connection, event, command, args):
-        self.communicate.public(connection, 'Known servers are: %s' % (', '.join(self.rcon)))
+        offline = [i for i in self.rcon if self.rcon[i].socket is None]
+        message = 'Known servers are: %s' % (', '.join(self.rcon))
+        if len(offline):
+            message += ' (not connected: %s)' % (', '.join(sorted(offline)))
+        self.communicate.public(connection, message)
 
     def cmd_status(self, connection, event, command, args):
-        status = self._parse_rcon_status(self._rcon(command[0], 'status'))
+        info = self._query(command[0], a2s.A2SClient.INFO)
+        if info is not None:
+            self.communicate.public(connection, '%s' % (info.name))
+            self.communicate.public(connection, '%s, players: %d (%d max)' % (info.map, info.players, info.max_players))
+            return
+        
+        status = parsers.parse_status(self._rcon(command[0], 'status')).properties
         self.communicate.public(connection, '%s' % (status['hostname']))
         self.communicate.public(connection, '%s, players: %s' % (status['map'].split()[0], status['players']))
     
     def cmd_unwatch(self, connection, event, command, args):
         if len(args) == 1:
-            try:
-                pattern = re.compile(r'%s' % (args[0]), re.IGNORECASE)
-            except Exception:
-                self.communicate.public(connection, 'Invalid regular expression.')
+            matcher = self.matchers.compile(args[0])
+            if matcher.kind == 'steam' and self.watches.remove(args[0]):
+                # Known SteamIDs can be removed while the player is offline
+                self.communicate.public(connection, 'Removed %s from watchlist.' % (args[0]))
                 return
+            players = matcher.select(self._player_index(command[0]))
             
             matches = []
-            for p in self._parse_rcon_players(self._rcon(command[0], 'status')):
-                if pattern.search(p['name']) and p['steam'] in self.watches:
-                    self.watches.remove(p['steam'])
-                    matches.append(p['name'])
+            for p in players:
+                if self.watches.remove(p.steamid):
+                    matches.append(p.name)
             if len(matches) > 0:
                 matches.sort(key = lambda p: p.lower())
                 self.communicate.public(connection, 'Players removed from watchlist (%d): %s' % (len(matches), ', '.join(matches)))
@@ -439,17 +1086,13 @@ class SourceServerIRCBot(ircbot.SingleServerIRCBot):
     
     def cmd_watch(self, connection, event, command, args):
         if len(args) == 1:
-            try:
-                pattern = re.compile(r'%s' % (args[0]), re.IGNORECASE)
-            except Exception:
-                self.communicate.public(connection, 'Invalid regular expression.')
-                return
+            matcher = self.matchers.compile(args[0])
+            players = matcher.select(self._player_index(command[0]))
             
             matches = []
-            for p in self._parse_rcon_players(self._rcon(command[0], 'status')): 
-                if pattern.search(p['name']) and p['steam'] not in self.watches:
-                    self.watches.append(p['steam'])
-                    matches.append(p['name'])
+            for p in players:
+                if self.watches.add(p.steamid, command[0]):
+                    matches.append(p.name)
             if len(matches) > 0:
                 matches.sort(key = lambda p: p.lower())
                 self.communicate.public(connection, 'Players put on watchlist (%d): %s' % (len(matches), ', '.join(matches)))
@@ -457,21 +1100,16 @@ class SourceServerIRCBot(ircbot.SingleServerIRCBot):
                 self.communicate.public(connection, 'No matching players.')
     
     def cmd_watchlist(self, connection, event, command, args):
-        players = self._parse_rcon_players(self._rcon(command[0], 'status'))
-        
-        remove = []
-        active = []
-        for steamid in self.watches:
-            if steamid not in [p['steam'] for p in players]:
-                remove.append(steamid)
-            else:
-                active.append(filter(lambda p: p['steam'] == steamid, players)[0]['name'])
+        index = self._player_index(command[0])
         
-        for steamid in remove:
-            self.watches.remove(steamid)
+        watched = self.watches.snapshot
+        active = [p.name for key, p in index.by_steam.items() if key in watched]
+        offline = len(self.watches.on(command[0]) - set(index.by_steam))
         
         if len(active) > 0:
             active.sort(key = lambda p: p.lower())
             self.communicate.public(connection, 'Players on watchlist (%d): %s' % (len(active), ', '.join(active)))
         else:
             self.communicate.public(connection, 'No players on watchlist.')
+        if offline > 0:
+            self.communicate.public(connection, '%d watched players added here are offline.' % (offline))
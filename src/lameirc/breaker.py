@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import collections
+import threading
+import time
+
+class CircuitOpen(Exception):
+    pass
+
+class CircuitBreaker:
+    """Tracks RCON latency and failures of one server.
+    
+    The deadline for a call is derived from the observed p99 latency. After
+    threshold consecutive failures the circuit opens and calls fail fast;
+    once cooldown seconds have passed a single call is let through as a
+    probe (half-open) and its outcome closes or re-opens the circuit.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+    
+    def __init__(self, threshold = 3, cooldown = 30, window = 100, factor = 4.0, minimum = 2.0, maximum = 120):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.factor = factor
+        self.minimum = minimum
+        self.maximum = maximum
+        
+        self.samples = collections.deque(maxlen = window)
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.probing = False
+        self.calls = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+    
+    def before(self):
+        """Returns the deadline for the next call or raises CircuitOpen."""
+        with self.lock:
+            if self.state == self.OPEN:
+                if time.time() - self.opened < self.cooldown:
+                    raise CircuitOpen('Server unreachable, retrying in %ds.' % (self.cooldown - (time.time() - self.opened)))
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN:
+                if self.probing:
+                    raise CircuitOpen('Server unreachable, probe in progress.')
+                self.probing = True
+            return self._deadline()
+    
+    def success(self, latency):
+        with self.lock:
+            self.calls += 1
+            self.samples.append(latency)
+            self.failures = 0
+            self.probing = False
+            self.state = self.CLOSED
+    
+    def failure(self):
+        with self.lock:
+            self.calls += 1
+            self.errors += 1
+            self.failures += 1
+            self.probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                self.state = self.OPEN
+                self.opened = time.time()
+    
+    def release(self):
+        """Ends a call that failed for reasons of its own (e.g. a command
+        that could not be encoded); a probe is let through again."""
+        with self.lock:
+            self.probing = False
+    
+    def percentile(self, pct):
+        with self.lock:
+            return self._percentile(pct)
+    
+    def health(self):
+        with self.lock:
+            return '%s, p50 %.0fms, p99 %.0fms, deadline %.1fs, %d consecutive failures, %d/%d calls failed' \
+                % (self.state, self._percentile(50) * 1000, self._percentile(99) * 1000, self._deadline(),
+                   self.failures, self.errors, self.calls)
+    
+    def _percentile(self, pct):
+        if not len(self.samples):
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(int(len(ordered) * pct / 100.0), len(ordered) - 1)]
+    
+    def _deadline(self):
+        # Too few samples to trust; allow the full timeout
+        if len(self.samples) < 10:
+            return self.maximum
+        return min(max(self._percentile(99) * self.factor, self.minimum), self.maximum)
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import collections
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+
+import lameirc.watchlist as watchlist
+
+ChatLine = collections.namedtuple('ChatLine', 'time steamid team type name message')
+
+class ChatArchive:
+    """Every chat line, in append-only segments per server and day.
+    
+    <directory>/<server>/<YYYYMMDD>.log holds one tab separated line per
+    message: time, SteamID64, team, say/say_team, name, message. Next to it
+    <YYYYMMDD>.idx holds a 12 byte (SteamID64, offset) entry per line, so
+    a player's lines are found with a single scan of the index instead of
+    the segment. The day in the file name is the time index: a search only
+    opens segments from its since day on. Segments are searched through
+    mmap, newest first, until enough lines were found.
+    """
+    ENTRY = struct.Struct('<QI')
+    
+    def __init__(self, directory, log = None):
+        self.directory = directory
+        self.log = log
+        self.open = dict()
+        self.lock = threading.Lock()
+    
+    def append(self, server, line, when = None):
+        if when is None:
+            when = time.time()
+        key = watchlist.steamid_key(line['steam']) or 0
+        clean = lambda s: s.replace('\t', ' ').replace('\n', ' ')
+        record = '%d\t%d\t%s\t%s\t%s\t%s\n' % (when, key, clean(line['team']), clean(line['type']),
+                                               clean(line['name']), clean(line['message']))
+        day = time.strftime('%Y%m%d', time.localtime(when))
+        
+        with self.lock:
+            segment, index = self._segment(server, day)
+            offset = segment.tell()
+            segment.write(record)
+            index.write(self.ENTRY.pack(key, offset))
+    
+    def flush(self):
+        with self.lock:
+            for day, segment, index in self.open.values():
+                segment.flush()
+                index.flush()
+    
+    def _segment(self, server, day):
+        current = self.open.get(server)
+        if current is not None and current[0] == day:
+            return current[1], current[2]
+        if current is not None:
+            current[1].close()
+            current[2].close()
+        
+        directory = os.path.join(self.directory, server)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        segment = open(os.path.join(directory, '%s.log' % (day)), 'ab')
+        index = open(os.path.join(directory, '%s.idx' % (day)), 'ab')
+        # Append mode only seeks on write; make tell() right from the start
+        segment.seek(0, os.SEEK_END)
+        self.open[server] = (day, segment, index)
+        return segment, index
+    
+    def segments(self, server, since = None):
+        """Days with a segment for server, newest first."""
+        directory = os.path.join(self.directory, server)
+        if not os.path.isdir(directory):
+            return []
+        days = sorted([f[:-4] for f in os.listdir(directory) if f.endswith('.log')], reverse = True)
+        if since is not None:
+            first = time.strftime('%Y%m%d', time.localtime(since))
+            days = [d for d in days if d >= first]
+        return days
+    
+    def search(self, server, steamid = None, name = None, since = None, limit = 5):
+        """Newest lines of a player (by SteamID or name substring) first.
+        Returns (lines, complete), complete being False if more than limit
+        lines matched."""
+        self.flush()
+        key = steamid is not None and watchlist.steamid_key(steamid) or None
+        if steamid is not None and key is None:
+            return [], True
+        pattern = name is not None and re.compile(re.escape(name), re.IGNORECASE) or None
+        
+        found = []
+        for day in self.segments(server, since):
+            base = os.path.join(self.directory, server, day)
+            if key is not None:
+                offsets = self._offsets(base + '.idx', key)
+            else:
+                offsets = None
+            for line in reversed(self._read(base + '.log', offsets, pattern)):
+                if since is not None and line.time < since:
+                    continue
+                found.append(line)
+                if len(found) > limit:
+                    return found[:limit], False
+        return found, True
+    
+    def _offsets(self, path, key):
+        # Find the packed key at entry boundaries; str.find does the scanning
+        try:
+            with open(path, 'rb') as index:
+                data = index.read()
+        except IOError:
+            return []
+        needle = struct.pack('<Q', key)
+        offsets = []
+        position = data.find(needle)
+        while position != -1:
+            if position % self.ENTRY.size == 0 and position + self.ENTRY.size <= len(data):
+                offsets.append(self.ENTRY.unpack_from(data, position)[1])
+            position = data.find(needle, position + 1)
+        return offsets
+    
+    def _read(self, path, offsets, pattern):
+        try:
+            segment = open(path, 'rb')
+        except IOError:
+            return []
+        try:
+            if os.fstat(segment.fileno()).st_size == 0:
+                return []
+            data = mmap.mmap(segment.fileno(), 0, access = mmap.ACCESS_READ)
+        finally:
+            segment.close()
+        
+        try:
+            lines = []
+            if offsets is not None:
+                for offset in offsets:
+                    end = data.find('\n', offset)
+                    lines.append(self._parse(data[offset:end]))
+            else:
+                position = 0
+                while True:
+                    match = pattern.search(data, position)
+                    if match is None:
+                        break
+                    start = data.rfind('\n', 0, match.start()) + 1
+                    end = data.find('\n', match.end())
+                    if end == -1:
+                        end = len(data)
+                    line = self._parse(data[start:end])
+                    if line is not None and pattern.search(line.name):
+                        lines.append(line)
+                    position = end + 1
+            return [l for l in lines if l is not None]
+        finally:
+            data.close()
+    
+    def _parse(self, record):
+        fields = record.split('\t', 5)
+        if len(fields) != 6:
+            return None
+        try:
+            return ChatLine(int(fields[0]), int(fields[1]), fields[2], fields[3], fields[4], fields[5])
+        except ValueError:
+            return None
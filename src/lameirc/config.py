@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import os
+
+class ConfigWatcher:
+    """Remembers file modification times and calls a reload callback for
+    each file that changed since the last check."""
+    def __init__(self, log = None):
+        self.log = log
+        self.files = dict()
+        self.mtimes = dict()
+    
+    def watch(self, path, callback):
+        self.files[path] = callback
+        self.touch(path)
+    
+    def touch(self, path):
+        # Also used after writing a watched file ourselves, so that our own
+        # change does not trigger a reload
+        try:
+            self.mtimes[path] = os.path.getmtime(path)
+        except OSError:
+            self.mtimes[path] = None
+    
+    def check(self):
+        for path, callback in self.files.items():
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError as oe:
+                self._log('Cannot check \'%s\': %s' % (path, oe))
+                continue
+            if mtime != self.mtimes.get(path):
+                self.mtimes[path] = mtime
+                self._log('\'%s\' changed, reloading.' % (path))
+                callback()
+    
+    def _log(self, message):
+        if self.log:
+            self.log.system(message)
+
+def diff(old, new, fields = None):
+    """Compares two dicts of config entries and returns the keys that were
+    (added, removed, changed, unchanged); fields limits which values of an
+    entry count as a change."""
+    added = [k for k in new if k not in old]
+    removed = [k for k in old if k not in new]
+    changed = []
+    unchanged = []
+    for k in new:
+        if k not in old:
+            continue
+        if fields is None:
+            same = old[k] == new[k]
+        else:
+            same = [old[k].get(f) for f in fields] == [new[k].get(f) for f in fields]
+        if same:
+            unchanged.append(k)
+        else:
+            changed.append(k)
+    return added, removed, changed, unchanged
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+class Command:
+    def __init__(self, path, handler, acl):
+        self.path = path
+        self.handler = handler
+        self.acl = acl
+        self.bit = 0
+
+class PermissionIndex:
+    """Every command gets one bit; every acl level a mask of the commands it
+    may use, so an authorization check is a single AND. Acl level 0 marks a
+    command as free for all."""
+    def __init__(self, commands):
+        self.public = 0
+        self.levels = dict()
+        for bit, command in enumerate(commands):
+            command.bit = 1 << bit
+            for aclid in command.acl:
+                if aclid == 0:
+                    self.public |= command.bit
+                else:
+                    self.levels[aclid] = self.levels.get(aclid, 0) | command.bit
+        
+        # Precomputed "you have access to" lists, only for implemented commands
+        self.listings = dict()
+        for aclid in [0] + self.levels.keys():
+            mask = self.mask(aclid)
+            self.listings[aclid] = sorted([' '.join(c.path) for c in commands if c.bit & mask and c.handler is not None])
+    
+    def mask(self, aclid):
+        return self.public | self.levels.get(aclid, 0)
+    
+    def allowed(self, aclid, command):
+        return (self.public | self.levels.get(aclid, 0)) & command.bit != 0
+    
+    def listing(self, aclid):
+        return self.listings.get(aclid, self.listings[0])
+
+class CommandTrie:
+    """ACL tree compiled together with the bot's cmd_* methods.
+    
+    Every ACL leaf becomes a Command holding the resolved handler, so
+    dispatching a line is a walk of plain dict lookups over its tokens.
+    """
+    def __init__(self, acl, owner):
+        self.root = dict()
+        self.commands = []
+        self._compile(acl or {}, owner, self.root, ())
+        self.permissions = PermissionIndex(self.commands)
+    
+    def _compile(self, tree, owner, node, path):
+        for key, value in tree.items():
+            child = {'children': dict(), 'command': None}
+            node[key] = child
+            if isinstance(value, dict):
+                self._compile(value, owner, child['children'], path + (key,))
+            else:
+                handler = getattr(owner, 'cmd_%s' % (key.replace('-', '_')), None)
+                child['command'] = Command(path + (key,), handler, value)
+                self.commands.append(child['command'])
+    
+    def resolve(self, tokens):
+        """Returns the deepest command matching a prefix of tokens and the
+        number of tokens it consumed, or (None, 0)."""
+        node = self.root
+        found = (None, 0)
+        for depth, token in enumerate(tokens):
+            if token not in node:
+                break
+            child = node[token]
+            if child['command'] is not None:
+                found = (child['command'], depth + 1)
+            node = child['children']
+        return found
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import collections
+import Queue
+import threading
+import time
+
+class CommandTimeout(Exception):
+    pass
+
+class ExecutorFull(Exception):
+    pass
+
+class Job:
+    def __init__(self, key, function, args, deadline, on_error = None):
+        self.key = key
+        self.function = function
+        self.args = args
+        self.deadline = deadline
+        self.on_error = on_error
+        
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+    
+    def wait(self, timeout = None):
+        self.done.wait(timeout)
+        return self.done.is_set()
+
+class CommandExecutor:
+    """Runs jobs on a fixed pool of worker threads.
+    
+    Jobs sharing a key (e.g. an RCON identifier) are executed strictly one
+    after another, so a single hung server can occupy at most one worker.
+    Jobs submitted with key None run without serialization.
+    """
+    def __init__(self, workers = 4, timeout = 30, maxqueue = 16, log = None):
+        self.timeout = timeout
+        self.maxqueue = maxqueue
+        self.log = log
+        
+        self.ready = Queue.Queue()
+        self.pending = dict()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        
+        self.workers = []
+        for i in range(workers):
+            worker = threading.Thread(target = CommandExecutor._worker, args = (self,))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+    
+    def submit(self, key, function, args = (), timeout = None, on_error = None):
+        if timeout is None:
+            timeout = self.timeout
+        job = Job(key, function, args, time.time() + timeout, on_error)
+        
+        if key is not None:
+            with self.lock:
+                if key in self.pending:
+                    if len(self.pending[key]) >= self.maxqueue:
+                        raise ExecutorFull('Too many queued commands for \'%s\'' % (key))
+                    self.pending[key].append(job)
+                    return job
+                # Key present means a job for it is running; the deque holds the rest
+                self.pending[key] = collections.deque()
+        
+        self.ready.put(job)
+        return job
+    
+    def remaining(self):
+        """Seconds left until the deadline of the job running on this thread."""
+        job = getattr(self.local, 'job', None)
+        if job is None:
+            return None
+        return max(job.deadline - time.time(), 0)
+    
+    def queued(self, key = None):
+        with self.lock:
+            if key is None:
+                return self.ready.qsize() + sum([len(q) for q in self.pending.values()])
+            if key not in self.pending:
+                return 0
+            return len(self.pending[key]) + 1
+    
+    def _worker(self):
+        while True:
+            job = self.ready.get()
+            self.local.job = job
+            try:
+                if time.time() > job.deadline:
+                    raise CommandTimeout('Command expired before it could start.')
+                job.result = job.function(*job.args)
+            except Exception as e:
+                job.error = e
+                self._fail(job, e)
+            finally:
+                self.local.job = None
+                job.done.set()
+                self._release(job.key)
+                self.ready.task_done()
+    
+    def _fail(self, job, error):
+        if job.on_error:
+            try:
+                job.on_error(error)
+                return
+            except Exception as e:
+                error = e
+        self._log('Unhandled error in job for \'%s\': %s' % (job.key, error))
+    
+    def _release(self, key):
+        if key is None:
+            return
+        with self.lock:
+            if len(self.pending[key]):
+                self.ready.put(self.pending[key].popleft())
+            else:
+                del self.pending[key]
+    
+    def _log(self, message):
+        if self.log:
+            self.log.system(message)
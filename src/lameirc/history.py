@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import Queue
+import sqlite3
+import threading
+import time
+
+import lameirc.watchlist as watchlist
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS players (
+    steamid INTEGER PRIMARY KEY,
+    name TEXT COLLATE NOCASE,
+    server TEXT,
+    first_seen INTEGER,
+    last_seen INTEGER
+);
+CREATE TABLE IF NOT EXISTS aliases (
+    steamid INTEGER,
+    name TEXT COLLATE NOCASE,
+    first_seen INTEGER,
+    last_seen INTEGER,
+    PRIMARY KEY (steamid, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS aliases_name ON aliases (name, last_seen);
+CREATE TABLE IF NOT EXISTS ips (
+    steamid INTEGER,
+    ip TEXT,
+    first_seen INTEGER,
+    last_seen INTEGER,
+    PRIMARY KEY (steamid, ip)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ips_ip ON ips (ip);
+CREATE TABLE IF NOT EXISTS playtime (
+    steamid INTEGER,
+    server TEXT,
+    seconds INTEGER,
+    sessions INTEGER,
+    PRIMARY KEY (steamid, server)
+) WITHOUT ROWID;
+'''
+
+SEEN = '''INSERT INTO players (steamid, name, server, first_seen, last_seen) VALUES (?, ?, ?, ?, ?)
+          ON CONFLICT (steamid) DO UPDATE SET name = excluded.name, server = excluded.server, last_seen = excluded.last_seen'''
+ALIAS = '''INSERT INTO aliases (steamid, name, first_seen, last_seen) VALUES (?, ?, ?, ?)
+           ON CONFLICT (steamid, name) DO UPDATE SET last_seen = excluded.last_seen'''
+IP = '''INSERT INTO ips (steamid, ip, first_seen, last_seen) VALUES (?, ?, ?, ?)
+        ON CONFLICT (steamid, ip) DO UPDATE SET last_seen = excluded.last_seen'''
+PLAYTIME = '''INSERT INTO playtime (steamid, server, seconds, sessions) VALUES (?, ?, ?, 1)
+              ON CONFLICT (steamid, server) DO UPDATE SET seconds = seconds + excluded.seconds, sessions = sessions + 1'''
+
+class HistoryException(Exception):
+    pass
+
+class PlayerHistory:
+    """First/last seen, aliases, IPs and play time per server, in SQLite.
+    
+    record() only queues the event. A writer thread applies whatever has
+    queued up, at most batch events, in one transaction, so a burst of log
+    lines costs one commit instead of one per line. Queries run on the
+    caller's thread with a connection of its own; WAL mode lets them read
+    while the writer commits. Every lookup is served by a primary key or
+    an index (aliases by name, ips by address).
+    
+    When the queue is full events are dropped and counted, and the count is
+    logged once the writer catches up, as LogWrapper does. The upserts need
+    SQLite 3.24; with an older library, or a database that cannot be opened,
+    the constructor raises HistoryException.
+    """
+    def __init__(self, path, batch = 500, queuesize = 10000, log = None):
+        self.path = path
+        self.batch = batch
+        self.log = log
+        
+        self.queue = Queue.Queue(queuesize)
+        self.dropped = 0
+        self.reported = 0
+        self.lock = threading.Lock()
+        self.sessions = dict()
+        self.local = threading.local()
+        
+        if sqlite3.sqlite_version_info < (3, 24, 0):
+            raise HistoryException('SQLite %s is too old, player history needs 3.24 or newer' % (sqlite3.sqlite_version))
+        try:
+            connection = self._connection()
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.executescript(SCHEMA)
+            connection.commit()
+        except sqlite3.Error as e:
+            raise HistoryException('Could not open player history \'%s\': %s' % (path, e))
+        
+        self.writer = threading.Thread(target = PlayerHistory._writer, args = (self,))
+        self.writer.daemon = True
+        self.writer.start()
+    
+    def record(self, server, event, when = None):
+        try:
+            self.queue.put_nowait((when or time.time(), server, event))
+        except Queue.Full:
+            with self.lock:
+                self.dropped += 1
+    
+    def flush(self, timeout = 5):
+        done = threading.Event()
+        self.queue.put(done, timeout = timeout)
+        return done.wait(timeout) or done.is_set()
+    
+    def _connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout = 10)
+            connection.text_factory = str
+            self.local.connection = connection
+        return connection
+    
+    def _writer(self):
+        connection = self._connection()
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Queue.Empty:
+                    break
+            
+            waiting = [b for b in batch if not isinstance(b, tuple)]
+            events = [b for b in batch if isinstance(b, tuple)]
+            try:
+                with connection:
+                    for when, server, event in events:
+                        self._apply(connection, int(when), server, event)
+            except sqlite3.Error as e:
+                if self.log:
+                    self.log.system('Could not store %d player events: %s' % (len(events), e))
+            with self.lock:
+                dropped = self.dropped - self.reported
+                self.reported = self.dropped
+            if dropped and self.log:
+                self.log.system('Dropped %d player events under load (%d in total).' % (dropped, self.reported))
+            for done in waiting:
+                done.set()
+    
+    def _apply(self, connection, when, server, event):
+        steamid = watchlist.steamid_key(event.steamid)
+        if steamid is None:
+            return
+        
+        name = event.name
+        if event.kind == 'name':
+            connection.execute(ALIAS, (steamid, name, when, when))
+            name = event.value
+        connection.execute(SEEN, (steamid, name, server, when, when))
+        connection.execute(ALIAS, (steamid, name, when, when))
+        
+        if event.kind == 'connect':
+            ip = event.value.rsplit(':', 1)[0]
+            if ip and ip not in ('none', 'loopback'):
+                connection.execute(IP, (steamid, ip, when, when))
+            self.sessions[(server, steamid)] = when
+        elif event.kind == 'disconnect':
+            started = self.sessions.pop((server, steamid), None)
+            if started is not None:
+                connection.execute(PLAYTIME, (steamid, server, when - started))
+    
+    def resolve(self, target):
+        """SteamID64s for a SteamID in any notation or a name prefix, most
+        recently seen first."""
+        steamid = watchlist.steamid_key(target)
+        if steamid is not None:
+            return [steamid]
+        if not target:
+            return []
+        # A range on the NOCASE index instead of LIKE, which SQLite does not
+        # optimize for bound parameters
+        prefix = target.lower()
+        upper = prefix[:-1] + chr(min(ord(prefix[-1]) + 1, 255))
+        rows = self._connection().execute('''SELECT steamid FROM aliases WHERE name >= ? AND name < ?
+                                             GROUP BY steamid ORDER BY MAX(last_seen) DESC LIMIT 10''', (prefix, upper))
+        return [r[0] for r in rows]
+    
+    def seen(self, steamid):
+        """(name, server, first_seen, last_seen) or None."""
+        return self._connection().execute('SELECT name, server, first_seen, last_seen FROM players WHERE steamid = ?',
+                                          (steamid,)).fetchone()
+    
+    def aliases(self, steamid, limit = 10):
+        return [r[0] for r in self._connection().execute('''SELECT name FROM aliases WHERE steamid = ?
+                                                            ORDER BY last_seen DESC LIMIT ?''', (steamid, limit))]
+    
+    def playtime(self, steamid):
+        return self._connection().execute('SELECT server, seconds, sessions FROM playtime WHERE steamid = ? ORDER BY seconds DESC',
+                                          (steamid,)).fetchall()
+    
+    def alts(self, steamid, limit = 10):
+        """Other accounts that used one of steamid's IPs: (steamid, name, ip)."""
+        return self._connection().execute('''SELECT other.steamid, players.name, other.ip
+                                             FROM ips AS mine JOIN ips AS other ON other.ip = mine.ip
+                                             JOIN players ON players.steamid = other.steamid
+                                             WHERE mine.steamid = ? AND other.steamid != mine.steamid
+                                             ORDER BY other.last_seen DESC LIMIT ?''', (steamid, limit)).fetchall()
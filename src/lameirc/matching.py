@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import collections
+import fnmatch
+import re
+import sre_constants
+import sre_parse
+import threading
+import time
+
+import lameirc.watchlist as watchlist
+
+class PatternError(Exception):
+    pass
+
+IPV4_PREFIX = re.compile(r'^\d{1,3}\.[\d.]*$')
+
+class PlayerIndex:
+    """Lookup tables over one snapshot of Player records."""
+    def __init__(self, players):
+        self.players = list(players)
+        self.by_id = dict()
+        self.by_steam = dict()
+        self.names = []
+        for p in self.players:
+            self.by_id[p.id] = p
+            key = watchlist.steamid_key(p.steamid)
+            if key is not None:
+                self.by_steam[key] = p
+            self.names.append((p.name.lower(), p))
+
+class Matcher:
+    """A compiled player pattern; by_name tells whether it only looks at
+    names (and thus also works on name-only sources such as A2S)."""
+    def __init__(self, spec, kind, test, budget = None):
+        self.spec = spec
+        self.kind = kind
+        self.test = test
+        self.budget = budget
+        self.by_name = kind in ('substring', 'glob', 'regex')
+    
+    def select(self, index):
+        if self.kind == 'id':
+            return [index.by_id[self.test]] if self.test in index.by_id else []
+        if self.kind == 'steam':
+            return [index.by_steam[self.test]] if self.test in index.by_steam else []
+        if self.kind == 'ip':
+            return [p for p in index.players if p.ip and p.ip.startswith(self.test)]
+        return [p for (name, p) in self._filter(index.names)]
+    
+    def names(self, names):
+        return [n for (lowered, n) in self._filter([(n.lower(), n) for n in names])]
+    
+    def _filter(self, names):
+        if self.kind == 'substring':
+            return [entry for entry in names if self.test in entry[0]]
+        
+        # Regex and glob: the budget is only checked between names, so it
+        # caps a slow scan over many names but cannot stop one runaway
+        # search; keeping each search cheap is up to the step estimate
+        matches = []
+        started = time.time()
+        for entry in names:
+            if self.test(entry[0]):
+                matches.append(entry)
+            if self.budget is not None and time.time() - started > self.budget:
+                raise PatternError('Pattern exceeded its time budget.')
+        return matches
+
+class PatternCache:
+    """Compiles user supplied player patterns and caches the result.
+    
+    #12 or 12        player id
+    STEAM_0:1:2, [U:1:5], 7656...   SteamID in any notation
+    ip:10.0. or 10.0.               IP address prefix
+    /regex/ or re:regex             regular expression (case-insensitive)
+    foo*bar, fo?                    glob on the whole name
+    anything else                   case-insensitive substring
+    
+    Regular expressions are parsed first and rejected when backreferences
+    or an estimated worst case of more than max_steps backtracking steps per
+    name make them unsafe to run on the reactor or a worker.
+    """
+    def __init__(self, size = 128, max_steps = 100000, name_length = 32, budget = 0.25):
+        self.size = size
+        self.max_steps = max_steps
+        self.name_length = name_length
+        self.budget = budget
+        
+        self.cache = collections.OrderedDict()
+        self.lock = threading.Lock()
+    
+    def compile(self, spec):
+        with self.lock:
+            if spec in self.cache:
+                matcher = self.cache.pop(spec)
+                self.cache[spec] = matcher
+                return matcher
+        
+        matcher = self._compile(spec)
+        with self.lock:
+            self.cache[spec] = matcher
+            while len(self.cache) > self.size:
+                self.cache.popitem(last = False)
+        return matcher
+    
+    def _compile(self, spec):
+        if not spec:
+            raise PatternError('Empty pattern.')
+        
+        # SteamID64s are all digits too, so they go first
+        key = watchlist.steamid_key(spec)
+        if key is not None:
+            return Matcher(spec, 'steam', key)
+        
+        id = spec[1:] if spec[0] == '#' else spec
+        if id.isdigit():
+            return Matcher(spec, 'id', int(id))
+        
+        if spec.startswith('ip:'):
+            return Matcher(spec, 'ip', spec[3:])
+        if IPV4_PREFIX.match(spec):
+            return Matcher(spec, 'ip', spec)
+        
+        if len(spec) > 2 and spec[0] == '/' and spec[-1] == '/':
+            return self._regex(spec, spec[1:-1])
+        if spec.startswith('re:'):
+            return self._regex(spec, spec[3:])
+        
+        if set(spec) & set('*?['):
+            pattern = re.compile(fnmatch.translate(spec.lower()))
+            return Matcher(spec, 'glob', pattern.match, self.budget)
+        
+        return Matcher(spec, 'substring', spec.lower())
+    
+    def _regex(self, spec, expression):
+        try:
+            parsed = sre_parse.parse(expression, re.IGNORECASE)
+            # Every start position of the search may run the whole pattern
+            steps = self._steps(parsed) * self.name_length
+            pattern = re.compile(expression, re.IGNORECASE)
+        except (sre_constants.error, OverflowError, RuntimeError) as e:
+            raise PatternError('Invalid regular expression: %s' % (e))
+        
+        if steps > self.max_steps:
+            raise PatternError('Regular expression is too expensive.')
+        # Names are lower-cased before matching; IGNORECASE keeps the pattern in line
+        return Matcher(spec, 'regex', pattern.search, self.budget)
+    
+    def _steps(self, parsed):
+        # Rough cost of matching parsed once at one position of a name of
+        # name_length characters. Sequential elements add up; only a repeat
+        # multiplies its body, and a body that can split the input in more
+        # than one way makes the count exponential.
+        n = self.name_length
+        steps = 0
+        for op, av in parsed:
+            if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+                low, high, sub = av
+                inner = self._steps(sub)
+                width = sub.getwidth()
+                if high > 1 and (width[0] != width[1] or self._branches(sub)):
+                    # Variable-width or alternating body under a repeat: the
+                    # ways to split the input grow exponentially
+                    return 2 ** n
+                steps += max(min(high, n), 1) * inner
+            elif op == sre_constants.SUBPATTERN:
+                steps += self._steps(av[-1])
+            elif op == sre_constants.BRANCH:
+                steps += sum([self._steps(branch) for branch in av[1]])
+            elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+                steps += self._steps(av[1])
+            elif op in (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS):
+                raise PatternError('Backreferences are not supported.')
+            else:
+                steps += 1
+        return max(steps, 1)
+    
+    def _branches(self, parsed):
+        for op, av in parsed:
+            if op == sre_constants.BRANCH:
+                return True
+            if op == sre_constants.SUBPATTERN and self._branches(av[-1]):
+                return True
+        return False
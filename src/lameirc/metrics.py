@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import BaseHTTPServer
+import threading
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def _escape(value):
+    return ('%s' % (value)).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names, values, extra = ''):
+    pairs = ['%s="%s"' % (n, _escape(v)) for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % (','.join(pairs))
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else '%d' % (value)
+
+class Metric:
+    """Base of all metric types; one child per set of label values."""
+    TYPE = None
+    
+    def __init__(self, name, help, labels = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.children = dict()
+        self.lock = threading.Lock()
+        if not self.labelnames:
+            self.labels()
+    
+    def labels(self, *values):
+        values = tuple(values)
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self._child())
+        return child
+    
+    def expose(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s %s' % (self.name, self.TYPE)]
+        for values, child in sorted(self.children.items()):
+            lines.extend(self._expose(values, child))
+        return lines
+
+class _Value:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+    
+    def inc(self, amount = 1):
+        with self.lock:
+            self.value += amount
+    
+    def dec(self, amount = 1):
+        with self.lock:
+            self.value -= amount
+    
+    def set(self, value):
+        self.value = value
+    
+    def get(self):
+        return self.value
+
+class _Callback:
+    def __init__(self, function):
+        self.function = function
+    
+    def get(self):
+        return self.function()
+
+class Counter(Metric):
+    TYPE = 'counter'
+    
+    def _child(self):
+        return _Value()
+    
+    def inc(self, amount = 1):
+        self.labels().inc(amount)
+    
+    def _expose(self, values, child):
+        return ['%s%s %s' % (self.name, _labels(self.labelnames, values), _number(child.get()))]
+
+class Gauge(Counter):
+    """A value that goes up and down, or is read from function on scrape."""
+    TYPE = 'gauge'
+    
+    def set(self, value):
+        self.labels().set(value)
+    
+    def set_function(self, function, *values):
+        with self.lock:
+            self.children[tuple(values)] = _Callback(function)
+    
+    def _expose(self, values, child):
+        try:
+            value = child.get()
+        except Exception:
+            return []
+        return ['%s%s %s' % (self.name, _labels(self.labelnames, values), _number(value))]
+
+class _Buckets:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+    
+    def observe(self, value):
+        index = 0
+        while index < len(self.bounds) and value > self.bounds[index]:
+            index += 1
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+class Histogram(Metric):
+    TYPE = 'histogram'
+    
+    def __init__(self, name, help, labels = (), buckets = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        Metric.__init__(self, name, help, labels)
+    
+    def _child(self):
+        return _Buckets(self.buckets)
+    
+    def observe(self, value):
+        self.labels().observe(value)
+    
+    def _expose(self, values, child):
+        with child.lock:
+            counts = list(child.counts)
+            total = child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            lines.append('%s_bucket%s %d' % (self.name, _labels(self.labelnames, values, 'le="%s"' % (_number(bound))), cumulative))
+        lines.append('%s_sum%s %s' % (self.name, _labels(self.labelnames, values), repr(total)))
+        lines.append('%s_count%s %d' % (self.name, _labels(self.labelnames, values), cumulative))
+        return lines
+
+class Registry:
+    """Holds all metrics of the process. Asking for a metric that already
+    exists returns the existing one, so every module can declare what it
+    updates without coordinating with the others."""
+    def __init__(self):
+        self.metrics = dict()
+        self.lock = threading.Lock()
+    
+    def counter(self, name, help, labels = ()):
+        return self._get(Counter, name, help, labels)
+    
+    def gauge(self, name, help, labels = ()):
+        return self._get(Gauge, name, help, labels)
+    
+    def histogram(self, name, help, labels = (), buckets = LATENCY_BUCKETS):
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = Histogram(name, help, labels, buckets)
+            return self.metrics[name]
+    
+    def _get(self, type, name, help, labels):
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = type(name, help, labels)
+            return self.metrics[name]
+    
+    def exposition(self):
+        with self.lock:
+            metrics = sorted(self.metrics.items())
+        lines = []
+        for name, metric in metrics:
+            lines.extend(metric.expose())
+        return '\n'.join(lines) + '\n'
+
+class MetricsServer:
+    """Serves a registry in the Prometheus text format on /metrics."""
+    def __init__(self, registry, port, host = '127.0.0.1', log = None):
+        self.registry = registry
+        self.log = log
+        
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split('?')[0] != '/metrics':
+                    handler.send_error(404)
+                    return
+                body = registry.exposition()
+                handler.send_response(200)
+                handler.send_header('Content-Type', 'text/plain; version=0.0.4')
+                handler.send_header('Content-Length', '%d' % (len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+            
+            def log_message(handler, format, *args):
+                pass
+        
+        self.server = BaseHTTPServer.HTTPServer((host, port), Handler)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target = self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        if self.log:
+            self.log.system('Metrics served on http://%s:%d/metrics' % (host, self.port))
+    
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
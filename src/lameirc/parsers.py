@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import collections
+import re
+
+Player = collections.namedtuple('Player', 'id name steamid ip ping loss state connected')
+Status = collections.namedtuple('Status', 'properties players')
+
+# One scan over the whole output: each match is either a header property
+# ('key : value') or a player row '# userid [slot] "name" uniqueid ...'. The
+# slot and rate columns only exist in CS:GO-era builds; uniqueid is
+# STEAM_X:Y:Z, [U:1:N] or BOT, and bots only list their state.
+STATUS = re.compile(r'''
+    ^(?:
+        \#[ \t]*(\d+)[ \t]+(?:\d+[ \t]+)?"(.*)"[ \t]+(\S+)[ \t]+
+        (?:
+            ([\d:]+)[ \t]+(\d+)[ \t]+(\d+)[ \t]+(\w+)[ \t]+(?:\d+[ \t]+)?([^\s:]+)\S*
+            |(\w+).*?
+        )
+        |([^\s#:]+)[ \t]*:[ \t]+(.+?)
+    )[ \t]*$''', re.MULTILINE | re.VERBOSE)
+VAR = re.compile(r'"\S+" = "(.*?)"')
+
+def _seconds(connected):
+    seconds = 0
+    for part in connected.split(':'):
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+def parse_status(result):
+    """Parses the output of 'status' into its header properties and a list
+    of Player records."""
+    properties = dict()
+    players = []
+    
+    for id, name, steamid, connected, ping, loss, state, ip, botstate, key, value in STATUS.findall(result):
+        if key:
+            properties[key] = value
+        elif connected:
+            players.append(Player(int(id), name, steamid, ip, int(ping), int(loss), state, _seconds(connected)))
+        else:
+            players.append(Player(int(id), name, steamid, None, None, None, botstate, None))
+    
+    return Status(properties, players)
+
+def parse_players(result):
+    return parse_status(result).players
+
+def parse_var(result):
+    return VAR.search(result).groups()[0]
+
+LogEvent = collections.namedtuple('LogEvent', 'kind name userid steamid team value')
+
+# '"Name<userid><uniqueid><team>" rest' from the UDP log; the name may
+# contain anything, so it is anchored on the three fields after it
+LOG_PLAYER = re.compile(r'^"(.*)<(-?\d+)><([^<>]*)><([^<>]*)>" (.*)$', re.DOTALL)
+LOG_ACTIONS = (
+    ('say', re.compile(r'^say "(.*)"$', re.DOTALL)),
+    ('say_team', re.compile(r'^say_team "(.*)"$', re.DOTALL)),
+    ('connect', re.compile(r'^connected, address "(.*)"$')),
+    ('enter', re.compile(r'^entered the game()$')),
+    ('disconnect', re.compile(r'^disconnected \(reason "(.*)"\)$', re.DOTALL)),
+    ('team', re.compile(r'^joined team "(.*)"$')),
+    ('name', re.compile(r'^changed name to "(.*)"$')),
+)
+
+def parse_log_line(line):
+    """Parses the player events of a server log line (chat, connect,
+    entered, disconnect, team and name changes) into a LogEvent; returns
+    None for everything else. value holds the message, address, reason,
+    new team or new name."""
+    match = LOG_PLAYER.match(line)
+    if match is None:
+        return None
+    name, userid, steamid, team, rest = match.groups()
+    for kind, action in LOG_ACTIONS:
+        found = action.match(rest)
+        if found:
+            return LogEvent(kind, name, int(userid), steamid, team, found.group(1))
+    return None
@@ -23,7 +23,9 @@
 
 import socket
 import struct
-import select
+
+import lameirc.metrics as metrics
+import lameirc.tracing as tracing
 
 class RconException(Exception):
     pass
@@ -35,9 +37,18 @@ class Rcon:
     SERVERDATA_RESPONSE_VALUE = 0
     SERVERDATA_AUTH_RESPONSE = 2
     
-    def __init__(self, host, port = 27015, rcon_password = None, timeout = 120, log = None):
+    HEADER = struct.Struct('<lll')
+    
+    # Servers split responses into packets of at most 4096 body bytes; the
+    # buffer holds several of them so one recv_into can decode many frames
+    BUFFER_SIZE = 65536
+    
+    def __init__(self, host, port = 27015, rcon_password = None, timeout = 120, log = None, lazy = False, resolver = None,
+                 registry = None, tracer = None):
         self.socket = None
-        self.ip = socket.gethostbyname(host)
+        self.host = host
+        self.ip = None
+        self.resolver = resolver
         self.port = port
         self.rcon_password = rcon_password
         self.timeout = timeout
@@ -46,89 +57,206 @@ class Rcon:
         self.request_id = 0
         self.authenticated = False
         
-        self._connect()
+        self.buffer = bytearray(self.BUFFER_SIZE)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+        
+        if registry is None:
+            registry = metrics.Registry()
+        if tracer is None:
+            tracer = tracing.Tracer()
+        self.tracer = tracer
+        target = '%s:%s' % (host, port)
+        self.target = target
+        self.connects = registry.counter('lameirc_rcon_connects_total', 'RCON sessions established.', ('target',)).labels(target)
+        self.drops = registry.counter('lameirc_rcon_drops_total', 'RCON sessions dropped after an error.', ('target',)).labels(target)
+        self.received = registry.counter('lameirc_rcon_received_bytes_total', 'Bytes read from RCON sessions.', ('target',)).labels(target)
+        
+        if not lazy:
+            self._connect()
     
     def __del__(self):
         self._disconnect()
     
-    def _connect(self):
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.settimeout(self.timeout)
-        self.socket.connect((self.ip, self.port))
+    def connect(self, timeout = None):
+        if self.socket is None:
+            self._connect(timeout)
+    
+    def close(self):
+        self._disconnect()
+    
+    def _connect(self, timeout = None):
+        if timeout is None or timeout > self.timeout:
+            timeout = self.timeout
         
-        if self.rcon_password:
-            self._authenticate()
-        else:
-            raise RconException('No RCON password given')
+        try:
+            if self.resolver:
+                self.ip = self.resolver.resolve(self.host)
+            else:
+                self.ip = socket.gethostbyname(self.host)
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.settimeout(timeout)
+            self.socket.connect((self.ip, self.port))
+            
+            if self.rcon_password:
+                self._authenticate()
+            else:
+                raise RconException('No RCON password given')
+            self.socket.settimeout(self.timeout)
+            self.connects.inc()
+        except Exception:
+            # Leave no half-open session behind; the next call starts over
+            self._disconnect()
+            raise
     
     def _disconnect(self):
         if self.socket:
             self.socket.close()
+            self.socket = None
+        self.authenticated = False
+        self.start = self.end = 0
     
     def _authenticate(self):
-        self._send(self.rcon_password, type = self.SERVERDATA_AUTH)
-        
-        if self._recv() != '' and self.authenticated == False:
-            raise RconException('IP is banned')
+        self._send(self._packet(self.rcon_password, self.SERVERDATA_AUTH)[1], retry = False)
         
-        # Receive empty packet after authentication
-        self._recv()
+        # An empty SERVERDATA_RESPONSE_VALUE precedes the actual auth response
+        while True:
+            try:
+                request_id, response_code, body = self._read_packet()
+            except RconException:
+                raise RconException('IP is banned')
+            
+            if response_code == self.SERVERDATA_AUTH_RESPONSE:
+                if request_id == -1:
+                    raise RconException('Bad RCON password.')
+                self.authenticated = True
+                self._log('Authentication successful at %s:%d.' % (self.ip, self.port))
+                return
     
-    def _send(self, command, type = SERVERDATA_EXECCOMMAND):
+    def _packet(self, command, type = SERVERDATA_EXECCOMMAND):
         self.request_id += 1
         
         fullcmd = (command + '\x00\x00').encode('latin-1')
-        packet = struct.pack('<LLL', len(fullcmd) + 8, self.request_id, type) + fullcmd
-        
+        return self.request_id, struct.pack('<lll', len(fullcmd) + 8, self.request_id, type) + fullcmd
+    
+    def _send(self, data, retry = True):
+        # A dead session is only noticed on write; reconnect once and write
+        # the same packet again
         try:
-            self.socket.send(packet)
+            self.socket.sendall(data)
         except socket.error:
+            if not retry:
+                raise
+            self.drops.inc()
+            self._disconnect()
             self._connect()
-            self._send(command, type) #retry
+            self.socket.sendall(data)
+    
+    def _fill(self, count):
+        # Make sure at least count unread bytes are buffered, reading as much
+        # as the socket has available per call
+        if self.start + count > len(self.buffer):
+            pending = self.end - self.start
+            if count > len(self.buffer):
+                buffer = bytearray(count)
+                buffer[:pending] = self.view[self.start:self.end]
+                self.buffer = buffer
+                self.view = memoryview(self.buffer)
+            else:
+                self.buffer[:pending] = self.view[self.start:self.end]
+            self.start = 0
+            self.end = pending
+        
+        while self.end - self.start < count:
+            received = self.socket.recv_into(self.view[self.end:], len(self.buffer) - self.end)
+            if received == 0:
+                raise RconException('Connection closed by server.')
+            self.end += received
+            self.received.inc(received)
     
-    def _recv(self):
-        response = b''
+    def _frame(self):
+        # Buffers the next whole packet and returns its ids and where it
+        # ends; the smallest valid packet is 14 bytes, so the full header is
+        # safe to wait for
+        if self.end - self.start < self.HEADER.size:
+            self._fill(self.HEADER.size)
+        size, request_id, response_code = self.HEADER.unpack_from(self.buffer, self.start)
+        if size < 10:
+            raise RconException('Invalid packet size: %d' % (size))
         
+        end = self.start + 4 + size
+        if end > self.end:
+            self._fill(4 + size)
+            end = self.start + 4 + size
+        return request_id, response_code, end
+    
+    def _consume(self, end):
+        if end == self.end:
+            self.start = self.end = 0
+        else:
+            self.start = end
+    
+    def _read_packet(self):
+        request_id, response_code, end = self._frame()
+        body = self.view[self.start + 12:end - 2].tobytes()
+        self._consume(end)
+        return request_id, response_code, body
+    
+    def _recv(self, request_id, sentinel):
+        # Bodies are appended to a single string; CPython grows it in place,
+        # where collecting the packets and joining them copied every byte
+        # once more
+        reply = b''
+        
+        # Read until the reply to the empty sentinel command shows up; it is
+        # only sent after every packet of the actual response.
         while True:
-            recv_buffer = b''
+            response_id, response_code, end = self._frame()
             
-            try:
-                size, request_id, response_code = struct.unpack('<LLL', self.socket.recv(12))
-            except struct.error:
-                self._log('Packet too short, retrying connection and authentication.')
-                self._disconnect()
-                self._connect()
-                return
-            
-            while len(recv_buffer) + 8 < size:
-                recv_buffer += self.socket.recv(size - len(recv_buffer))
-            
-            if hex(request_id) == '0xffffffff':
+            if response_id == sentinel:
+                self._consume(end)
+                break
+            elif response_id == -1:
                 raise RconException('Bad RCON password.')
-            elif request_id != self.request_id:
-                raise RconException('Received bad request id: %d (expected %d)' % (request_id, self.request_id))
-            
-            if response_code == self.SERVERDATA_AUTH_RESPONSE:
-                self.authenticated = True
-                self._log('Authentication successful at %s:%d.' % (self.ip, self.port))
+            elif response_id != request_id:
+                raise RconException('Received bad request id: %d (expected %d)' % (response_id, request_id))
             elif response_code != self.SERVERDATA_RESPONSE_VALUE:
                 raise RconException('Invalid RCON response code: %d' % (response_code))
-
-            response += recv_buffer[:size - 2]
             
-            # Socket still has data to read?
-            poll = select.select([self.socket], [], [], 0)
-            if not len(poll[0]):
-                break
+            reply += self.view[self.start + 12:end - 2].tobytes()
+            self._consume(end)
         
-        return response[:-2]
+        return reply
     
-    def send(self, command):
+    def send(self, command, timeout = None):
+        if self.socket is None:
+            with self.tracer.phase('rcon-connect %s' % (self.target)):
+                self._connect(timeout)
         if self.authenticated == False:
             raise RconException('Not authenticated, cannot perform RCON command')
         
-        self._send('%s' % command)
-        return self._recv()
+        if timeout is not None:
+            self.socket.settimeout(min(timeout, self.timeout))
+        try:
+            request_id, packet = self._packet('%s' % command)
+            sentinel, marker = self._packet('')
+            # Two writes, as the server expects; only a failure of the first
+            # one is retried, since after that the command may have run
+            with self.tracer.phase('rcon-send %s' % (self.target)):
+                self._send(packet)
+                self._send(marker, retry = False)
+            with self.tracer.phase('rcon-recv %s' % (self.target)):
+                return self._recv(request_id, sentinel)
+        except (RconException, socket.error):
+            # Position in the stream is unknown now; start over on next use
+            self._log('Dropping connection to %s:%d after error.' % (self.host, self.port))
+            self.drops.inc()
+            self._disconnect()
+            raise
+        finally:
+            if timeout is not None and self.socket:
+                self.socket.settimeout(self.timeout)
     
     def _log(self, message):
         if self.log:
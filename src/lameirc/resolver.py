@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import socket
+import threading
+import time
+
+class Resolver:
+    """Caches host name lookups for ttl seconds.
+    
+    Only the very first lookup of a host blocks. Afterwards the cached
+    address is returned immediately; once it has expired a background thread
+    refreshes it while callers keep using the old address. The lookup
+    function can be replaced, e.g. by a fake in tests.
+    """
+    def __init__(self, ttl = 300, retry = 30, lookup = socket.gethostbyname, log = None):
+        self.ttl = ttl
+        self.retry = retry
+        self.lookup = lookup
+        self.log = log
+        
+        self.entries = dict()
+        self.refreshing = set()
+        self.lock = threading.Lock()
+    
+    def resolve(self, host):
+        with self.lock:
+            if host in self.entries:
+                address, expires = self.entries[host]
+                if time.time() >= expires and host not in self.refreshing:
+                    self.refreshing.add(host)
+                    refresher = threading.Thread(target = Resolver._refresh, args = (self, host))
+                    refresher.daemon = True
+                    refresher.start()
+                return address
+        
+        address = self.lookup(host)
+        with self.lock:
+            self.entries[host] = (address, time.time() + self.ttl)
+        return address
+    
+    def cached(self, host):
+        with self.lock:
+            if host in self.entries:
+                return self.entries[host][0]
+        return None
+    
+    def _refresh(self, host):
+        try:
+            address = self.lookup(host)
+            expires = time.time() + self.ttl
+            if address != self.entries[host][0]:
+                self._log('Address of \'%s\' changed from %s to %s.' % (host, self.entries[host][0], address))
+        except (socket.error, EnvironmentError) as e:
+            # Keep serving the last known address and try again soon
+            address = self.entries[host][0]
+            expires = time.time() + self.retry
+            self._log('Could not refresh address of \'%s\': %s' % (host, e))
+        
+        with self.lock:
+            self.entries[host] = (address, expires)
+            self.refreshing.discard(host)
+    
+    def _log(self, message):
+        if self.log:
+            self.log.system(message)
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import threading
+import time
+
+import lameirc.matching as matching
+import lameirc.parsers as parsers
+import lameirc.watchlist as watchlist
+
+class Roster:
+    """The players on one server, kept current from the UDP log.
+    
+    Connects, name changes and disconnects are applied as they arrive, so
+    lookups by userid or SteamID are dictionary hits and commands need no
+    RCON round trip. Events can be lost (UDP, a restarted logaddress), so
+    reconcile() replaces the contents with a fresh status from time to time
+    and counts how far the log had drifted.
+    
+    A roster is only trusted while it was reconciled recently and its
+    server's log is still arriving: heard is the time the last datagram of
+    any kind came in from that server, which keeps busy servers live between
+    player events. A server that stops logging (a restart drops its
+    logaddress) falls back to status within silence seconds.
+    """
+    def __init__(self, server):
+        self.server = server
+        self.by_id = dict()
+        self.by_steam = dict()
+        self.reconciled = None
+        self.updated = None
+        self.lock = threading.Lock()
+        self._index = None
+    
+    def live(self, maxage, silence, heard):
+        now = time.time()
+        with self.lock:
+            if self.reconciled is None or now - self.reconciled >= maxage:
+                return False
+        return heard is not None and now - heard < silence
+    
+    def apply(self, event, when = None):
+        if event.kind not in ('connect', 'enter', 'name', 'disconnect'):
+            return
+        when = when or time.time()
+        with self.lock:
+            self.updated = when
+            player = self.by_id.get(event.userid)
+            if event.kind == 'disconnect':
+                if player is not None:
+                    self._remove(player)
+                return
+            if player is None or player.steamid != event.steamid:
+                # Userids are only reused after a disconnect we missed
+                if player is not None:
+                    self._remove(player)
+                player = parsers.Player(event.userid, event.name, event.steamid, None, None, None, 'spawning', None)
+            if event.kind == 'connect' and ':' in event.value:
+                player = player._replace(ip = event.value.split(':')[0], connected = 0)
+            elif event.kind == 'enter':
+                player = player._replace(state = 'active')
+            elif event.kind == 'name':
+                player = player._replace(name = event.value)
+            self._add(player)
+    
+    def reconcile(self, players, when = None):
+        """Replaces the roster with a status snapshot and returns the number
+        of players the log had gotten wrong."""
+        with self.lock:
+            drift = 0
+            current = dict([(p.id, p) for p in players])
+            for userid, player in self.by_id.items():
+                if userid not in current or current[userid].name != player.name or current[userid].steamid != player.steamid:
+                    drift += 1
+            drift += len([i for i in current if i not in self.by_id])
+            
+            self.by_id = dict()
+            self.by_steam = dict()
+            self._index = None
+            for player in players:
+                self._add(player)
+            self.reconciled = when or time.time()
+            return drift
+    
+    def index(self):
+        """A matching.PlayerIndex over the current players, rebuilt only
+        after a change."""
+        with self.lock:
+            if self._index is None:
+                self._index = matching.PlayerIndex(self.by_id.values())
+            return self._index
+    
+    def find(self, steamid):
+        with self.lock:
+            return self.by_steam.get(watchlist.steamid_key(steamid))
+    
+    def __len__(self):
+        return len(self.by_id)
+    
+    def _add(self, player):
+        self.by_id[player.id] = player
+        key = watchlist.steamid_key(player.steamid)
+        if key is not None:
+            self.by_steam[key] = player
+        self._index = None
+    
+    def _remove(self, player):
+        del self.by_id[player.id]
+        key = watchlist.steamid_key(player.steamid)
+        if self.by_steam.get(key) is player:
+            del self.by_steam[key]
+        self._index = None
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import datetime
+import random
+import re
+import threading
+import time
+
+class ScheduleError(Exception):
+    pass
+
+DURATION = re.compile(r'^(?:(\d+)d)?(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s?)?$')
+
+def parse_duration(value):
+    """Seconds from a number or a string like '90', '15m' or '1h30m'."""
+    if isinstance(value, (int, long, float)):
+        return value
+    match = DURATION.match(value.strip())
+    if match is None or not value.strip():
+        raise ScheduleError('Invalid duration \'%s\'.' % (value))
+    days, hours, minutes, seconds = [int(g or 0) for g in match.groups()]
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+class CronSpec:
+    """A five field cron expression (minute hour day month weekday) with
+    *, lists, ranges and steps; weekday 0 and 7 are Sunday. As in cron, a
+    restricted day and weekday match if either one does."""
+    FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+    
+    def __init__(self, expression):
+        self.expression = expression
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ScheduleError('Cron expression \'%s\' needs five fields.' % (expression))
+        self.minutes, self.hours, self.days, self.months, weekdays = \
+            [self._field(f, low, high) for f, (low, high) in zip(fields, self.FIELDS)]
+        self.weekdays = set([d % 7 for d in weekdays])
+        self.anyday = fields[2] == '*'
+        self.anyweekday = fields[4] == '*'
+    
+    def _field(self, field, low, high):
+        values = set()
+        for part in field.split(','):
+            step = 1
+            if '/' in part:
+                part, step = part.split('/', 1)
+            try:
+                step = int(step)
+                if part == '*':
+                    first, last = low, high
+                elif '-' in part:
+                    first, last = [int(p) for p in part.split('-', 1)]
+                else:
+                    first = int(part)
+                    last = high if step > 1 else first
+            except ValueError:
+                raise ScheduleError('Invalid cron field \'%s\'.' % (field))
+            if first < low or last > high or first > last or step < 1:
+                raise ScheduleError('Cron field \'%s\' out of range %d-%d.' % (field, low, high))
+            values.update(range(first, last + 1, step))
+        return values
+    
+    def _day(self, when):
+        day = when.day in self.days
+        weekday = (when.weekday() + 1) % 7 in self.weekdays
+        if self.anyday or self.anyweekday:
+            return day and weekday
+        return day or weekday
+    
+    def next(self, after):
+        """First matching local time strictly after timestamp after."""
+        when = datetime.datetime.fromtimestamp(after).replace(second = 0, microsecond = 0) + datetime.timedelta(minutes = 1)
+        limit = when + datetime.timedelta(days = 5 * 366)
+        while when < limit:
+            if when.month not in self.months:
+                month = when.month % 12 + 1
+                when = when.replace(year = when.year + (month == 1), month = month, day = 1, hour = 0, minute = 0)
+            elif not self._day(when):
+                when = when.replace(hour = 0, minute = 0) + datetime.timedelta(days = 1)
+            elif when.hour not in self.hours:
+                when = when.replace(minute = 0) + datetime.timedelta(hours = 1)
+            elif when.minute not in self.minutes:
+                when += datetime.timedelta(minutes = 1)
+            else:
+                return time.mktime(when.timetuple())
+        raise ScheduleError('Cron expression \'%s\' never matches.' % (self.expression))
+
+class Task:
+    """One scheduled job on one server, with its run statistics."""
+    def __init__(self, name, server, config):
+        self.name = name
+        self.server = server
+        self.config = config
+        
+        self.every = None
+        self.cron = None
+        if 'cron' in config:
+            self.cron = CronSpec(config['cron'])
+        elif 'every' in config:
+            self.every = parse_duration(config['every'])
+            if self.every < 1:
+                raise ScheduleError('Interval of \'%s\' must be at least one second.' % (name))
+        else:
+            raise ScheduleError('Job \'%s\' needs \'every\' or \'cron\'.' % (name))
+        self.jitter = parse_duration(config.get('jitter', 0))
+        self.concurrency = config.get('concurrency', 1)
+        
+        self.due = None
+        self.running = 0
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last = None
+        self.total = 0.0
+        self.longest = 0.0
+    
+    def schedule(self, now):
+        """Picks the next nominal time and returns it with jitter applied."""
+        if self.cron is not None:
+            self.due = self.cron.next(now)
+        elif self.due is None:
+            self.due = now + random.uniform(0, self.every)
+        else:
+            # Step from the nominal time so intervals do not drift
+            self.due += self.every
+            if self.due <= now:
+                self.due = now + self.every
+        return self.due + random.uniform(0, self.jitter)
+    
+    def record(self, duration, ok):
+        self.runs += 1
+        if not ok:
+            self.failures += 1
+        self.last = duration
+        self.total += duration
+        self.longest = max(self.longest, duration)
+
+class Scheduler:
+    """Runs configured jobs on the servers they name.
+    
+    Timers live on the reactor (schedule is the bot's guarded
+    execute_delayed); each firing only hands the job to submit, which runs
+    it on the command executor under the server's key. Interval jobs start at a random point of their
+    first interval and every firing gets up to jitter seconds of random
+    delay, so many servers never fire in the same second. A task already
+    running concurrency times is skipped rather than queued. Loading a new
+    schedule bumps the generation, which silences all earlier timers.
+    """
+    def __init__(self, schedule, submit, run, log = None):
+        self.schedule = schedule
+        self.submit = submit
+        self.run = run
+        self.log = log
+        
+        self.tasks = []
+        self.generation = 0
+        self.lock = threading.Lock()
+    
+    def load(self, jobs, servers):
+        tasks = []
+        for name in sorted(jobs):
+            config = jobs[name]
+            targets = config.get('servers', '*')
+            if targets == '*':
+                targets = sorted(servers)
+            for server in targets:
+                try:
+                    tasks.append(Task(name, server, config))
+                except ScheduleError as se:
+                    self._log('Skipping scheduled job: %s' % (se))
+                    break
+        
+        with self.lock:
+            self.generation += 1
+            self.tasks = tasks
+        
+        now = time.time()
+        for task in tasks:
+            self._arm(task, self.generation, now)
+        self._log('Scheduler loaded %d jobs on %d servers.' % (len(set([t.name for t in tasks])), len(set([t.server for t in tasks]))))
+    
+    def _arm(self, task, generation, now):
+        try:
+            delay = task.schedule(now) - now
+        except ScheduleError as se:
+            self._log('Stopping job \'%s\' on \'%s\': %s' % (task.name, task.server, se))
+            return
+        self.schedule(max(delay, 1), self._fire, (task, generation))
+    
+    def _fire(self, task, generation):
+        if generation != self.generation:
+            return
+        self._arm(task, generation, time.time())
+        
+        with self.lock:
+            if task.running >= task.concurrency:
+                task.skipped += 1
+                self._log('Skipping \'%s\' on \'%s\': %d runs still active.' % (task.name, task.server, task.running))
+                return
+            task.running += 1
+        
+        run = {'started': False}
+        
+        def on_error(error):
+            # A job that expired in the queue never reached _execute
+            if not run['started']:
+                with self.lock:
+                    task.running -= 1
+                    task.record(0, False)
+            self._log('Scheduled job \'%s\' on \'%s\' failed: %s' % (task.name, task.server, error))
+        
+        try:
+            self.submit(task.server, self._execute, (task, run), on_error)
+        except Exception as e:
+            with self.lock:
+                task.running -= 1
+                task.skipped += 1
+            self._log('Could not queue \'%s\' on \'%s\': %s' % (task.name, task.server, e))
+    
+    def _execute(self, task, run):
+        run['started'] = True
+        started = time.time()
+        ok = False
+        try:
+            self.run(task)
+            ok = True
+        finally:
+            with self.lock:
+                task.running -= 1
+                task.record(time.time() - started, ok)
+    
+    def _log(self, message):
+        if self.log:
+            self.log.system(message)
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import threading
+import time
+
+import irclib.irclib as irclib
+
+class SessionStore:
+    """Authenticated IRC sessions, indexed by hostmask, nick and account.
+    
+    A session ends after idle seconds without a command or lifetime seconds
+    after login, whichever comes first. Expiry runs on timers registered
+    through schedule (the reactor's execute_delayed), so nothing is ever
+    scanned. Timers cannot be cancelled; each one carries the login time of
+    its session and does nothing if that session is gone or was replaced.
+    
+    login() may be called from worker threads: execute_delayed only inserts
+    into a sorted list, and with a positive delay the new timer never lands
+    in front of the one the reactor is currently running.
+    """
+    def __init__(self, schedule, idle = 3600, lifetime = 86400, log = None):
+        self.schedule = schedule
+        self.idle = idle
+        self.lifetime = lifetime
+        self.log = log
+        
+        self.sessions = dict()
+        self.nicks = dict()
+        self.accounts = dict()
+        self.lock = threading.RLock()
+    
+    def login(self, hostmask, account):
+        now = time.time()
+        with self.lock:
+            self._remove(hostmask)
+            self.sessions[hostmask] = {'account': account, 'authed': True, 'time': now, 'seen': now}
+            self.nicks[irclib.irc_lower(irclib.nm_to_n(hostmask))] = hostmask
+            self.accounts.setdefault(account, set()).add(hostmask)
+        self.schedule(max(min(self.idle, self.lifetime), 1), self._expire, (hostmask, now))
+    
+    def get(self, hostmask, touch = False):
+        with self.lock:
+            session = self.sessions.get(hostmask)
+            if session is None or not self._alive(session, time.time()):
+                return None
+            if touch:
+                session['seen'] = time.time()
+            return session
+    
+    def logout(self, hostmask):
+        with self.lock:
+            return self._remove(hostmask) is not None
+    
+    def logout_nick(self, nick):
+        with self.lock:
+            hostmask = self.nicks.get(irclib.irc_lower(nick))
+            if hostmask is not None:
+                return self._remove(hostmask) is not None
+        return False
+    
+    def logout_account(self, account):
+        """Ends every session of account and returns their hostmasks."""
+        with self.lock:
+            hostmasks = list(self.accounts.get(account, ()))
+            for hostmask in hostmasks:
+                self._remove(hostmask)
+        return hostmasks
+    
+    def rename(self, old, new):
+        with self.lock:
+            session = self._remove(old)
+            if session is None:
+                return
+            self.sessions[new] = session
+            self.nicks[irclib.irc_lower(irclib.nm_to_n(new))] = new
+            self.accounts.setdefault(session['account'], set()).add(new)
+        # The timer of the old hostmask dies with it
+        self.schedule(max(self._remaining(session, time.time()), 1), self._expire, (new, session['time']))
+    
+    def clear(self):
+        with self.lock:
+            count = len(self.sessions)
+            self.sessions.clear()
+            self.nicks.clear()
+            self.accounts.clear()
+        return count
+    
+    def __contains__(self, hostmask):
+        return self.get(hostmask) is not None
+    
+    def __len__(self):
+        return len(self.sessions)
+    
+    def _alive(self, session, now):
+        return self._remaining(session, now) > 0
+    
+    def _remaining(self, session, now):
+        return min(session['seen'] + self.idle, session['time'] + self.lifetime) - now
+    
+    def _expire(self, hostmask, login):
+        with self.lock:
+            session = self.sessions.get(hostmask)
+            if session is None or session['time'] != login:
+                return
+            remaining = self._remaining(session, time.time())
+            if remaining <= 0:
+                self._remove(hostmask)
+        
+        if remaining > 0:
+            # Used since the timer was set; check again when it could expire.
+            # Never reschedule at zero delay from inside a timer callback.
+            self.schedule(max(remaining, 1), self._expire, (hostmask, login))
+        elif self.log:
+            self.log.system('Session of "%s" (%s) expired.' % (irclib.nm_to_n(hostmask), session['account']))
+    
+    def _remove(self, hostmask):
+        session = self.sessions.pop(hostmask, None)
+        if session is None:
+            return None
+        nick = irclib.irc_lower(irclib.nm_to_n(hostmask))
+        if self.nicks.get(nick) == hostmask:
+            del self.nicks[nick]
+        hostmasks = self.accounts.get(session['account'])
+        if hostmasks is not None:
+            hostmasks.discard(hostmask)
+            if not hostmasks:
+                del self.accounts[session['account']]
+        return session
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import collections
+import itertools
+import os
+import sys
+import threading
+import time
+
+class Trace:
+    """Timings of the phases of one command, from parse to the last line
+    sent. Phases with the same name add up."""
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+        self.started = time.time()
+        self.phases = collections.OrderedDict()
+        self.pending = 0
+        self.running = True
+        self.lock = threading.Lock()
+    
+    def add(self, phase, duration):
+        with self.lock:
+            self.phases[phase] = self.phases.get(phase, 0) + duration
+    
+    def total(self, prefix):
+        with self.lock:
+            return sum([d for p, d in self.phases.items() if p.startswith(prefix)])
+    
+    def summary(self):
+        with self.lock:
+            phases = ', '.join(['%s %.1fms' % (p, d * 1000) for p, d in self.phases.items()])
+        return '[%d] %s: %.1fms (%s)' % (self.id, self.name, (time.time() - self.started) * 1000, phases)
+
+class Phase:
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+    
+    def __enter__(self):
+        self.started = time.time()
+    
+    def __exit__(self, type, value, traceback):
+        trace = self.tracer.current()
+        if trace is not None:
+            trace.add(self.name, time.time() - self.started)
+
+class Tracer:
+    """Follows commands across the reactor, the executor and the IRC sender.
+    
+    The trace of the command a thread works on is kept thread-local; code
+    handing work to another thread passes the trace along and activates it
+    there. A trace ends once its handler returned and every line it queued
+    was sent; traces slower than slow seconds are logged.
+    """
+    def __init__(self, slow = 1.0, log = None):
+        self.slow = slow
+        self.log = log
+        self.ids = itertools.count(1)
+        self.local = threading.local()
+    
+    def start(self, name):
+        trace = Trace(next(self.ids), name)
+        self.local.trace = trace
+        return trace
+    
+    def current(self):
+        return getattr(self.local, 'trace', None)
+    
+    def activate(self, trace):
+        self.local.trace = trace
+    
+    def phase(self, name):
+        return Phase(self, name)
+    
+    def hold(self, trace):
+        # Something (e.g. a queued line) still belongs to this trace
+        if trace is not None:
+            with trace.lock:
+                trace.pending += 1
+    
+    def release(self, trace):
+        if trace is None:
+            return
+        with trace.lock:
+            trace.pending -= 1
+            done = trace.pending <= 0 and not trace.running
+        if done:
+            self._finish(trace)
+    
+    def done(self, trace):
+        """The code that started trace is finished with it."""
+        self.local.trace = None
+        if trace is None:
+            return
+        with trace.lock:
+            trace.running = False
+            done = trace.pending <= 0
+        if done:
+            self._finish(trace)
+    
+    def _finish(self, trace):
+        if time.time() - trace.started >= self.slow and self.log:
+            self.log.system('Slow command %s' % (trace.summary()), duration = round(time.time() - trace.started, 4))
+
+class SamplingProfiler:
+    """Samples the stacks of all threads every interval seconds through
+    sys._current_frames and writes the hottest functions and lines to a
+    file. Unlike cProfile this sees every thread, and the only cost to the
+    profiled threads is the GIL held while a sample is taken."""
+    IDLE = ('threading.py', 'threading.pyc')
+    
+    def __init__(self, path, interval = 0.005, top = 30):
+        self.path = path
+        self.interval = interval
+        self.top = top
+        
+        self.samples = 0
+        self.leaves = collections.Counter()
+        self.functions = collections.Counter()
+        self.stopping = threading.Event()
+        self.thread = None
+    
+    def start(self, duration, callback = None):
+        self.thread = threading.Thread(target = SamplingProfiler._run, args = (self, duration, callback))
+        self.thread.daemon = True
+        self.thread.start()
+    
+    def stop(self):
+        self.stopping.set()
+    
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+    
+    def _run(self, duration, callback):
+        own = threading.current_thread().ident
+        end = time.time() + duration
+        while time.time() < end and not self.stopping.is_set():
+            for ident, frame in sys._current_frames().items():
+                # Threads blocked on a queue or event only show up as waiting
+                if ident == own or frame.f_code.co_name == 'wait' and frame.f_code.co_filename.endswith(self.IDLE):
+                    continue
+                self.samples += 1
+                self.leaves[self._where(frame)] += 1
+                seen = set()
+                while frame is not None:
+                    function = self._function(frame)
+                    if function not in seen:
+                        seen.add(function)
+                        self.functions[function] += 1
+                    frame = frame.f_back
+            time.sleep(self.interval)
+        
+        error = None
+        try:
+            self._dump()
+        except IOError as ioe:
+            error = ioe
+        if callback:
+            callback(self, error)
+    
+    def _function(self, frame):
+        code = frame.f_code
+        return '%s:%d(%s)' % (os.path.basename(code.co_filename), code.co_firstlineno, code.co_name)
+    
+    def _where(self, frame):
+        code = frame.f_code
+        return '%s:%d(%s)' % (os.path.basename(code.co_filename), frame.f_lineno, code.co_name)
+    
+    def hotspots(self):
+        return self.leaves.most_common(self.top)
+    
+    def _dump(self):
+        samples = max(self.samples, 1)
+        with open(self.path, 'w') as dump:
+            dump.write('%d samples\n\nSelf (running line)\n' % (self.samples))
+            for where, count in self.leaves.most_common(self.top):
+                dump.write('%6.1f%% %7d  %s\n' % (100.0 * count / samples, count, where))
+            dump.write('\nTotal (function on stack)\n')
+            for function, count in self.functions.most_common(self.top):
+                dump.write('%6.1f%% %7d  %s\n' % (100.0 * count / samples, count, function))
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import os
+import re
+import threading
+import time
+
+STEAMID64_BASE = 76561197960265728
+
+STEAM2 = re.compile(r'^STEAM_[0-5]:([01]):(\d+)$')
+STEAM3 = re.compile(r'^\[U:1:(\d+)\]$')
+STEAM64 = re.compile(r'^7656\d{13}$')
+
+def steamid_key(steamid):
+    """Normalizes STEAM_X:Y:Z, [U:1:N] and SteamID64 to the SteamID64
+    integer; returns None for anything else (e.g. BOT)."""
+    match = STEAM2.match(steamid)
+    if match:
+        return STEAMID64_BASE + int(match.group(2)) * 2 + int(match.group(1))
+    match = STEAM3.match(steamid)
+    if match:
+        return STEAMID64_BASE + int(match.group(1))
+    if STEAM64.match(steamid):
+        return int(steamid)
+    return None
+
+class Watchlist:
+    """Watched players keyed by SteamID64, with the servers they were added
+    on.
+    
+    Readers on other threads use the frozenset in self.snapshot, which is
+    replaced (never modified) on every change. Changes are appended to an
+    optional journal file that is compacted when the list is loaded.
+    """
+    def __init__(self, path = None, log = None):
+        self.path = path
+        self.log = log
+        
+        self.servers = dict()
+        self.views = dict()
+        self.snapshot = frozenset()
+        self.lock = threading.Lock()
+        self.journal = None
+        
+        if path:
+            self._load()
+    
+    def __len__(self):
+        return len(self.snapshot)
+    
+    def contains(self, steamid):
+        return steamid_key(steamid) in self.snapshot
+    
+    def on(self, server):
+        with self.lock:
+            return frozenset(self.views.get(server, ()))
+    
+    def add(self, steamid, server):
+        key = steamid_key(steamid)
+        if key is None:
+            return False
+        with self.lock:
+            if key in self.servers and server in self.servers[key]:
+                return False
+            self._apply('+', key, server)
+            self._write('+', key, server)
+            self.snapshot = frozenset(self.servers)
+        return True
+    
+    def remove(self, steamid, server = None):
+        key = steamid_key(steamid)
+        removed = False
+        with self.lock:
+            if key not in self.servers:
+                return False
+            for watched in list(self.servers[key]):
+                if server is None or watched == server:
+                    self._apply('-', key, watched)
+                    self._write('-', key, watched)
+                    removed = True
+            self.snapshot = frozenset(self.servers)
+        return removed
+    
+    def _apply(self, op, key, server):
+        if op == '+':
+            self.servers.setdefault(key, set()).add(server)
+            self.views.setdefault(server, set()).add(key)
+        elif key in self.servers:
+            self.servers[key].discard(server)
+            if not len(self.servers[key]):
+                del self.servers[key]
+            self.views[server].discard(key)
+            if not len(self.views[server]):
+                del self.views[server]
+    
+    def _write(self, op, key, server):
+        if self.journal:
+            self.journal.write('%s %d %s\n' % (op, key, server))
+            self.journal.flush()
+    
+    def _load(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as journal:
+                for line in journal:
+                    try:
+                        op, key, server = line.split(None, 2)
+                        self._apply(op, int(key), server.strip())
+                    except ValueError:
+                        self._log('Skipping malformed watchlist entry: %r' % (line))
+        
+        # Compact: rewrite the journal with the live entries only
+        compacted = self.path + '.tmp'
+        with open(compacted, 'w') as journal:
+            for key in sorted(self.servers):
+                for server in sorted(self.servers[key]):
+                    journal.write('+ %d %s\n' % (key, server))
+        os.rename(compacted, self.path)
+        
+        self.journal = open(self.path, 'a')
+        self.snapshot = frozenset(self.servers)
+        self._log('Watchlist loaded (%d players).' % (len(self.snapshot)))
+    
+    def _log(self, message):
+        if self.log:
+            self.log.system(message)
+
+class Alerts:
+    """Coalesces the events of watched players into one alert line each.
+    
+    The first event of a player opens a window of debounce seconds (or
+    until interval seconds after that player's previous alert); everything
+    else that happens in it, such as a connect followed by a team join, is
+    appended to the same alert. Flushes run on timers registered through
+    schedule, the reactor's execute_delayed, which is safe to call from the
+    log event thread with a positive delay. post therefore runs on the
+    reactor and must not block.
+    """
+    MAX_PARTS = 6
+    
+    def __init__(self, schedule, post, debounce = 5, interval = 60):
+        self.schedule = schedule
+        self.post = post
+        self.debounce = debounce
+        self.interval = interval
+        
+        self.pending = dict()
+        self.sent = dict()
+        self.lock = threading.Lock()
+    
+    def add(self, key, server, name, what, when = None):
+        when = when or time.time()
+        with self.lock:
+            alert = self.pending.get(key)
+            if alert is None:
+                alert = self.pending[key] = {'server': server, 'name': name, 'parts': []}
+                delay = max(self.debounce, self.sent.get(key, 0) + self.interval - when)
+                self.schedule(max(delay, 1), self._flush, (key,))
+            alert['name'] = name
+            if alert['server'] != server:
+                what = '%s on %s' % (what, server)
+            if len(alert['parts']) and alert['parts'][-1] == what:
+                return
+            if len(alert['parts']) < self.MAX_PARTS:
+                alert['parts'].append(what)
+            elif alert['parts'][-1] != '...':
+                alert['parts'].append('...')
+    
+    def _flush(self, key):
+        with self.lock:
+            alert = self.pending.pop(key, None)
+            if alert is None:
+                return
+            self.sent[key] = time.time()
+        self.post(key, alert['server'], alert['name'], alert['parts'])
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import socket
+import struct
+import threading
+import time
+import unittest
+
+import lameirc.a2s as a2s
+import bench.fakes as fakes
+
+def info_payload(name = 'Server', map = 'ctf_2fort', players = 3):
+    return ('I\x11' + name + '\x00' + map + '\x00tf\x00Team Fortress\x00'
+            + struct.pack('<hBBB', 440, players, 24, 0) + 'dl\x00\x01' + '1.0\x00')
+
+class DecoderTest(unittest.TestCase):
+    def setUp(self):
+        self.client = a2s.A2SClient(0.5)
+    
+    def test_info(self):
+        info = self.client._decode_info(a2s.Reader(info_payload(), 1))
+        self.assertEqual(info.name, 'Server')
+        self.assertEqual(info.map, 'ctf_2fort')
+        self.assertEqual((info.appid, info.players, info.max_players, info.bots), (440, 3, 24, 0))
+        self.assertEqual(info.version, '1.0')
+    
+    def test_players(self):
+        payload = 'D\x02' + '\x00Alice\x00' + struct.pack('<lf', 5, 12.5) + '\x01Bob\x00' + struct.pack('<lf', -1, 3.0)
+        players = self.client._decode_players(a2s.Reader(payload, 1))
+        self.assertEqual([(p.name, p.score, p.duration) for p in players], [('Alice', 5, 12.5), ('Bob', -1, 3.0)])
+    
+    def test_rules(self):
+        payload = 'E' + struct.pack('<h', 2) + 'mp_timelimit\x0030\x00sv_cheats\x000\x00'
+        self.assertEqual(self.client._decode_rules(a2s.Reader(payload, 1)), {'mp_timelimit': '30', 'sv_cheats': '0'})
+    
+    def test_truncated_reply(self):
+        self.assertRaises((struct.error, ValueError), self.client._decode_info, a2s.Reader(info_payload()[:20], 1))
+    
+    def test_split_reassembly(self):
+        payload = '\xff\xff\xff\xff' + info_payload()
+        parts = [payload[:10], payload[10:]]
+        splits = dict()
+        address = ('127.0.0.1', 1)
+        packets = [struct.pack('<llBBh', -2, 7, 2, i, 1200) + part for i, part in enumerate(parts)]
+        self.assertEqual(self.client._reassemble(address, packets[1], splits), None)
+        self.assertEqual(self.client._reassemble(address, packets[0], splits), payload[4:])
+        self.assertEqual(splits, {})
+    
+    def test_compressed_split_rejected(self):
+        packet = struct.pack('<LlBBh', 0xfffffffe, -0x7ffffff0, 1, 0, 1200) + 'x'
+        self.assertRaises(a2s.A2SException, self.client._reassemble, ('127.0.0.1', 1), packet, dict())
+
+class QueryTest(unittest.TestCase):
+    def setUp(self):
+        self.server = fakes.FakeA2SServer(fakes.FakeRconState(players = 40), split_size = 500).start()
+        # Bound but never answering: an unreachable server
+        self.silent = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.silent.bind(('127.0.0.1', 0))
+        self.client = a2s.A2SClient(1.0)
+    
+    def tearDown(self):
+        self.server.stop()
+        self.silent.close()
+    
+    def test_challenge_and_split_replies(self):
+        address = self.server.address
+        results = self.client.query([(address, a2s.A2SClient.INFO), (address, a2s.A2SClient.PLAYERS),
+                                     (address, a2s.A2SClient.RULES)])
+        self.assertEqual(results[(address, 'info')].players, 40)
+        self.assertEqual(len(results[(address, 'players')]), 40)
+        self.assertEqual(len(results[(address, 'rules')]), 100)
+    
+    def test_silent_server_times_out(self):
+        self.assertRaises(a2s.A2SException, self.client.info, self.silent.getsockname())
+    
+    def test_silent_server_does_not_block_others(self):
+        blocker = threading.Thread(target = self.client.query, args = ([(self.silent.getsockname(), 'info')],))
+        blocker.start()
+        time.sleep(0.1)
+        started = time.time()
+        self.client.info(self.server.address)
+        self.assertTrue(time.time() - started < 0.5)
+        blocker.join()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import Queue
+import unittest
+
+import lameirc.assets as assets
+
+class IRCQueueTest(unittest.TestCase):
+    def test_urgent_lines_bypass_a_full_queue(self):
+        queue = assets.IRCQueue(2)
+        queue.put((assets.Communicator.NORMAL, 0, 'first'))
+        queue.put((assets.Communicator.NORMAL, 1, 'second'))
+        self.assertRaises(Queue.Full, queue.put_nowait, (assets.Communicator.NORMAL, 2, 'third'))
+        
+        queue.put_urgent((assets.Communicator.URGENT, 3, 'alert'))
+        self.assertEqual([queue.get_nowait()[2] for i in range(3)], ['alert', 'first', 'second'])
+        for i in range(3):
+            queue.task_done()
+        queue.join()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import hashlib
+import threading
+import unittest
+
+import lameirc.auth as auth
+import lameirc.executor as executor
+
+class PasswordTest(unittest.TestCase):
+    def test_pbkdf2_round_trip(self):
+        stored = auth.hash_password('secret', 1000)
+        self.assertTrue(stored.startswith('pbkdf2_sha256$1000$'))
+        self.assertTrue(auth.check_password('secret', stored))
+        self.assertTrue(auth.check_password(u'secret', unicode(stored)))
+        self.assertFalse(auth.check_password('Secret', stored))
+    
+    def test_salts_differ(self):
+        self.assertNotEqual(auth.hash_password('secret', 1000), auth.hash_password('secret', 1000))
+    
+    def test_legacy_sha256(self):
+        legacy = hashlib.sha256('secret').hexdigest()
+        self.assertTrue(auth.check_password('secret', legacy))
+        self.assertTrue(auth.check_password('secret', legacy.upper()))
+        self.assertFalse(auth.check_password('other', legacy))
+    
+    def test_malformed_entries_never_match(self):
+        self.assertFalse(auth.check_password('secret', 'pbkdf2_sha256$many$salt$hash'))
+        self.assertFalse(auth.check_password('secret', ''))
+    
+    def test_needs_upgrade(self):
+        self.assertTrue(auth.needs_upgrade(hashlib.sha256('secret').hexdigest()))
+        self.assertTrue(auth.needs_upgrade(auth.hash_password('secret', 1000), 2000))
+        self.assertFalse(auth.needs_upgrade(auth.hash_password('secret', 2000), 2000))
+
+class RateLimiterTest(unittest.TestCase):
+    def test_limit_per_key_and_period(self):
+        limiter = auth.RateLimiter(2, 0.1)
+        self.assertTrue(limiter.allow('a'))
+        self.assertTrue(limiter.allow('a'))
+        self.assertFalse(limiter.allow('a'))
+        self.assertTrue(limiter.allow('b'))
+        threading.Event().wait(0.11)
+        self.assertTrue(limiter.allow('a'))
+
+class VerifierTest(unittest.TestCase):
+    def setUp(self):
+        self.verifier = auth.Verifier(executor.CommandExecutor(1, 10), iterations = 1000, per_host = 3, per_account = 10)
+        self.results = []
+        self.done = threading.Event()
+    
+    def callback(self, ok, upgrade):
+        self.results.append((ok, upgrade))
+        self.done.set()
+    
+    def verify(self, password, stored, hostmask = 'nick!user@host'):
+        self.done.clear()
+        self.verifier.verify(hostmask, 'admin', password, stored, self.callback)
+        self.assertTrue(self.done.wait(5))
+        return self.results[-1]
+    
+    def test_legacy_hash_is_upgraded(self):
+        ok, upgrade = self.verify('secret', hashlib.sha256('secret').hexdigest())
+        self.assertTrue(ok)
+        self.assertTrue(auth.check_password('secret', upgrade))
+        self.assertFalse(auth.needs_upgrade(upgrade, 1000))
+        self.assertEqual(self.verify('secret', upgrade), (True, None))
+    
+    def test_wrong_password(self):
+        self.assertEqual(self.verify('wrong', auth.hash_password('secret', 1000)), (False, None))
+    
+    def test_rate_limited_per_host(self):
+        stored = auth.hash_password('secret', 1000)
+        for i in range(3):
+            self.verify('wrong', stored)
+        self.assertRaises(auth.RateLimited, self.verifier.verify, 'nick!user@host', 'admin', 'secret', stored, self.callback)
+        self.assertEqual(self.verify('secret', stored, 'other!user@host')[0], True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import unittest
+
+import lameirc.breaker as breaker
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.circuit = breaker.CircuitBreaker(threshold = 2, cooldown = 0)
+        for i in range(2):
+            self.circuit.before()
+            self.circuit.failure()
+    
+    def test_opens_after_threshold(self):
+        self.assertEqual(self.circuit.state, breaker.CircuitBreaker.OPEN)
+    
+    def test_single_probe_when_half_open(self):
+        self.circuit.before()
+        self.assertEqual(self.circuit.state, breaker.CircuitBreaker.HALF_OPEN)
+        self.assertRaises(breaker.CircuitOpen, self.circuit.before)
+        self.circuit.success(0.01)
+        self.assertEqual(self.circuit.state, breaker.CircuitBreaker.CLOSED)
+    
+    def test_released_probe_lets_the_next_call_probe(self):
+        self.circuit.before()
+        self.circuit.release()
+        self.circuit.before()
+        self.assertEqual(self.circuit.state, breaker.CircuitBreaker.HALF_OPEN)
+
+if __name__ == '__main__':
+    unittest.main()
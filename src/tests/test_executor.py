@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import threading
+import time
+import unittest
+
+import lameirc.executor as executor
+
+class CommandExecutorTest(unittest.TestCase):
+    def setUp(self):
+        self.executor = executor.CommandExecutor(4, 5, maxqueue = 2)
+    
+    def test_jobs_with_a_key_run_one_after_another(self):
+        running = [0]
+        overlaps = []
+        lock = threading.Lock()
+        
+        def job(i):
+            with lock:
+                running[0] += 1
+                overlaps.append(running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+            return i
+        
+        jobs = [self.executor.submit('srv', job, (i,)) for i in range(3)]
+        for j in jobs:
+            self.assertTrue(j.wait(5))
+        self.assertEqual(max(overlaps), 1)
+        self.assertEqual([j.result for j in jobs], [0, 1, 2])
+    
+    def test_different_keys_run_concurrently(self):
+        barrier = threading.Event()
+        first = self.executor.submit('a', barrier.wait, (2,))
+        second = self.executor.submit('b', barrier.set)
+        self.assertTrue(second.wait(1))
+        self.assertTrue(first.wait(1))
+        self.assertEqual(first.result, True)
+    
+    def test_full_queue_raises(self):
+        release = threading.Event()
+        self.executor.submit('srv', release.wait, (5,))
+        self.executor.submit('srv', lambda: None)
+        self.executor.submit('srv', lambda: None)
+        self.assertEqual(self.executor.queued('srv'), 3)
+        self.assertRaises(executor.ExecutorFull, self.executor.submit, 'srv', lambda: None)
+        # Other keys are unaffected
+        self.assertTrue(self.executor.submit('other', lambda: None).wait(1))
+        release.set()
+    
+    def test_remaining_counts_down_to_the_deadline(self):
+        self.assertEqual(self.executor.remaining(), None)
+        job = self.executor.submit(None, self.executor.remaining, timeout = 2)
+        self.assertTrue(job.wait(1))
+        self.assertTrue(1 < job.result <= 2)
+    
+    def test_expired_jobs_fail_with_timeout(self):
+        errors = []
+        release = threading.Event()
+        self.executor.submit('srv', release.wait, (0.3,))
+        job = self.executor.submit('srv', lambda: 'ran', timeout = 0.1, on_error = errors.append)
+        self.assertTrue(job.wait(2))
+        self.assertEqual(job.result, None)
+        self.assertTrue(isinstance(job.error, executor.CommandTimeout))
+        self.assertEqual(errors, [job.error])
+    
+    def test_errors_go_to_on_error(self):
+        errors = []
+        job = self.executor.submit(None, lambda: 1 / 0, on_error = errors.append)
+        self.assertTrue(job.wait(1))
+        self.assertTrue(isinstance(errors[0], ZeroDivisionError))
+
+if __name__ == '__main__':
+    unittest.main()
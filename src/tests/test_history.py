@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+import lameirc.history as history
+import lameirc.parsers as parsers
+
+class FakeLog:
+    def __init__(self):
+        self.lines = []
+    
+    def system(self, message):
+        self.lines.append(message)
+
+def connect(name, steamid, ip = '10.0.0.1:27005'):
+    return parsers.LogEvent('connect', name, 2, steamid, '', ip)
+
+class PlayerHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'history.db')
+        self.log = FakeLog()
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def test_record_and_query(self):
+        players = history.PlayerHistory(self.path, log = self.log)
+        players.record('a', connect('Alice', 'STEAM_0:1:1'), 100)
+        players.record('a', connect('Mallory', 'STEAM_0:0:2'), 110)
+        self.assertTrue(players.flush())
+        self.assertEqual(players.resolve('ali'), [76561197960265731])
+        self.assertEqual(players.seen(76561197960265731), ('Alice', 'a', 100, 100))
+        self.assertEqual([r[0] for r in players.alts(76561197960265731)], [76561197960265732])
+    
+    def test_old_sqlite(self):
+        version = sqlite3.sqlite_version_info
+        sqlite3.sqlite_version_info = (3, 22, 0)
+        try:
+            self.assertRaises(history.HistoryException, history.PlayerHistory, self.path)
+        finally:
+            sqlite3.sqlite_version_info = version
+    
+    def test_unusable_path(self):
+        self.assertRaises(history.HistoryException, history.PlayerHistory, os.path.join(self.directory, 'missing', 'history.db'))
+    
+    def test_drops_are_counted_and_logged(self):
+        players = history.PlayerHistory(self.path, queuesize = 2, log = self.log)
+        busy = threading.Event()
+        release = threading.Event()
+        apply = players._apply
+        def slow(*args):
+            busy.set()
+            release.wait(5)
+            apply(*args)
+        players._apply = slow
+        
+        players.record('a', connect('Alice', 'STEAM_0:1:1'), 100)
+        busy.wait(5)
+        for i in range(5):
+            players.record('a', connect('Alice', 'STEAM_0:1:1'), 101 + i)
+        self.assertEqual(players.dropped, 3)
+        release.set()
+        self.assertTrue(players.flush())
+        self.assertTrue(players.flush())
+        self.assertTrue('Dropped 3 player events under load (3 in total).' in self.log.lines)
+
+if __name__ == '__main__':
+    unittest.main()
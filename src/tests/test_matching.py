@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import unittest
+
+import lameirc.matching as matching
+import lameirc.parsers as parsers
+
+PLAYERS = [parsers.Player(2, 'Alice', 'STEAM_0:1:1', '10.0.0.1', 50, 0, 'active', 60),
+           parsers.Player(3, 'Bob', '[U:1:4]', '10.0.1.2', 70, 0, 'active', 120),
+           parsers.Player(4, 'Bot Carl', 'BOT', None, None, None, 'active', None)]
+
+class PatternTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = matching.PatternCache()
+        self.index = matching.PlayerIndex(PLAYERS)
+    
+    def names(self, spec):
+        return [p.name for p in self.cache.compile(spec).select(self.index)]
+    
+    def test_kinds(self):
+        for spec, kind in [('3', 'id'), ('#3', 'id'), ('STEAM_0:1:1', 'steam'), ('[U:1:4]', 'steam'),
+                           ('76561197960265731', 'steam'), ('10.0.', 'ip'), ('ip:10.0.1', 'ip'),
+                           ('/^b/', 'regex'), ('b*', 'glob'), ('ali', 'substring')]:
+            self.assertEqual(self.cache.compile(spec).kind, kind, spec)
+    
+    def test_steamid_in_any_notation(self):
+        for spec in ('STEAM_0:1:1', 'STEAM_1:1:1', '[U:1:3]', '76561197960265731'):
+            self.assertEqual(self.names(spec), ['Alice'], spec)
+    
+    def test_id_and_ip(self):
+        self.assertEqual(self.names('#3'), ['Bob'])
+        self.assertEqual(self.names('10.0.1.'), ['Bob'])
+    
+    def test_names(self):
+        self.assertEqual(sorted(self.names('b')), ['Bob', 'Bot Carl'])
+        self.assertEqual(self.names('bo?'), ['Bob'])
+        self.assertEqual(self.names('re:^bot\\s'), ['Bot Carl'])
+    
+    def test_ordinary_regexes_are_accepted(self):
+        for spec in ('/^[a-z]+_[0-9]+$/', '/a+b+/', '/foo.*bar.*baz/', '/.*a.*b.*c/', '/(?:ab){3}/', 're:\\w+\\s\\w+'):
+            self.assertEqual(self.cache.compile(spec).kind, 'regex', spec)
+    
+    def test_dangerous_regexes_are_rejected(self):
+        for spec in ('/(a+)+$/', '/(x+x+)+y/', '/(a|aa)*b/', '/(?:a*)*/', '/(a)\\1/', '/[/'):
+            self.assertRaises(matching.PatternError, self.cache.compile, spec)
+    
+    def test_empty_pattern(self):
+        self.assertRaises(matching.PatternError, self.cache.compile, '')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import socket
+import unittest
+
+import lameirc.rcon as rcon
+import lameirc.tracing as tracing
+import bench.fakes as fakes
+
+class FailOnce:
+    """Wraps a socket whose next write fails, as a session the server
+    already dropped would."""
+    def __init__(self, sock, fail_after = 0):
+        self.sock = sock
+        self.writes = fail_after
+    
+    def sendall(self, data):
+        if self.writes == 0:
+            raise socket.error('Broken pipe')
+        self.writes -= 1
+        return self.sock.sendall(data)
+    
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+class RconTest(unittest.TestCase):
+    def setUp(self):
+        self.state = fakes.FakeRconState(players = 3, fragment = 1000)
+        self.server = fakes.FakeRconServer(self.state).start()
+        self.client = rcon.Rcon('127.0.0.1', self.server.port, 'bench', timeout = 5)
+    
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+    
+    def test_command(self):
+        self.assertEqual(self.client.send('echo hello'), 'hello\n')
+    
+    def test_split_reply(self):
+        # Well over one 4096 byte packet and the 64 KB receive buffer
+        reply = self.client.send('cvarlist 3000')
+        self.assertEqual(len(reply.splitlines()), 3000)
+        self.assertTrue(reply.startswith('sv_bench_var_00000 '))
+        self.assertEqual(self.client.send('echo after'), 'after\n')
+    
+    def test_bad_password(self):
+        self.assertRaises(rcon.RconException, rcon.Rcon, '127.0.0.1', self.server.port, 'wrong', timeout = 5)
+    
+    def test_reconnects_when_the_write_fails(self):
+        self.client.socket = FailOnce(self.client.socket)
+        self.assertEqual(self.client.send('echo again'), 'again\n')
+        self.assertEqual(self.state.log.count('echo again'), 1)
+    
+    def test_failed_sentinel_fails_the_call(self):
+        # The command may have run, so it is not sent again; the session is
+        # dropped and the next call starts over
+        self.client.socket = FailOnce(self.client.socket, fail_after = 1)
+        self.assertRaises(socket.error, self.client.send, 'echo one')
+        self.assertEqual(self.client.socket, None)
+        self.assertEqual(self.client.send('echo two'), 'two\n')
+        self.assertEqual(self.state.log.count('echo one'), 1)
+
+if __name__ == '__main__':
+    unittest.main()
+    
+    def test_phases(self):
+        tracer = tracing.Tracer()
+        client = rcon.Rcon('127.0.0.1', self.server.port, 'bench', timeout = 5, lazy = True, tracer = tracer)
+        trace = tracer.start('status')
+        client.send('echo traced')
+        client.close()
+        target = '127.0.0.1:%d' % (self.server.port)
+        self.assertEqual(list(trace.phases), ['rcon-connect %s' % (target), 'rcon-send %s' % (target), 'rcon-recv %s' % (target)])
+        self.assertTrue(trace.total('rcon') > 0)
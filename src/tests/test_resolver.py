@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import socket
+import threading
+import time
+import unittest
+
+import lameirc.resolver as resolver
+
+class FakeLookup:
+    """Answers from a dict; a host mapped to an exception raises it."""
+    def __init__(self, answers):
+        self.answers = answers
+        self.calls = []
+        self.gate = threading.Event()
+        self.gate.set()
+    
+    def __call__(self, host):
+        self.calls.append(host)
+        self.gate.wait(5)
+        answer = self.answers[host]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+class ResolverTest(unittest.TestCase):
+    def setUp(self):
+        self.lookup = FakeLookup({'game.example': '10.0.0.1'})
+        self.resolver = resolver.Resolver(ttl = 0.2, retry = 0.2, lookup = self.lookup)
+    
+    def wait_refreshed(self, host):
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            with self.resolver.lock:
+                if host not in self.resolver.refreshing:
+                    return
+            time.sleep(0.01)
+        self.fail('refresh of %s did not finish' % (host))
+    
+    def test_caches_until_expiry(self):
+        self.assertEqual(self.resolver.resolve('game.example'), '10.0.0.1')
+        self.assertEqual(self.resolver.resolve('game.example'), '10.0.0.1')
+        self.assertEqual(self.resolver.cached('game.example'), '10.0.0.1')
+        self.assertEqual(len(self.lookup.calls), 1)
+    
+    def test_first_failure_propagates(self):
+        self.lookup.answers['down.example'] = socket.gaierror('no such host')
+        self.assertRaises(socket.error, self.resolver.resolve, 'down.example')
+        self.assertEqual(self.resolver.cached('down.example'), None)
+    
+    def test_expired_entry_refreshes_in_background(self):
+        self.resolver.resolve('game.example')
+        time.sleep(0.25)
+        self.lookup.answers['game.example'] = '10.0.0.2'
+        self.lookup.gate.clear()
+        
+        # Served from the stale entry while the refresh is held up, and only
+        # one refresh runs however often the host is asked for
+        self.assertEqual(self.resolver.resolve('game.example'), '10.0.0.1')
+        self.assertEqual(self.resolver.resolve('game.example'), '10.0.0.1')
+        self.lookup.gate.set()
+        self.wait_refreshed('game.example')
+        
+        self.assertEqual(len(self.lookup.calls), 2)
+        self.assertEqual(self.resolver.resolve('game.example'), '10.0.0.2')
+    
+    def test_failed_refresh_keeps_address_and_retries(self):
+        self.resolver = resolver.Resolver(ttl = 0.2, retry = 0.5, lookup = self.lookup)
+        self.resolver.resolve('game.example')
+        time.sleep(0.25)
+        self.lookup.answers['game.example'] = socket.gaierror('temporary failure')
+        self.assertEqual(self.resolver.resolve('game.example'), '10.0.0.1')
+        self.wait_refreshed('game.example')
+        
+        # The failure is not retried before the retry interval is up
+        self.lookup.answers['game.example'] = '10.0.0.3'
+        self.assertEqual(self.resolver.resolve('game.example'), '10.0.0.1')
+        self.assertEqual(len(self.lookup.calls), 2)
+        
+        time.sleep(0.55)
+        self.resolver.resolve('game.example')
+        self.wait_refreshed('game.example')
+        self.assertEqual(len(self.lookup.calls), 3)
+        self.assertEqual(self.resolver.resolve('game.example'), '10.0.0.3')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import time
+import unittest
+
+import lameirc.matching as matching
+import lameirc.parsers as parsers
+import lameirc.roster as roster
+
+LINES = ['"Alice<2><STEAM_0:1:1><>" connected, address "10.0.0.1:27005"',
+         '"Alice<2><STEAM_0:1:1><>" entered the game',
+         '"Bob<3><[U:1:4]><>" connected, address "10.0.1.2:27005"',
+         '"Bob<3><[U:1:4]><Unassigned>" changed name to "Robert"']
+
+class RosterTest(unittest.TestCase):
+    def setUp(self):
+        self.roster = roster.Roster('srv')
+        for line in LINES:
+            self.roster.apply(parsers.parse_log_line(line))
+    
+    def test_events_build_the_roster(self):
+        self.assertEqual(sorted([p.name for p in self.roster.index().players]), ['Alice', 'Robert'])
+        alice = self.roster.find('76561197960265731')
+        self.assertEqual((alice.id, alice.ip, alice.state), (2, '10.0.0.1', 'active'))
+        self.assertEqual(self.roster.find('[U:1:4]').name, 'Robert')
+    
+    def test_disconnect_updates_the_index(self):
+        index = self.roster.index()
+        self.roster.apply(parsers.parse_log_line('"Alice<2><STEAM_0:1:1><CT>" disconnected (reason "quit")'))
+        self.assertEqual([p.name for p in self.roster.index().players], ['Robert'])
+        self.assertEqual(self.roster.find('STEAM_0:1:1'), None)
+        self.assertEqual(len(index.players), 2)
+    
+    def test_reconcile_replaces_and_counts_drift(self):
+        self.roster.index()
+        status = [parsers.Player(2, 'Alice', 'STEAM_0:1:1', '10.0.0.1', 40, 0, 'active', 30),
+                  parsers.Player(5, 'Carol', 'STEAM_0:0:9', '10.0.2.3', 40, 0, 'active', 10)]
+        # Robert is gone and Carol was missed
+        self.assertEqual(self.roster.reconcile(status), 2)
+        self.assertEqual(sorted([p.name for p in self.roster.index().players]), ['Alice', 'Carol'])
+    
+    def test_reconcile_against_empty_server(self):
+        self.roster.index()
+        self.roster.reconcile([])
+        self.assertEqual(len(self.roster), 0)
+        self.assertEqual(self.roster.index().players, [])
+        self.assertEqual(matching.PatternCache().compile('alice').select(self.roster.index()), [])
+    
+    def test_live_needs_reconcile_and_a_recent_log(self):
+        now = time.time()
+        self.assertFalse(self.roster.live(180, 60, now))
+        self.roster.reconcile([])
+        self.assertTrue(self.roster.live(180, 60, now))
+        self.assertFalse(self.roster.live(180, 60, None))
+        self.assertFalse(self.roster.live(180, 60, now - 61))
+        self.roster.reconciled = now - 181
+        self.assertFalse(self.roster.live(180, 60, now))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import threading
+import time
+import unittest
+
+import lameirc.executor as executor
+import lameirc.scheduler as scheduler
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.timers = []
+        self.runs = []
+        self.executor = executor.CommandExecutor(2, 0.1)
+        
+        def submit(key, function, args, on_error):
+            return self.executor.submit(key, function, args, on_error = on_error)
+        
+        self.scheduler = scheduler.Scheduler(lambda delay, function, args = (): self.timers.append((function, args)),
+                                             submit, self.runs.append)
+        self.scheduler.load({'sample': {'every': '1m'}}, ['srv'])
+        self.task = self.scheduler.tasks[0]
+    
+    def fire(self):
+        function, args = self.timers.pop(0)
+        function(*args)
+        self.executor.ready.join()
+    
+    def test_runs_and_records(self):
+        self.fire()
+        self.assertEqual(self.runs, [self.task])
+        self.assertEqual((self.task.running, self.task.runs, self.task.failures), (0, 1, 0))
+    
+    def test_job_expired_in_queue_frees_the_task(self):
+        # Hold the server's key past the job's deadline
+        release = threading.Event()
+        self.executor.submit('srv', release.wait, (1,))
+        function, args = self.timers.pop(0)
+        function(*args)
+        time.sleep(0.2)
+        release.set()
+        self.executor.ready.join()
+        
+        self.assertEqual(self.runs, [])
+        self.assertEqual((self.task.running, self.task.runs, self.task.failures), (0, 1, 1))
+        
+        self.fire()
+        self.assertEqual(self.runs, [self.task])
+        self.assertEqual(self.task.skipped, 0)
+    
+    def test_generation_silences_old_timers(self):
+        function, args = self.timers.pop(0)
+        self.scheduler.load({}, ['srv'])
+        function(*args)
+        self.executor.ready.join()
+        self.assertEqual(self.runs, [])
+
+if __name__ == '__main__':
+    unittest.main()
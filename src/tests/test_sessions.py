@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import time
+import unittest
+
+import lameirc.sessions as sessions
+
+ALICE = 'alice!a@host.example'
+BOB = 'bob!b@other.example'
+
+class SessionStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.timers = []
+        self.store = sessions.SessionStore(lambda delay, function, args = (): self.timers.append((delay, function, args)),
+                                           idle = 0.1, lifetime = 0.25)
+    
+    def run_timers(self):
+        timers, self.timers = self.timers, []
+        for delay, function, args in timers:
+            function(*args)
+    
+    def test_login_and_indexes(self):
+        self.store.login(ALICE, 'admin')
+        self.store.login(BOB, 'admin')
+        self.assertTrue(ALICE in self.store)
+        self.assertEqual(self.store.get(ALICE)['account'], 'admin')
+        self.assertEqual(len(self.store), 2)
+        
+        self.assertTrue(self.store.logout_nick('ALICE'))
+        self.assertFalse(ALICE in self.store)
+        self.assertEqual(self.store.logout_account('admin'), [BOB])
+        self.assertEqual(len(self.store), 0)
+    
+    def test_rename_keeps_the_session(self):
+        self.store.login(ALICE, 'admin')
+        self.store.rename(ALICE, 'alicia!a@host.example')
+        self.assertFalse(ALICE in self.store)
+        self.assertTrue('alicia!a@host.example' in self.store)
+        self.assertTrue(self.store.logout_nick('alicia'))
+    
+    def test_idle_expiry(self):
+        self.store.login(ALICE, 'admin')
+        time.sleep(0.05)
+        self.store.get(ALICE, touch = True)
+        time.sleep(0.07)
+        # Touched in between, so still alive; the timer reschedules itself
+        self.assertTrue(ALICE in self.store)
+        self.run_timers()
+        self.assertTrue(ALICE in self.store)
+        self.assertEqual(len(self.timers), 1)
+        
+        time.sleep(0.11)
+        self.assertFalse(ALICE in self.store)
+        self.run_timers()
+        self.assertEqual(len(self.store), 0)
+    
+    def test_lifetime_caps_activity(self):
+        self.store.login(ALICE, 'admin')
+        for i in range(6):
+            time.sleep(0.05)
+            self.store.get(ALICE, touch = True)
+        self.assertFalse(ALICE in self.store)
+    
+    def test_stale_timer_does_not_end_a_new_session(self):
+        self.store.login(ALICE, 'admin')
+        time.sleep(0.12)
+        self.store.login(ALICE, 'admin')
+        self.timers[0][1](*self.timers[0][2])
+        self.assertTrue(ALICE in self.store)
+
+if __name__ == '__main__':
+    unittest.main()
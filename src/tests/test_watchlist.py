@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 Johannes Bendler
+# Licensed under the MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the "Software"), 
+# to deal in the Software without restriction, including without limitation 
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+# and/or sell copies of the Software, and to permit persons to whom the 
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included 
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import lameirc.watchlist as watchlist
+
+class SteamIDTest(unittest.TestCase):
+    def test_notations(self):
+        for steamid in ('STEAM_0:1:1', 'STEAM_1:1:1', '[U:1:3]', '76561197960265731'):
+            self.assertEqual(watchlist.steamid_key(steamid), 76561197960265731)
+        self.assertEqual(watchlist.steamid_key('BOT'), None)
+
+class WatchlistTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'watchlist.txt')
+        self.watches = watchlist.Watchlist(self.path)
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def test_add_and_remove(self):
+        self.assertTrue(self.watches.add('STEAM_0:1:1', 'a'))
+        self.assertFalse(self.watches.add('[U:1:3]', 'a'))
+        self.assertTrue(self.watches.contains('76561197960265731'))
+        self.assertEqual(self.watches.on('a'), frozenset([76561197960265731]))
+        self.assertTrue(self.watches.remove('STEAM_0:1:1'))
+        self.assertFalse(self.watches.contains('STEAM_0:1:1'))
+        self.assertFalse(self.watches.remove('STEAM_0:1:1'))
+    
+    def test_remove_from_another_server_removes_nothing(self):
+        self.watches.add('STEAM_0:1:1', 'a')
+        self.assertFalse(self.watches.remove('STEAM_0:1:1', 'b'))
+        self.assertTrue(self.watches.contains('STEAM_0:1:1'))
+        self.assertTrue(self.watches.remove('STEAM_0:1:1', 'a'))
+    
+    def test_survives_a_restart(self):
+        self.watches.add('STEAM_0:1:1', 'a')
+        self.watches.add('STEAM_0:0:2', 'b')
+        self.watches.remove('STEAM_0:0:2')
+        self.watches.journal.close()
+        
+        reloaded = watchlist.Watchlist(self.path)
+        self.assertEqual(len(reloaded), 1)
+        self.assertTrue(reloaded.contains('STEAM_0:1:1'))
+        # Compacted to the live entries
+        with open(self.path) as journal:
+            self.assertEqual(journal.read(), '+ 76561197960265731 a\n')
+
+class AlertsTest(unittest.TestCase):
+    def setUp(self):
+        self.timers = []
+        self.posted = []
+        self.alerts = watchlist.Alerts(lambda delay, function, args = (): self.timers.append((delay, function, args)),
+                                       lambda *alert: self.posted.append(alert), debounce = 5, interval = 60)
+    
+    def flush(self):
+        delay, function, args = self.timers.pop(0)
+        function(*args)
+        return delay
+    
+    def test_events_in_one_window_make_one_alert(self):
+        self.alerts.add(1, 'a', 'Bob', 'connected')
+        self.alerts.add(1, 'a', 'Bob', 'joined CT')
+        self.alerts.add(1, 'a', 'Bob', 'joined CT')
+        self.alerts.add(1, 'b', 'Robert', 'connected')
+        self.assertEqual(len(self.timers), 1)
+        self.assertEqual(self.flush(), 5)
+        self.assertEqual(self.posted, [(1, 'a', 'Robert', ['connected', 'joined CT', 'connected on b'])])
+    
+    def test_next_alert_waits_for_the_interval(self):
+        self.alerts.add(1, 'a', 'Bob', 'connected')
+        self.flush()
+        self.alerts.add(1, 'a', 'Bob', 'disconnected (quit)')
+        self.assertTrue(self.timers[0][0] > 55)
+
+if __name__ == '__main__':
+    unittest.main()